@@ -13,6 +13,14 @@ from flask_sqlalchemy import SQLAlchemy
 from flask_login import LoginManager
 from flask_pagedown import PageDown
 
+from .rendering import Renderer
+from .last_seen import LastSeenBuffer
+from .transactions import TeardownCommit
+from .metrics import Metrics
+from .query_stats import QueryStats
+from .page_cache import PageCache
+from .fragments import FragmentCache
+from .graph import FollowGraph
 
 from config import config
 
@@ -24,6 +32,14 @@ mail = Mail()
 moment = Moment()
 db = SQLAlchemy()
 pagedown = PageDown()       # markdown支持
+renderer = Renderer()       # 文章/评论 markdown渲染及缓存
+last_seen = LastSeenBuffer()    # 最后访问时间合并写入
+teardown_commit = TeardownCommit()  # 请求结束时按需提交
+request_metrics = Metrics()     # 按端点统计请求指标
+query_stats = QueryStats()      # SQL语句抽样统计
+page_cache = PageCache()        # 匿名整页缓存
+fragment_cache = FragmentCache()    # 文章/评论列表项片段缓存
+follow_graph = FollowGraph()    # 关注关系图快照, 推荐关注
 
 login_manager = LoginManager()
 login_manager.session_protection = 'strong'
@@ -41,8 +57,40 @@ def create_app(config_name):
     mail.init_app(app)
     moment.init_app(app)
     db.init_app(app)
+    # 须在db之后, 先于Flask-SQLAlchemy的teardown执行
+    teardown_commit.init_app(app)
     login_manager.init_app(app)
     pagedown.init_app(app)
+    renderer.init_app(app)
+    last_seen.init_app(app)
+    query_stats.init_app(app)
+    page_cache.init_app(app)
+    fragment_cache.init_app(app)
+    follow_graph.init_app(app)
+    request_metrics.init_app(app)
+    request_metrics.counter(
+        'flasky_teardown_commits_total', 'Commits issued at teardown.',
+        lambda: teardown_commit.commits)
+    request_metrics.counter(
+        'flasky_teardown_commits_skipped_total',
+        'Read-only requests that skipped the teardown commit.',
+        lambda: teardown_commit.skipped)
+    request_metrics.counter(
+        'flasky_render_cache_hits_total', 'Markdown render cache hits.',
+        lambda: renderer.hits)
+    request_metrics.counter(
+        'flasky_render_cache_misses_total', 'Markdown render cache misses.',
+        lambda: renderer.misses)
+    request_metrics.counter(
+        'flasky_fragment_cache_hits_total', 'Template fragment cache hits.',
+        lambda: fragment_cache.hits)
+    request_metrics.counter(
+        'flasky_fragment_cache_misses_total',
+        'Template fragment cache misses.', lambda: fragment_cache.misses)
+    request_metrics.counter(
+        'flasky_follow_graph_rebuilds_total',
+        'Follow graph snapshots rebuilt in the background.',
+        lambda: follow_graph.rebuilds)
 
     # 生产环境启动https
     if not app.debug and not app.testing and not app.config['SSL_DISABLE']:
@@ -10,4 +10,5 @@ from flask import Blueprint
 api = Blueprint('api', __name__)
 
 # noinspection PyUnresolvedReferences
-from . import authentication, posts, users, comments, errors
+from . import authentication, posts, users, comments, errors, conditional, \
+    export, search
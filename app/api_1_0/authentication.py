@@ -5,7 +5,7 @@
 # @Link     : http://github.com/bluethon
 
 
-from flask import g, jsonify
+from flask import g, jsonify, request
 from flask_httpauth import HTTPBasicAuth
 
 from ..models import User, AnonymousUser
@@ -26,17 +26,19 @@ def verify_password(email_or_token, password):
         return True
     # 密码为空, 假定令牌认证
     if password == '':
-        g.current_user = User.verify_auth_token(email_or_token)
+        # 缓存的用户快照, 热点客户端不必每次验签查库
+        g.current_user = User.verify_auth_token_cached(email_or_token)
         # 为了方视图函数能区分是令牌认证还是普通邮件验证
         g.token_used = True
         return g.current_user is not None
-    user = User.query.filter_by(email=email_or_token).first()
-    if not user:
+    # 缓存验证通过的凭据, 不必每次查库和计算密码散列
+    user = User.verify_credentials_cached(email_or_token, password)
+    if user is None:
         return False
     # 此验证回调函数把通过认证的用户保存在全局对象g中来允许访问视图函数
     g.current_user = user
     g.token_used = False
-    return user.verify_password(password)
+    return True
 
 
 @auth.error_handler
@@ -54,6 +56,18 @@ def before_request():
         return forbidden('Unconfirmed account')
 
 
+@api.after_request
+def issue_token(response):
+    """ 密码认证的客户端带X-Request-Token首部时, 响应中附带令牌 """
+    # 客户端之后可改用令牌认证, 走令牌缓存
+    if request.headers.get('X-Request-Token') and \
+            g.get('token_used') is False:
+        response.headers['X-Auth-Token'] = \
+            g.current_user.generate_auth_token(expiration=3600)
+        response.headers['X-Auth-Token-Expiration'] = '3600'
+    return response
+
+
 @api.route('/token')
 def get_token():
     """ API 生成JSON格式认证令牌 """
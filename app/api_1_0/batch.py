@@ -0,0 +1,58 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# @Date     : 2026-10-18 20:50
+# @Author   : Bluethon (j5088794@gmail.com)
+# @Link     : http://github.com/bluethon
+
+"""
+API 批量创建
+
+请求体为JSON数组, 每项格式同单个创建; 有效项在一个事务中批量插入,
+响应按请求顺序给出每项结果:
+    {"results": [{"status": 201, "location": "..."},
+                 {"status": 400, "error": "bad request", "message": "..."}]}
+全部成功201, 部分成功207, 全部无效400
+"""
+from flask import jsonify, current_app
+
+from .. import db
+from ..exceptions import ValidationError
+from .serializers import url_templates
+
+
+def batch_create(items, kind, insert, endpoint):
+    """
+    items    请求中的数组
+    kind     'post'/'comment', 用于错误信息
+    insert   insert(bodies) 插入有效项, 返回新id列表
+    endpoint 新资源的端点, 生成location
+    """
+    if not isinstance(items, list) or not items:
+        raise ValidationError('batch must be a non-empty array')
+    limit = current_app.config['FLASKY_API_MAX_BATCH']
+    if len(items) > limit:
+        raise ValidationError('batch has more than %d items' % limit)
+    results = [None] * len(items)
+    positions, bodies = [], []
+    for i, item in enumerate(items):
+        body = item.get('body') if isinstance(item, dict) else None
+        if body is None or body == '':
+            results[i] = {'status': 400, 'error': 'bad request',
+                          'message': '%s does not have a body' % kind}
+        elif not isinstance(body, str):
+            results[i] = {'status': 400, 'error': 'bad request',
+                          'message': '%s body must be a string' % kind}
+        else:
+            positions.append(i)
+            bodies.append(body)
+    if bodies:
+        ids = insert(bodies)
+        db.session.commit()
+        template = url_templates()[endpoint]
+        for i, id in zip(positions, ids):
+            results[i] = {'status': 201, 'location': template % id}
+    if len(bodies) == len(items):
+        status = 201
+    else:
+        status = 207 if bodies else 400
+    return jsonify({'results': results}), status
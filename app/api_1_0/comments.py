@@ -10,54 +10,63 @@ from .. import db
 from ..models import Post, Permission, Comment
 from . import api
 from .decorators import permission_required
+from .conditional import not_modified
+from .serializers import COMMENT_COLUMNS, comments_json
+from .batch import batch_create
+from ..pagination import paginate, pagination_urls, cached_count, \
+    CursorPagination
 
 
 @api.route('/comments/')
 def get_comments():
-    page = request.args.get('page', 1, type=int)
-    pagination = Comment.query.order_by(Comment.timestamp.desc()).paginate(
-        page, per_page=current_app.config['FLASKY_COMMENTS_PER_PAGE'],
-        error_out=False)
+    pagination = paginate(
+        Comment.query.with_entities(*COMMENT_COLUMNS),
+        [Comment.timestamp, Comment.id],
+        per_page=current_app.config['FLASKY_COMMENTS_PER_PAGE'],
+        error_out=True)
     comments = pagination.items
-    prev = None
-    if pagination.has_prev:
-        prev = url_for('api.get_comments', page=page - 1, _external=True)
-    next = None
-    if pagination.has_next:
-        next = url_for('api.get_comments', page=page + 1, _external=True)
+    prev, next = pagination_urls(pagination, 'api.get_comments')
+    if isinstance(pagination, CursorPagination):
+        count = cached_count('comments', Comment.query)
+    else:
+        count = pagination.total
+    response = not_modified(comments, prev, next, count, last_modified=False)
+    if response is not None:
+        return response
     return jsonify({
-        'comments': [comment.to_json() for comment in comments],
+        'comments': comments_json(comments),
         'prev': prev,
         'next': next,
-        'count': pagination.total
+        'count': count
     })
 
 
 @api.route('/comments/<int:id>')
 def get_comment(id):
     comment = Comment.query.get_or_404(id)
-    return jsonify(comment.to_json())
+    return not_modified([comment]) or jsonify(comment.to_json())
 
 
 @api.route('/posts/<int:id>/comments/')
 def get_post_comments(id):
     post = Post.query.get_or_404(id)
-    page = request.args.get('page', 1, type=int)
-    pagination = post.comments.order_by(Comment.timestamp.desc()).paginate(
-        page, per_page=current_app.config['FLASKY_COMMENTS_PER_PAGE'],
-        error_out=False)
+    pagination = paginate(
+        post.comments.with_entities(*COMMENT_COLUMNS),
+        [Comment.timestamp, Comment.id],
+        per_page=current_app.config['FLASKY_COMMENTS_PER_PAGE'],
+        error_out=True)
     comments = pagination.items
-    prev = None
-    if pagination.has_prev:
-        prev = url_for('api.get_comments', page=page - 1, _external=True)
-    next = None
-    if pagination.has_next:
-        next = url_for('api.get_comments', page=page + 1, _external=True)
+    prev, next = pagination_urls(pagination, 'api.get_post_comments', id=id)
+    response = not_modified(comments, prev, next, post.comment_count,
+                            last_modified=False)
+    if response is not None:
+        return response
     return jsonify({
-        'comments': [comment.to_json() for comment in comments],
+        'comments': comments_json(comments),
         'prev': prev,
         'next': next,
-        'count': pagination.total
+        # 冗余计数, 无需COUNT查询
+        'count': post.comment_count
     })
 
 
@@ -66,9 +75,22 @@ def get_post_comments(id):
 def new_post_comment(id):
     post = Post.query.get_or_404(id)
     comment = Comment.from_json(request.json)
-    comment.author = g.current_user
+    # 令牌认证时g.current_user是UserSnapshot, 只设外键
+    comment.author_id = g.current_user.id
     comment.post = post
     db.session.add(comment)
     db.session.commit()
     return jsonify(comment.to_json()), 201, {'Location': url_for(
         'api.get_comment', id=comment.id, _external=True)}
+
+
+@api.route('/posts/<int:id>/comments/batch', methods=['POST'])
+@permission_required(Permission.COMMENT)
+def new_post_comments_batch(id):
+    """ API 批量新建评论 POST, 请求体为评论数组 """
+    post = Post.query.get_or_404(id)
+    author_id = g.current_user.id
+    return batch_create(
+        request.json, 'comment',
+        lambda bodies: Comment.insert_many(post.id, author_id, bodies),
+        'api.get_comment')
@@ -0,0 +1,71 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# @Date     : 2026-10-18 18:50
+# @Author   : Bluethon (j5088794@gmail.com)
+# @Link     : http://github.com/bluethon
+
+"""
+API 条件GET
+
+由行的表名, id和updated_at计算强ETag, 客户端带If-None-Match/If-Modified-Since
+且内容未变时直接返回304, 省去to_json和传输响应体
+"""
+import hashlib
+
+from flask import current_app, g, request
+
+from . import api
+
+
+def _validators(rows, extra):
+    """ 返回 (ETag, 最后修改时间) """
+    h = hashlib.sha1()
+    for row in rows:
+        # 也可以是只含所需列的结果行
+        h.update(('%s:%s:%s;' % (getattr(row, '__tablename__', ''), row.id,
+                                 row.updated_at)).encode('utf-8'))
+    for value in extra:
+        h.update(('%s;' % (value,)).encode('utf-8'))
+    times = [row.updated_at for row in rows if row.updated_at is not None]
+    return h.hexdigest(), max(times) if times else None
+
+
+def not_modified(rows, *extra, last_modified=True):
+    """
+    记录本次响应的ETag, 客户端缓存仍有效时返回304响应, 否则返回None
+    rows          响应包含的模型对象或结果行, 需有id和updated_at
+    extra         影响响应内容的其他值, 如总数, 翻页游标
+    last_modified 集合中删除行不会使最后修改时间变大, 集合只用ETag
+    """
+    etag, modified = _validators(rows, extra)
+    g.etag = etag
+    g.last_modified = modified if last_modified else None
+    if request.if_none_match:
+        # If-None-Match优先, 此时忽略If-Modified-Since
+        fresh = request.if_none_match.contains_weak(etag)
+    else:
+        since = request.if_modified_since
+        fresh = since is not None and g.last_modified is not None and \
+            g.last_modified.replace(microsecond=0) <= \
+            since.replace(tzinfo=None)
+    if not fresh:
+        return None
+    response = current_app.response_class(status=304)
+    _set_validators(response)
+    return response
+
+
+def _set_validators(response):
+    response.set_etag(g.etag)
+    if g.get('last_modified') is not None:
+        response.last_modified = g.last_modified
+
+
+@api.after_request
+def add_validators(response):
+    """ 200响应附上ETag/Last-Modified """
+    if response.status_code == 200 and g.get('etag') is not None:
+        _set_validators(response)
+    g.pop('etag', None)
+    g.pop('last_modified', None)
+    return response
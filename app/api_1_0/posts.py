@@ -9,29 +9,37 @@ from flask import jsonify, request, g, url_for, current_app
 from . import api
 from .decorators import permission_required
 from .errors import forbidden
+from .conditional import not_modified
+from .serializers import POST_COLUMNS, posts_json
+from .batch import batch_create
 from .. import db
 from ..models import Post, Permission
+from ..pagination import paginate, pagination_urls, cached_count, \
+    CursorPagination
 
 
 @api.route('/posts/')
 def get_posts():
     """ API 全部文章 GET """
-    page = request.args.get('page', 1, type=int)
-    pagination = Post.query.paginate(
-        page, per_page=current_app.config['FLASKY_POSTS_PER_PAGE'],
-        error_out=False)
+    # 默认游标分页, 带page参数时按页数分页
+    # 只查询输出需要的列, 不构造ORM对象
+    pagination = paginate(
+        Post.query.with_entities(*POST_COLUMNS), [Post.timestamp, Post.id],
+        per_page=current_app.config['FLASKY_POSTS_PER_PAGE'], error_out=True)
     posts = pagination.items
-    prev = None
-    if pagination.has_prev:
-        prev = url_for('api.get_posts', page=page - 1, _external=True)
-    next = None
-    if pagination.has_next:
-        next = url_for('api.get_posts', page=page + 1, _external=True)
+    prev, next = pagination_urls(pagination, 'api.get_posts')
+    if isinstance(pagination, CursorPagination):
+        count = cached_count('posts', Post.query)
+    else:
+        count = pagination.total
+    response = not_modified(posts, prev, next, count, last_modified=False)
+    if response is not None:
+        return response
     return jsonify({
-        'posts': [post.to_json() for post in posts],
+        'posts': posts_json(posts),
         'prev': prev,
         'next': next,
-        'count': pagination.total
+        'count': count
     })
 
 
@@ -39,7 +47,7 @@ def get_posts():
 def get_post(id):
     """ API 单个文章 GET """
     post = Post.query.get_or_404(id)
-    return jsonify(post.to_json())
+    return not_modified([post]) or jsonify(post.to_json())
 
 
 @api.route('/posts/', methods=['POST'])
@@ -47,12 +55,23 @@ def get_post(id):
 def new_post():
     """ API 修改文章 POST """
     post = Post.from_json(request.json)
-    post.author = g.current_user
+    # 令牌认证时g.current_user是UserSnapshot, 只设外键
+    post.author_id = g.current_user.id
     db.session.add(post)
     db.session.commit()
     return jsonify(post.to_json()), 201, {'Location': url_for('api.get_post', id=post.id, _external=True)}
 
 
+@api.route('/posts/batch', methods=['POST'])
+@permission_required(Permission.WRITE_ARTICLES)
+def new_posts_batch():
+    """ API 批量新建文章 POST, 请求体为文章数组 """
+    author_id = g.current_user.id
+    return batch_create(request.json, 'post',
+                        lambda bodies: Post.insert_many(author_id, bodies),
+                        'api.get_post')
+
+
 @api.route('/posts/<int:id>', methods=['PUT'])
 @permission_required(Permission.WRITE_ARTICLES)
 def edit_post(id):
@@ -0,0 +1,49 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# @Date     : 2026-10-18 22:40
+# @Author   : Bluethon (j5088794@gmail.com)
+# @Link     : http://github.com/bluethon
+
+from flask import jsonify, request, current_app
+
+from . import api
+from .serializers import POST_COLUMNS, COMMENT_COLUMNS, posts_json, \
+    comments_json
+from ..exceptions import ValidationError
+from ..models import Post, Comment
+from ..pagination import pagination_urls
+from ..search import KINDS, paginate_hits, ordered
+
+
+RESULTS = {
+    'posts': (Post, POST_COLUMNS, posts_json, 'FLASKY_POSTS_PER_PAGE'),
+    'comments': (Comment, COMMENT_COLUMNS, comments_json,
+                 'FLASKY_COMMENTS_PER_PAGE'),
+}
+
+
+@api.route('/search/')
+def get_search():
+    """ API 全文搜索 GET ?q=关键词&kind=posts|comments, 按相关度排序 """
+    q = request.args.get('q', '')
+    kind = request.args.get('kind', 'posts')
+    if kind not in KINDS:
+        raise ValidationError('kind must be one of %s' % ', '.join(KINDS))
+    model, columns, to_json, per_page = RESULTS[kind]
+    pagination = paginate_hits(kind, q, current_app.config[per_page],
+                               error_out=True)
+    if pagination is None:
+        raise ValidationError('search query has no terms')
+    scores = dict((row.doc_id, row.score) for row in pagination.items)
+    rows = ordered(model.query.with_entities(*columns), model,
+                   [row.doc_id for row in pagination.items])
+    items = to_json(rows)
+    for item, row in zip(items, rows):
+        item['score'] = scores[row.id]
+    prev, next = pagination_urls(pagination, 'api.get_search', q=q,
+                                 kind=kind)
+    return jsonify({
+        kind: items,
+        'prev': prev,
+        'next': next
+    })
@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# @Date     : 2026-10-18 20:10
+# @Author   : Bluethon (j5088794@gmail.com)
+# @Link     : http://github.com/bluethon
+
+"""
+API 集合的快速序列化
+
+输出与模型的to_json相同, 但:
+1. 完整URL按 app + 主机名 只用url_for生成一次模板, 之后直接填入id;
+   主机名来自请求首部, 模板缓存限制条数(URL_TEMPLATES_SIZE)
+2. 只查询需要的列(*_COLUMNS), 直接由结果元组生成字典, 不构造ORM对象
+3. 时间提前格式化, jsonify只处理基本类型
+"""
+from flask import current_app, request, has_request_context, url_for
+from werkzeug.http import http_date
+
+from ..cache import TTLCache
+from ..models import Post, Comment, User
+
+
+POST_COLUMNS = (Post.id, Post.body, Post.body_html, Post.timestamp,
+                Post.author_id, Post.comment_count, Post.updated_at)
+COMMENT_COLUMNS = (Comment.id, Comment.post_id, Comment.body,
+                   Comment.body_html, Comment.timestamp, Comment.author_id,
+                   Comment.updated_at)
+USER_COLUMNS = (User.id, User.username, User.member_since, User.last_seen,
+                User.post_count, User.updated_at)
+
+ENDPOINTS = ('api.get_post', 'api.get_post_comments', 'api.get_comment',
+             'api.get_user', 'api.get_user_posts',
+             'api.get_user_followed_posts')
+# 生成模板时代入的id, 再替换成%d
+_SENTINEL = '2147483647'
+# 每个app缓存的主机名数和秒数, Host首部由客户端决定, 不能无限增长
+URL_TEMPLATES_SIZE = 32
+URL_TEMPLATES_TIMEOUT = 3600
+
+
+def _template(endpoint):
+    url = url_for(endpoint, id=int(_SENTINEL), _external=True)
+    if url.count(_SENTINEL) != 1:
+        raise ValueError('cannot build URL template for %s' % endpoint)
+    return url.replace('%', '%%').replace(_SENTINEL, '%d')
+
+
+def url_templates():
+    """ 当前app和主机名下各端点的URL模板 {端点: '.../posts/%d'} """
+    templates = current_app.extensions.get('api_url_templates')
+    if templates is None:
+        templates = current_app.extensions.setdefault(
+            'api_url_templates', TTLCache(URL_TEMPLATES_SIZE))
+    host = request.host_url if has_request_context() else None
+    urls = templates.get(host)
+    if urls is None:
+        urls = dict((endpoint, _template(endpoint)) for endpoint in ENDPOINTS)
+        templates.set(host, urls, URL_TEMPLATES_TIMEOUT)
+    return urls
+
+
+def _date(value):
+    # 与Flask的JSONEncoder一致
+    return http_date(value) if value is not None else None
+
+
+def posts_json(rows):
+    """ 由POST_COLUMNS的结果行(或Post对象)生成字典列表 """
+    urls = url_templates()
+    post_url, user_url = urls['api.get_post'], urls['api.get_user']
+    comments_url = urls['api.get_post_comments']
+    return [{
+        'url': post_url % row.id,
+        'body': row.body,
+        'body_html': row.body_html,
+        'timestamp': _date(row.timestamp),
+        'author': user_url % row.author_id,
+        'comments': comments_url % row.id,
+        'comment_count': row.comment_count,
+    } for row in rows]
+
+
+def comments_json(rows):
+    """ 由COMMENT_COLUMNS的结果行(或Comment对象)生成字典列表 """
+    urls = url_templates()
+    comment_url, post_url = urls['api.get_comment'], urls['api.get_post']
+    user_url = urls['api.get_user']
+    return [{
+        'url': comment_url % row.id,
+        'post': post_url % row.post_id,
+        'body': row.body,
+        'body_html': row.body_html,
+        'timestamp': _date(row.timestamp),
+        'author': user_url % row.author_id,
+    } for row in rows]
+
+
+def users_json(rows):
+    """ 由USER_COLUMNS的结果行(或User对象)生成字典列表 """
+    urls = url_templates()
+    user_url, posts_url = urls['api.get_user'], urls['api.get_user_posts']
+    timeline_url = urls['api.get_user_followed_posts']
+    return [{
+        'url': user_url % row.id,
+        'username': row.username,
+        'member_since': _date(row.member_since),
+        'last_seen': _date(row.last_seen),
+        'post': posts_url % row.id,
+        'followed_posts': timeline_url % row.id,
+        'post_count': row.post_count,
+    } for row in rows]
@@ -4,10 +4,16 @@
 # @Author   : Bluethon (j5088794@gmail.com)
 # @Link     : http://github.com/bluethon
 
-from flask import jsonify, request, current_app, url_for
+from flask import jsonify, current_app, request
+from werkzeug.http import http_date
 
 from . import api
-from ..models import User, Post
+from .conditional import not_modified
+from .serializers import POST_COLUMNS, USER_COLUMNS, posts_json, users_json
+from .. import follow_graph
+from ..models import User, Post, TimelineEntry
+from ..pagination import paginate, pagination_urls, cached_count, \
+    CursorPagination
 
 
 # 单个 URL末尾不带斜线
@@ -15,7 +21,7 @@ from ..models import User, Post
 def get_user(id):
     """ API 获取用户 GET """
     user = User.query.get_or_404(id)
-    return jsonify(user.to_json())
+    return not_modified([user]) or jsonify(user.to_json())
 
 
 # 多个 URL末尾带斜线
@@ -23,22 +29,20 @@ def get_user(id):
 def get_user_posts(id):
     """ API 获取用户文章集合 GET """
     user = User.query.get_or_404(id)
-    page = request.args.get('page', 1, type=int)
-    pagination = user.posts.order_by(Post.timestamp.desc()).paginate(
-        page, per_page=current_app.config['FLASKY_POSTS_PER_PAGE'],
-        error_out=False)
+    pagination = paginate(
+        user.posts.with_entities(*POST_COLUMNS), [Post.timestamp, Post.id],
+        per_page=current_app.config['FLASKY_POSTS_PER_PAGE'], error_out=True)
     posts = pagination.items
-    prev = None
-    if pagination.has_prev:
-        prev = url_for('api.get_user_posts', page=page - 1, _external=True)
-    next = None
-    if pagination.has_next:
-        next = url_for('api.get_user_posts', page=page + 1, _external=True)
+    prev, next = pagination_urls(pagination, 'api.get_user_posts', id=id)
+    response = not_modified(posts, prev, next, user.post_count,
+                            last_modified=False)
+    if response is not None:
+        return response
     return jsonify({
-        'posts': [post.to_json() for post in posts],
+        'posts': posts_json(posts),
         'prev': prev,
         'next': next,
-        'count': pagination.total,
+        'count': user.post_count,
     })
 
 
@@ -46,22 +50,56 @@ def get_user_posts(id):
 def get_user_followed_posts(id):
     """ API 获取用户关注的人的文章 GET """
     user = User.query.get_or_404(id)
-    page = request.args.get('page', 1, type=int)
-    pagination = user.followed_posts.order_by(Post.timestamp.desc()).paginate(
-        page, per_page=current_app.config['FLASKY_POSTS_PER_PAGE'],
-        error_out=False)
+    pagination = paginate(
+        user.timeline.with_entities(*POST_COLUMNS),
+        [TimelineEntry.timestamp, TimelineEntry.post_id],
+        per_page=current_app.config['FLASKY_POSTS_PER_PAGE'],
+        key=lambda post: (post.timestamp, post.id), error_out=True)
     posts = pagination.items
-    prev = None
-    if pagination.has_prev:
-        prev = url_for('api.get_user_followed_posts', page=page - 1,
-                       _external=True)
-    next = None
-    if pagination.has_next:
-        next = url_for('api.get_user_followed_posts', page=page + 1,
-                       _external=True)
+    prev, next = pagination_urls(pagination, 'api.get_user_followed_posts',
+                                 id=id)
+    if isinstance(pagination, CursorPagination):
+        count = cached_count('timeline:%d' % id, user.timeline)
+    else:
+        count = pagination.total
+    response = not_modified(posts, prev, next, count, last_modified=False)
+    if response is not None:
+        return response
     return jsonify({
-        'posts': [post.to_json() for post in posts],
+        'posts': posts_json(posts),
         'prev': prev,
         'next': next,
-        'count': pagination.total,
+        'count': count,
+    })
+
+
+@api.route('/users/<int:id>/suggestions/')
+def get_user_suggestions(id):
+    """ API 推荐关注 GET, 按共同关注数排序, 来自关注关系图快照 """
+    user = User.query.get_or_404(id)
+    limit = min(request.args.get('limit', type=int) or
+                current_app.config['FLASKY_SUGGESTIONS_LIMIT'], 100)
+    snapshot = follow_graph.snapshot()
+    suggestions = []
+    if snapshot is not None:
+        # 快照之后的关注以实时的关注集合为准
+        suggestions = snapshot.suggestions(
+            id, limit, exclude=user.followed_ids(),
+            max_following=current_app.config[
+                'FLASKY_SUGGESTIONS_MAX_FOLLOWING'],
+            max_neighbors=current_app.config[
+                'FLASKY_SUGGESTIONS_MAX_NEIGHBORS'])
+    rows = {}
+    if suggestions:
+        rows = dict((row.id, row) for row in User.query.with_entities(
+            *USER_COLUMNS).filter(User.id.in_([s[0] for s in suggestions])))
+    # 快照之后删除的用户跳过
+    suggestions = [s for s in suggestions if s[0] in rows]
+    items = users_json([rows[s[0]] for s in suggestions])
+    for item, (_, mutual) in zip(items, suggestions):
+        item['mutual_follows'] = mutual
+    return jsonify({
+        'users': items,
+        'snapshot': http_date(snapshot.built_at)
+        if snapshot is not None else None,
     })
@@ -0,0 +1,55 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# @Date     : 2026-10-18 15:40
+# @Author   : Bluethon (j5088794@gmail.com)
+# @Link     : http://github.com/bluethon
+
+"""
+进程内缓存
+
+每个进程(gunicorn worker)各自一份, 跨进程的失效只能依赖过期时间
+"""
+import time
+from collections import OrderedDict
+from threading import Lock
+
+
+class TTLCache(object):
+    """ 带过期时间的LRU缓存, 线程安全 """
+
+    def __init__(self, maxsize=10000):
+        self.maxsize = maxsize
+        self._data = OrderedDict()
+        self._lock = Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return default
+            if item[0] <= time.time():
+                del self._data[key]
+                return default
+            self._data.move_to_end(key)
+            return item[1]
+
+    def set(self, key, value, timeout):
+        """ 缓存timeout秒, timeout不大于0时不缓存 """
+        if timeout <= 0:
+            return
+        with self._lock:
+            self._data[key] = (time.time() + timeout, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
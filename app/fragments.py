@@ -0,0 +1,64 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# @Date     : 2026-10-18 19:50
+# @Author   : Bluethon (j5088794@gmail.com)
+# @Link     : http://github.com/bluethon
+
+"""
+模板片段缓存
+
+文章/评论列表中每一项的HTML对所有人相同, 只有编辑/管理按钮因人而异.
+模板中用call块缓存每一项, 键包含id, 版本(updated_at)和片段中显示的作者字段,
+内容或显示的作者资料修改后键随之变化; 作者的updated_at随最后访问时间和计数变化, 不用作键.
+头像地址随请求是否https而不同, 键自动加上请求的协议.
+因人而异的部分先在片段中留出fragment_slot, 取出缓存后再填入:
+
+    {% call cache_fragment('post', post.id, post.updated_at,
+                           post.author.username, post.author.avatar_hash,
+                           slot=controls(post)) %}
+        ... {{ fragment_slot }} ...
+    {% endcall %}
+"""
+from flask import has_request_context, request
+from markupsafe import Markup
+
+from .cache import TTLCache
+
+
+SLOT = '<!--fragment-slot-->'
+
+
+class FragmentCache(object):
+    """ 用法同其他扩展, create_app中init_app """
+
+    def __init__(self, app=None):
+        self.hits = 0
+        self.misses = 0
+        self._cache = TTLCache(1000)
+        self.timeout = 3600
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self._cache = TTLCache(app.config['FLASKY_FRAGMENT_CACHE_SIZE'])
+        self.timeout = app.config['FLASKY_FRAGMENT_CACHE_TIMEOUT']
+        app.add_template_global(self.cache_fragment, 'cache_fragment')
+        app.add_template_global(Markup(SLOT), 'fragment_slot')
+
+    def cache_fragment(self, *key, slot='', caller=None):
+        """ 模板中以call块调用, caller渲染块内容 """
+        scheme = 'https' if has_request_context() and request.is_secure \
+            else 'http'
+        key = ':'.join(str(part) for part in (scheme,) + key)
+        html = self._cache.get(key)
+        if html is None:
+            self.misses += 1
+            html = str(caller())
+            self._cache.set(key, html, self.timeout)
+        else:
+            self.hits += 1
+        return Markup(html.replace(SLOT, str(slot)))
+
+    def clear(self):
+        self._cache.clear()
+        self.hits = self.misses = 0
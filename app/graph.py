@@ -0,0 +1,209 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# @Date     : 2026-10-18 23:10
+# @Author   : Bluethon (j5088794@gmail.com)
+# @Link     : http://github.com/bluethon
+
+"""
+关注关系图快照和"可能认识的人"推荐
+
+manage.py build-graph 把follows表导出为CSR邻接文件(不含自关注):
+    头部  magic, 节点数n(最大用户id+1), 边数m, 生成时间
+    offsets  n+1个int64, 用户u关注的人为 neighbors[offsets[u]:offsets[u+1]]
+    neighbors  m个int32, 每个用户的部分升序
+各进程只读mmap同一文件, 由操作系统共享页面; 新快照写临时文件后原子替换,
+已映射旧文件的进程不受影响, 下次检查到文件变化再重新映射.
+推荐: 用户关注的人所关注的人, 按共同关注数排序; 计数由Counter在C中完成.
+每次推荐的计数量有上限: 关注的人和他们各自关注的人都超过上限时均匀抽取, 结果为近似值.
+"""
+import fcntl
+import heapq
+import mmap
+import os
+import struct
+import time
+from array import array
+from collections import Counter
+from threading import Lock, Thread
+
+from flask import current_app
+
+
+MAGIC = b'FLWGRPH1'
+# magic, 节点数, 保留, 边数, 生成时间; 32字节, 之后的数组按8字节对齐
+HEADER = struct.Struct('=8sIIQd')
+
+
+def build(path, batch=10000):
+    """ 导出follows表到path, 返回(节点数, 边数) """
+    from . import db
+    from .models import User, Follow
+
+    follows = Follow.__table__
+    n = (db.session.query(db.func.max(User.id)).scalar() or 0) + 1
+    # 每个关注者的边数, 最后转为偏移
+    offsets = array('q', bytes(8 * (n + 1)))
+    tmp = '%s.%d.tmp' % (path, os.getpid())
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    m = 0
+    with open(tmp, 'wb') as f:
+        f.seek(HEADER.size + 8 * (n + 1))
+        # 主键(follower_id, followed_id)顺序, 边按关注者分组且组内升序
+        query = db.session.query(Follow.follower_id, Follow.followed_id) \
+            .filter(follows.c.follower_id != follows.c.followed_id) \
+            .filter(follows.c.follower_id < n, follows.c.followed_id < n) \
+            .order_by(Follow.follower_id, Follow.followed_id) \
+            .yield_per(batch)
+        chunk = array('i')
+        for follower_id, followed_id in query:
+            offsets[follower_id + 1] += 1
+            chunk.append(followed_id)
+            if len(chunk) >= batch:
+                chunk.tofile(f)
+                m += len(chunk)
+                chunk = array('i')
+        chunk.tofile(f)
+        m += len(chunk)
+        for i in range(1, n + 1):
+            offsets[i] += offsets[i - 1]
+        f.seek(0)
+        f.write(HEADER.pack(MAGIC, n, 0, m, time.time()))
+        offsets.tofile(f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+    return n, m
+
+
+def _spread(ids, count):
+    """ 至多count个, 超过时均匀间隔抽取, 同一快照结果不变 """
+    if len(ids) <= count:
+        return ids
+    return ids[::-(-len(ids) // count)]
+
+
+def _stamp(stat):
+    # 原子替换后inode改变, 修改时间相同也能区分
+    return stat.st_ino, stat.st_mtime_ns
+
+
+class Snapshot(object):
+    """ 只读映射的CSR快照 """
+
+    def __init__(self, path):
+        with open(path, 'rb') as f:
+            self.stamp = _stamp(os.fstat(f.fileno()))
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, self.nodes, _, self.edges, self.built_at = \
+            HEADER.unpack_from(self._map)
+        if magic != MAGIC:
+            raise ValueError('not a follow graph snapshot: %s' % path)
+        view = memoryview(self._map)
+        start = HEADER.size
+        end = start + 8 * (self.nodes + 1)
+        self.offsets = view[start:end].cast('q')
+        self.neighbors = view[end:end + 4 * self.edges].cast('i')
+
+    def following(self, user_id):
+        """ 快照中user_id关注的人, memoryview切片, 不复制 """
+        if not 0 <= user_id < self.nodes:
+            return self.neighbors[0:0]
+        return self.neighbors[self.offsets[user_id]:
+                              self.offsets[user_id + 1]]
+
+    def suggestions(self, user_id, limit=10, exclude=(), max_following=200,
+                    max_neighbors=200):
+        """
+        [(用户id, 共同关注数)], 共同关注数相同的id小者在前
+        exclude 不推荐的id, 如实时的已关注集合(快照可能已过时)
+        至多取max_following个关注的人, 每人至多取max_neighbors个他关注的人
+        """
+        counts = Counter()
+        for followed_id in _spread(self.following(user_id), max_following):
+            counts.update(_spread(self.following(followed_id),
+                                  max_neighbors))
+        counts.pop(user_id, None)
+        for id in exclude:
+            counts.pop(id, None)
+        return heapq.nsmallest(limit, counts.items(),
+                               key=lambda item: (-item[1], item[0]))
+
+
+class FollowGraph(object):
+    """
+    用法同其他扩展, create_app中init_app
+    请求中取快照时检查文件是否更新; 快照过期时在后台线程重建,
+    文件锁保证多个进程中只有一个在重建, 请求继续使用旧快照
+    """
+
+    # 重建失败或其他进程在重建时, 隔多少秒再尝试
+    RETRY_INTERVAL = 60
+
+    def __init__(self, app=None):
+        self.rebuilds = 0
+        self._snapshot = None
+        self._attempted = 0
+        self._rebuilding = False
+        self._lock = Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.extensions['follow_graph'] = self
+
+    def snapshot(self):
+        """ 当前快照, 尚未生成时返回None """
+        config = current_app.config
+        path = config['FLASKY_GRAPH_PATH']
+        try:
+            stat = os.stat(path)
+        except OSError:
+            # 文件被删除或路径已改变, 不再使用旧快照
+            stat = self._snapshot = None
+        if stat is not None and (self._snapshot is None or
+                                 _stamp(stat) != self._snapshot.stamp):
+            self._snapshot = Snapshot(path)
+        interval = config['FLASKY_GRAPH_REFRESH_INTERVAL']
+        if interval and (stat is None or
+                         time.time() - stat.st_mtime >= interval):
+            self.refresh_async()
+        return self._snapshot
+
+    def refresh_async(self):
+        """ 后台线程重建, 本进程已在重建或刚尝试过时跳过 """
+        with self._lock:
+            if self._rebuilding or \
+                    time.time() - self._attempted < self.RETRY_INTERVAL:
+                return
+            self._rebuilding = True
+            self._attempted = time.time()
+        app = current_app._get_current_object()
+        Thread(target=self._rebuild, args=[app], daemon=True).start()
+
+    def _rebuild(self, app):
+        # 在不同的线程中执行, 因此需要手动激活app_context
+        try:
+            with app.app_context():
+                path = app.config['FLASKY_GRAPH_PATH']
+                os.makedirs(os.path.dirname(os.path.abspath(path)),
+                            exist_ok=True)
+                with open(path + '.lock', 'w') as lock:
+                    try:
+                        fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                    except OSError:
+                        # 其他进程正在重建
+                        return
+                    # 拿到锁前其他进程可能刚刚重建完
+                    try:
+                        fresh = time.time() - os.stat(path).st_mtime < \
+                            app.config['FLASKY_GRAPH_REFRESH_INTERVAL']
+                    except OSError:
+                        fresh = False
+                    if not fresh:
+                        build(path)
+                        self.rebuilds += 1
+        except Exception:
+            app.logger.exception('follow graph rebuild failed')
+        finally:
+            with self._lock:
+                self._rebuilding = False
@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# @Date     : 2026-10-18 16:50
+# @Author   : Bluethon (j5088794@gmail.com)
+# @Link     : http://github.com/bluethon
+
+"""
+最后访问时间合并写入
+
+User.ping() 不再每个请求 UPDATE users, 而是记到进程内缓冲区,
+每个用户只保留最新时间, 由后台线程每FLASKY_LAST_SEEN_FLUSH_INTERVAL秒
+或攒够条数时一条批量UPDATE写入, 不占用请求的时间; 进程退出时再写一次.
+FLASKY_LAST_SEEN_BUFFER_SIZE不大于1时不缓冲, 在请求中立即写入
+"""
+import atexit
+import os
+import time
+from threading import Event, Lock, Thread
+
+from flask import current_app
+
+
+class LastSeenBuffer(object):
+    """ 用法同其他扩展, create_app中init_app """
+
+    def __init__(self, app=None):
+        self.app = None
+        self.pending = {}
+        self.last_flush = time.time()
+        # 统计: 写入批数, 写入行数, 被合并的次数
+        self.flushes = 0
+        self.written = 0
+        self.coalesced = 0
+        self._lock = Lock()
+        self._registered = False
+        self._wake = Event()
+        # 后台线程所在的进程, gunicorn预先fork时每个worker各自启动
+        self._pid = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.app = app
+        if not self._registered:
+            atexit.register(self.flush_at_exit)
+            self._registered = True
+
+    def add(self, user_id, timestamp):
+        """ 记录访问时间, 攒够条数时唤醒后台线程写入 """
+        buffer_size = current_app.config['FLASKY_LAST_SEEN_BUFFER_SIZE']
+        with self._lock:
+            if user_id in self.pending:
+                self.coalesced += 1
+            if self.pending.get(user_id) is None or \
+                    self.pending[user_id] < timestamp:
+                self.pending[user_id] = timestamp
+            size = len(self.pending)
+        if buffer_size <= 1:
+            self.flush()
+            return
+        self._start()
+        if size >= buffer_size:
+            self._wake.set()
+
+    def _start(self):
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+        Thread(target=self._run, daemon=True).start()
+
+    def _run(self):
+        # 每次取最新init_app的app, 间隔内没有唤醒也写入
+        while True:
+            app = self.app
+            self._wake.wait(app.config['FLASKY_LAST_SEEN_FLUSH_INTERVAL'])
+            self._wake.clear()
+            if not self.pending:
+                continue
+            with app.app_context():
+                try:
+                    self.flush()
+                except Exception:
+                    app.logger.exception('Failed to flush last_seen')
+
+    def flush(self):
+        """ 一条批量UPDATE写入缓冲区, 只会把时间往后改, 需要app_context """
+        # 本模块在app/__init__中db创建前导入
+        from . import db
+        from .models import User
+
+        with self._lock:
+            pending, self.pending = self.pending, {}
+            self.last_flush = time.time()
+        if not pending:
+            return 0
+        users = User.__table__
+        update = users.update() \
+            .where(users.c.id == db.bindparam('_id')) \
+            .where(db.or_(users.c.last_seen.is_(None),
+                          users.c.last_seen < db.bindparam('_last_seen'))) \
+            .values(last_seen=db.bindparam('_last_seen'))
+        # 单独的连接和事务, 不影响请求中的session
+        with db.engine.begin() as connection:
+            connection.execute(update, [
+                {'_id': user_id, '_last_seen': timestamp}
+                for user_id, timestamp in pending.items()])
+        self.flushes += 1
+        self.written += len(pending)
+        return len(pending)
+
+    def flush_at_exit(self):
+        if self.app is None or not self.pending:
+            return
+        with self.app.app_context():
+            try:
+                self.flush()
+            except Exception:
+                self.app.logger.exception('Failed to flush last_seen')
@@ -4,41 +4,22 @@
 # @Author  : Bluethon (j5088794@gmail.com)
 # @Link    : http://github.com/bluethon
 
+import hmac
+
 from flask import render_template, redirect, url_for, abort, flash, request, \
     current_app, make_response
 from flask_login import login_required, current_user
-from flask_sqlalchemy import get_debug_queries
 
 from . import main
 from .forms import EditProfileForm, EditProfileAdminForm, PostForm, CommentForm
-from .. import db
-from ..models import Permission, Role, User, Post, Comment
+from .. import db, request_metrics, page_cache
+from ..models import Permission, Role, User, Post, Comment, Follow, \
+    TimelineEntry
+from ..pagination import paginate
+from ..search import KINDS, paginate_hits, ordered
 from ..decorators import admin_required, permission_required
 
 
-# after_app_request 视图函数处理玩请求后执行
-# Flask把响应对象传给after_app_request, 以防需要修改响应
-@main.after_app_request
-def after_request(response):
-    # 获取Flask-SQLAlchemy记录的查询时间, 将缓慢的查询写入日志
-    # get_debug_queries()返回列表, 默认情况仅**调试模式**可用
-    """
-    statement   SQL语句
-    parameters  SQL语句使用的参数
-    start_time  执行查询开始的时刻
-    end_time    返回查询结果的时刻
-    duration    查询持续时间, 单位秒/s
-    context     查询在源码中所处位置的字符串
-    """
-    for query in get_debug_queries():
-        if query.duration >= current_app.config['FLASKY_SLOW_DB_QUERY_TIME']:
-            current_app.logger.warning(
-                'Slow query: %s\nParameters: %s\nDuration: %fs\nContext: %s\n'
-                % (query.statement, query.parameters, query.duration,
-                   query.context))
-    return response
-
-
 @main.route('/shutdown')
 def server_shutdown():
     """ 路由 关闭服务器 """
@@ -54,7 +35,24 @@ def server_shutdown():
     return 'Shutting down...'
 
 
+@main.route('/metrics')
+def metrics():
+    """ 路由 请求指标, Prometheus文本格式 """
+    # 带FLASKY_METRICS_TOKEN令牌(供采集程序使用)或管理员登录才能访问
+    token = current_app.config['FLASKY_METRICS_TOKEN']
+    auth = request.headers.get('Authorization', '')
+    if not (token and hmac.compare_digest(auth, 'Bearer ' + token)) and \
+            not current_user.is_administrator():
+        abort(403)
+    response = make_response(request_metrics.render())
+    response.headers['Content-Type'] = \
+        'text/plain; version=0.0.4; charset=utf-8'
+    return response
+
+
 @main.route('/', methods=['GET', 'POST'])
+# 新文章出现在所有列表页
+@page_cache.cached('posts')
 def index():
     """ 路由 首页 """
     form = PostForm()
@@ -66,20 +64,23 @@ def index():
                     author=current_user._get_current_object())
         db.session.add(post)
         return redirect(url_for('.index'))
-    # 从请求的查询字符串(request.args)中获取渲染的页数, 默认第一页
-    page = request.args.get('page', 1, type=int)
     show_followed = False
     if current_user.is_authenticated:
         show_followed = bool(request.cookies.get('show_followed', ''))
+    # 请求带page参数时按页数分页, 否则按游标分页
     if show_followed:
-        query = current_user.followed_posts
+        # 时间线按条目冗余的时间和文章id排序
+        pagination = paginate(
+            current_user.timeline.options(db.joinedload(Post.author)),
+            [TimelineEntry.timestamp, TimelineEntry.post_id],
+            per_page=current_app.config['FLASKY_POSTS_PER_PAGE'],
+            key=lambda post: (post.timestamp, post.id))
     else:
-        query = Post.query
-    # 将all()方法换为paginate()方法 来显示某页的记录
-    # args: 页数, [每页显示多少], [True->404; False->null list]
-    pagination = query.order_by(Post.timestamp.desc()).paginate(
-        page, per_page=current_app.config['FLASKY_POSTS_PER_PAGE'],
-        error_out=False)
+        # 模板逐行渲染作者, 随文章一次联接查询取回, 避免逐行延迟加载
+        pagination = paginate(
+            Post.query.options(db.joinedload(Post.author)),
+            [Post.timestamp, Post.id],
+            per_page=current_app.config['FLASKY_POSTS_PER_PAGE'])
     # 当页内容
     posts = pagination.items
     return render_template('index.html', form=form, posts=posts,
@@ -87,15 +88,15 @@ def index():
 
 
 @main.route('/user/<username>')
+@page_cache.cached()
 def user(username):
     user = User.query.filter_by(username=username).first_or_404()
     # 被上面重构了
     # if user is None:
     #     abort(404)
-    page = request.args.get('page', 1, type=int)
-    pagination = user.posts.order_by(Post.timestamp.desc()).paginate(
-        page, per_page=current_app.config['FLASKY_POSTS_PER_PAGE'],
-        error_out=False)
+    pagination = paginate(
+        user.posts, [Post.timestamp, Post.id],
+        per_page=current_app.config['FLASKY_POSTS_PER_PAGE'])
     posts = pagination.items
     return render_template('user.html', user=user, posts=posts,
                            pagination=pagination)
@@ -148,6 +149,7 @@ def edit_profile_admin(id):
 
 
 @main.route('/post/<int:id>', methods=['GET', 'POST'])
+@page_cache.cached()
 def post(id):
     """ 文章永久链接页面 """
     post = Post.query.get_or_404(id)
@@ -158,15 +160,24 @@ def post(id):
         db.session.add(comment)
         flash('Your comment has been published.')
         return redirect(url_for('.post', id=post.id, page=-1))
-    page = request.args.get('page', 1, type=int)
+    page = request.args.get('page', type=int)
     if page == -1:
+        # 跳到最后一页
         # eg: count=21, PER_PAGE=10, page=3
         # 改动 // 进行地板除
-        page = (post.comments.count() - 1) // current_app.config[
+        page = (post.comment_count - 1) // current_app.config[
             'FLASKY_COMMENTS_PER_PAGE'] + 1
-    pagination = post.comments.order_by(Comment.timestamp.asc()).paginate(
-        page, per_page=current_app.config['FLASKY_COMMENTS_PER_PAGE'],
-        error_out=False)
+        pagination = post.comments.options(
+            db.joinedload(Comment.author)).order_by(
+            Comment.timestamp.asc(), Comment.id.asc()).paginate(
+            page, per_page=current_app.config['FLASKY_COMMENTS_PER_PAGE'],
+            error_out=False)
+    else:
+        pagination = paginate(
+            post.comments.options(db.joinedload(Comment.author)),
+            [Comment.timestamp, Comment.id],
+            per_page=current_app.config['FLASKY_COMMENTS_PER_PAGE'],
+            ascending=True)
     comments = pagination.items
     # [post], 转为list, 因为_posts.html中作为列表渲染
     return render_template('post.html', posts=[post], form=form,
@@ -233,10 +244,10 @@ def followers(username):
     if user is None:
         flash('Invalid user.')
         return redirect(url_for('.index'))
-    page = request.args.get('page', 1, type=int)
-    pagination = user.followers.paginate(
-        page, per_page=current_app.config['FLASKY_FOLLOWERS_PER_PAGE'],
-        error_out=False)
+    # Follow.follower/followed 为lazy='joined', 已随关注记录一起取回
+    pagination = paginate(
+        user.followers, [Follow.timestamp, Follow.follower_id],
+        per_page=current_app.config['FLASKY_FOLLOWERS_PER_PAGE'])
     # 为渲染方便, 将 Follow实例 列表转换为新的列表
     follows = [{'user': item.follower, 'timestamp': item.timestamp}
                for item in pagination.items]
@@ -254,10 +265,9 @@ def followed_by(username):
         flash('Invalid user.')
         return redirect(url_for('.index'))
 
-    page = request.args.get('page', 1, type=int)
-    pagination = user.followed.paginate(
-        page, per_page=current_app.config['FLASKY_FOLLOWERS_PER_PAGE'],
-        error_out=False)
+    pagination = paginate(
+        user.followed, [Follow.timestamp, Follow.followed_id],
+        per_page=current_app.config['FLASKY_FOLLOWERS_PER_PAGE'])
     follows = [{'user': item.followed, 'timestamp': item.timestamp}
                for item in pagination.items]
     return render_template('followers.html', user=user, title="Followed by",
@@ -283,18 +293,41 @@ def show_followed():
     return resp
 
 
+@main.route('/search')
+def search():
+    """ 全文搜索文章或评论, 按相关度排序 """
+    q = request.args.get('q', '').strip()
+    kind = request.args.get('kind', 'posts')
+    if kind not in KINDS:
+        abort(404)
+    model = Post if kind == 'posts' else Comment
+    per_page = current_app.config['FLASKY_POSTS_PER_PAGE'
+                                  if kind == 'posts' else
+                                  'FLASKY_COMMENTS_PER_PAGE']
+    pagination = paginate_hits(kind, q, per_page)
+    results = []
+    if pagination is not None:
+        results = ordered(model.query.options(db.joinedload(model.author)),
+                          model, [row.doc_id for row in pagination.items])
+    return render_template('search.html', q=q, kind=kind, results=results,
+                           pagination=pagination)
+
+
 @main.route('/moderate')
 @login_required
 @permission_required(Permission.MODERATE_COMMENTS)
 def moderate():
     """ 管理评论 """
-    page = request.args.get('page', 1, type=int)
-    pagination = Comment.query.order_by(Comment.timestamp.desc()).paginate(
-        page, per_page=current_app.config['FLASKY_COMMENTS_PER_PAGE'],
-        error_out=False)
+    pagination = paginate(
+        Comment.query.options(db.joinedload(Comment.author)),
+        [Comment.timestamp, Comment.id],
+        per_page=current_app.config['FLASKY_COMMENTS_PER_PAGE'])
     comments = pagination.items
+    # 启用/关闭后返回当前页
     return render_template('moderate.html', comments=comments,
-                           pagination=pagination, page=page)
+                           pagination=pagination,
+                           page=request.args.get('page', type=int),
+                           cursor=request.args.get('cursor'))
 
 
 @main.route('/moderate/enable/<int:id>')
@@ -305,8 +338,9 @@ def moderate_enable(id):
     comment = Comment.query.get_or_404(id)
     comment.disabled = False
     db.session.add(comment)
-    return redirect(url_for('.moderate', page=request.args.get('page', 1,
-                                                               type=int)))
+    return redirect(url_for('.moderate',
+                            page=request.args.get('page', type=int),
+                            cursor=request.args.get('cursor')))
 
 
 @main.route('/moderate/disable/<int:id>')
@@ -317,5 +351,6 @@ def moderate_disable(id):
     comment = Comment.query.get_or_404(id)
     comment.disabled = True
     db.session.add(comment)
-    return redirect(url_for('.moderate', page=request.args.get('page', 1,
-                                                               type=int)))
+    return redirect(url_for('.moderate',
+                            page=request.args.get('page', type=int),
+                            cursor=request.args.get('cursor')))
@@ -0,0 +1,199 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# @Date     : 2026-10-18 17:40
+# @Author   : Bluethon (j5088794@gmail.com)
+# @Link     : http://github.com/bluethon
+
+"""
+按端点统计请求指标
+
+每个请求记录耗时; 按FLASKY_METRICS_SAMPLE_RATE抽样的请求另外记录
+查询条数, 数据库耗时, 模板渲染耗时, ORM加载行数.
+数据存放在进程内的固定分桶直方图中, 以Prometheus文本格式输出.
+"""
+import random
+import time
+from bisect import bisect_left
+from collections import OrderedDict
+from threading import Lock
+
+from flask import current_app, g, has_request_context, request, \
+    before_render_template, template_rendered
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Mapper
+
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_BUCKETS = (1, 2, 5, 10, 20, 50, 100)
+ROW_BUCKETS = (1, 10, 50, 100, 500, 1000, 5000)
+
+# (名称, 说明, 分桶, 取值的字段), 第一个对所有请求记录, 其余只记录抽样请求
+HISTOGRAMS = (
+    ('flasky_request_latency_seconds', 'Request latency.',
+     LATENCY_BUCKETS, 'latency'),
+    ('flasky_request_queries', 'SQL statements per sampled request.',
+     QUERY_BUCKETS, 'queries'),
+    ('flasky_request_db_seconds', 'Time spent in SQL per sampled request.',
+     LATENCY_BUCKETS, 'db_time'),
+    ('flasky_request_template_seconds',
+     'Time spent rendering templates per sampled request.',
+     LATENCY_BUCKETS, 'template_time'),
+    ('flasky_request_rows', 'ORM rows loaded per sampled request.',
+     ROW_BUCKETS, 'rows'),
+)
+
+
+class Histogram(object):
+    """ 固定分桶直方图, 各桶分别计数, 输出时再累加 """
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def samples(self):
+        """ 生成 (le, 累计数) """
+        total = 0
+        for bound, count in zip(self.buckets, self.counts):
+            total += count
+            yield '%g' % bound, total
+        yield '+Inf', self.count
+
+
+def _label(value):
+    return value.replace('\\', '\\\\').replace('"', '\\"') \
+        .replace('\n', '\\n')
+
+
+def _stats():
+    """ 当前请求的抽样统计, 不在请求中或未抽中返回None """
+    if not has_request_context():
+        return None
+    return g.get('_request_metrics')
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context,
+                           executemany):
+    if _stats() is not None:
+        conn.info.setdefault('query_start', []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context,
+                          executemany):
+    stats = _stats()
+    if stats is None or not conn.info.get('query_start'):
+        return
+    stats['queries'] += 1
+    stats['db_time'] += time.perf_counter() - conn.info['query_start'].pop()
+
+
+def _on_load(target, context):
+    stats = _stats()
+    if stats is not None:
+        stats['rows'] += 1
+
+
+def _before_render(sender, template, context, **extra):
+    stats = _stats()
+    if stats is not None:
+        stats.setdefault('template_start', []).append(time.perf_counter())
+
+
+def _after_render(sender, template, context, **extra):
+    stats = _stats()
+    if stats is not None and stats.get('template_start'):
+        # 嵌套渲染只计最外层
+        start = stats['template_start'].pop()
+        if not stats['template_start']:
+            stats['template_time'] += time.perf_counter() - start
+
+
+class Metrics(object):
+    """ 用法同其他扩展, create_app中init_app """
+
+    def __init__(self, app=None):
+        self._histograms = {}
+        # 名称 -> (说明, getter), 每次create_app都会注册, 同名覆盖
+        self._counters = OrderedDict()
+        self._lock = Lock()
+        self._registered = False
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        if not self._registered:
+            # 对所有engine和映射类生效, 不在请求中时直接返回
+            event.listen(Engine, 'before_cursor_execute',
+                         _before_cursor_execute)
+            event.listen(Engine, 'after_cursor_execute',
+                         _after_cursor_execute)
+            event.listen(Mapper, 'load', _on_load)
+            self._registered = True
+        before_render_template.connect(_before_render, app)
+        template_rendered.connect(_after_render, app)
+        app.before_request(self.start_request)
+        app.after_request(self.finish_request)
+
+    def counter(self, name, help, getter):
+        """ 输出其他组件的累计计数, getter()返回当前值 """
+        self._counters[name] = (help, getter)
+
+    def start_request(self):
+        g._request_start = time.perf_counter()
+        if random.random() < current_app.config['FLASKY_METRICS_SAMPLE_RATE']:
+            g._request_metrics = {'queries': 0, 'db_time': 0.0,
+                                  'template_time': 0.0, 'rows': 0}
+
+    def finish_request(self, response):
+        start = g.get('_request_start')
+        if start is None:
+            return response
+        values = dict(g.get('_request_metrics') or {},
+                      latency=time.perf_counter() - start)
+        endpoint = request.endpoint or 'none'
+        with self._lock:
+            for name, help, buckets, field in HISTOGRAMS:
+                if field not in values:
+                    continue
+                histogram = self._histograms.get((name, endpoint))
+                if histogram is None:
+                    histogram = self._histograms[(name, endpoint)] = \
+                        Histogram(buckets)
+                histogram.observe(values[field])
+        return response
+
+    def render(self):
+        """ Prometheus文本格式 """
+        lines = []
+        with self._lock:
+            for name, help, buckets, field in HISTOGRAMS:
+                lines.append('# HELP %s %s' % (name, help))
+                lines.append('# TYPE %s histogram' % name)
+                for (key, endpoint), histogram in sorted(
+                        self._histograms.items()):
+                    if key != name:
+                        continue
+                    label = 'endpoint="%s"' % _label(endpoint)
+                    for le, count in histogram.samples():
+                        lines.append('%s_bucket{%s,le="%s"} %d'
+                                     % (name, label, le, count))
+                    lines.append('%s_sum{%s} %r' % (name, label,
+                                                   histogram.sum))
+                    lines.append('%s_count{%s} %d' % (name, label,
+                                                     histogram.count))
+        for name, (help, getter) in self._counters.items():
+            lines.append('# HELP %s %s' % (name, help))
+            lines.append('# TYPE %s counter' % name)
+            lines.append('%s %d' % (name, getter()))
+        return '\n'.join(lines) + '\n'
+
+    def clear(self):
+        with self._lock:
+            self._histograms.clear()
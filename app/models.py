@@ -6,22 +6,85 @@
 
 # 用于计算用户邮箱的哈希值
 import hashlib
+import hmac
+import time
+from array import array
+from bisect import bisect_left
 from datetime import datetime
+from itertools import chain
+from threading import Thread
 
 # 使用Werkzeug中security模块实现 密码散列
 from werkzeug.security import generate_password_hash, check_password_hash
 # 令牌
 from itsdangerous import TimedJSONWebSignatureSerializer as Serializer
-from markdown import markdown
-import bleach
 # 用于登陆
-from flask import current_app, request, url_for
-from flask_login import UserMixin, AnonymousUserMixin
+from flask import current_app, request, url_for, g, has_app_context, \
+    has_request_context
+from flask_login import UserMixin, AnonymousUserMixin, current_user
+from flask_sqlalchemy import SignallingSession
+from sqlalchemy.orm.attributes import set_committed_value
 
-from . import db, login_manager
+from . import db, login_manager, renderer, last_seen
+from .cache import TTLCache
+from .page_cache import mark_written
+from .search import index_documents, remove_documents, create_index, \
+    drop_index
 from .exceptions import ValidationError
 
 
+def _increment(connection, model, id, column, delta):
+    """ 冗余计数字段原子加减 """
+    if id is None:
+        return
+    table = model.__table__
+    connection.execute(table.update().where(table.c.id == id).values(
+        {column: table.c[column] + delta}))
+
+
+def _fix_counter(table, column, subquery):
+    """ 用子查询的实际数量覆盖有偏差的计数字段, 返回修正的行数 """
+    actual = subquery.as_scalar()
+    counter = table.c[column]
+    return db.session.execute(
+        table.update().where(db.or_(counter.is_(None), counter != actual))
+        .values({column: actual})).rowcount
+
+
+def _allocate_ids(table, count):
+    """
+    为批量插入预先分配count个自增主键, 不支持的数据库返回None
+    PostgreSQL 从表的序列一次取出;
+    SQLite 取max(id)之后的号, 调用前本事务须已写过数据库, 持有写锁, 其他连接无法同时插入
+    """
+    dialect = db.engine.dialect.name
+    if dialect == 'postgresql':
+        return [id for id, in db.session.execute(
+            db.text("SELECT nextval(pg_get_serial_sequence(:table, 'id')) "
+                    "FROM generate_series(1, :count)"),
+            {'table': table.name, 'count': count})]
+    if dialect == 'sqlite':
+        last = db.session.execute(
+            db.select([db.func.max(table.c.id)])).scalar() or 0
+        return list(range(last + 1, last + 1 + count))
+    return None
+
+
+def _bulk_insert(model, mappings):
+    """
+    批量插入并在各字典写入id
+    预先分配主键时只执行一次executemany; 否则return_defaults逐行INSERT取回主键
+    """
+    ids = _allocate_ids(model.__table__, len(mappings))
+    if ids is None:
+        db.session.bulk_insert_mappings(model, mappings, return_defaults=True)
+    else:
+        for mapping, id in zip(mappings, ids):
+            mapping['id'] = id
+        db.session.bulk_insert_mappings(model, mappings)
+    return [mapping['id'] for mapping in mappings]
+
+
 class Permission:
     """ 权限常量 """
     FOLLOW = 0x01  # 关注其他用户
@@ -61,16 +124,30 @@ class Role(db.Model):
                           Permission.MODERATE_COMMENTS, False),
             'Administrator': (0xff, False)
         }
-        # 查询角色是否存在, 不存在则创建, 即更新操作
-        for r in roles:
-            role = Role.query.filter_by(name=r).first()
-            if role is None:
-                role = Role(name=r)
-            # roles字典中key=r, value是个tuple, tuple中第一个, 即位或值
-            role.permissions = roles[r][0]
-            role.default = roles[r][1]
-            db.session.add(role)
+        # 一次查出已有角色, 缺少的批量插入, 已有的批量更新, 即upsert
+        table = Role.__table__
+        existing = dict(db.session.query(Role.name, Role.id).filter(
+            Role.name.in_(list(roles))))
+        # roles字典中value是个tuple, 第一个即位或值, 第二个为是否默认
+        inserts = [{'name': name, 'permissions': permissions,
+                    'default': default}
+                   for name, (permissions, default) in roles.items()
+                   if name not in existing]
+        updates = [{'_id': existing[name], '_permissions': permissions,
+                    '_default': default}
+                   for name, (permissions, default) in roles.items()
+                   if name in existing]
+        if inserts:
+            db.session.execute(table.insert(), inserts)
+        if updates:
+            db.session.execute(
+                table.update().where(table.c.id == db.bindparam('_id'))
+                .values(permissions=db.bindparam('_permissions'),
+                        default=db.bindparam('_default')), updates)
         db.session.commit()
+        # Core的UPDATE不触发Role的after_update, 提交后作废全部用户的认证缓存
+        if updates:
+            _invalidate_auth(None)
 
     def __repr__(self):
         return '<Role %r>' % self.name
@@ -85,6 +162,30 @@ class Follow(db.Model):
                             primary_key=True)
     timestamp = db.Column(db.DateTime, default=datetime.utcnow)
 
+    # noinspection PyUnusedLocal
+    @staticmethod
+    def on_inserted(mapper, connection, target):
+        """ 关注后更新双方的关注计数 """
+        _increment(connection, User, target.followed_id, 'follower_count', 1)
+        _increment(connection, User, target.follower_id, 'followed_count', 1)
+        _invalidate_follows(target.follower_id)
+        TimelineEntry.backfill(connection, target.follower_id,
+                               target.followed_id)
+
+    # noinspection PyUnusedLocal
+    @staticmethod
+    def on_deleted(mapper, connection, target):
+        """ 取消关注后更新双方的关注计数 """
+        _increment(connection, User, target.followed_id, 'follower_count', -1)
+        _increment(connection, User, target.follower_id, 'followed_count', -1)
+        _invalidate_follows(target.follower_id)
+        TimelineEntry.prune(connection, target.follower_id, target.followed_id)
+
+
+# 计数由数据库端原子加减, 不经过session, 内存中的旧值在commit后过期重新加载
+db.event.listen(Follow, 'after_insert', Follow.on_inserted)
+db.event.listen(Follow, 'after_delete', Follow.on_deleted)
+
 
 # 继承UserMixin, 里面包含了is_authenticated等的默认实现
 class User(UserMixin, db.Model):
@@ -112,6 +213,16 @@ class User(UserMixin, db.Model):
     last_seen = db.Column(db.DateTime(), default=datetime.utcnow)
     # 头像MD5值
     avatar_hash = db.Column(db.String(32))
+    # 冗余计数, 由Post/Follow的插入删除事件维护, 避免每行一次COUNT查询
+    # 关注计数包含自关注
+    post_count = db.Column(db.Integer, default=0)
+    follower_count = db.Column(db.Integer, default=0)
+    followed_count = db.Column(db.Integer, default=0)
+    # 最后修改时间, 计算API的ETag/Last-Modified, 计数和last_seen的批量UPDATE也会更新
+    updated_at = db.Column(db.DateTime(), default=datetime.utcnow,
+                           onupdate=datetime.utcnow)
+    # 增量导出按updated_at过滤, 按id排序
+    __table_args__ = (db.Index('ix_users_updated_at_id', 'updated_at', 'id'),)
     posts = db.relationship('Post', backref='author', lazy='dynamic')
     # 被关注者list对象
     followed = db.relationship('Follow',
@@ -159,13 +270,70 @@ class User(UserMixin, db.Model):
                 db.session.rollback()
 
     @staticmethod
-    def add_self_follows():
-        """ 用户自关注 """
-        for user in User.query.all():
-            if not user.is_following(user):
-                user.follow(user)
-                db.session.add(user)
-                db.session.commit()
+    def add_self_follows(batch=1000, callback=None):
+        """
+        补全用户自关注, 按用户id分批, 每批几条集合语句后提交, 返回补上的行数
+        关注计数和时间线由语句直接维护, 不经过Follow的事件
+        callback(last_id, added) 每批提交后调用
+        """
+        users = User.__table__
+        follows = Follow.__table__
+        posts = Post.__table__
+        entries = TimelineEntry.__table__
+        total = 0
+        last = 0
+        while True:
+            ids = [row[0] for row in db.session.execute(
+                db.select([users.c.id]).where(users.c.id > last)
+                .order_by(users.c.id).limit(batch))]
+            if not ids:
+                break
+            # 本批中尚未自关注的用户, 插入关注前的两条语句依赖此条件
+            missing = db.and_(
+                users.c.id.between(ids[0], ids[-1]),
+                ~db.exists(db.select([follows.c.follower_id])
+                           .where(follows.c.follower_id == users.c.id)
+                           .where(follows.c.followed_id == users.c.id)))
+            db.session.execute(users.update().where(missing).values(
+                follower_count=users.c.follower_count + 1,
+                followed_count=users.c.followed_count + 1))
+            db.session.execute(entries.insert().from_select(
+                ['user_id', 'post_id', 'timestamp'],
+                db.select([users.c.id, posts.c.id, posts.c.timestamp])
+                .where(posts.c.author_id == users.c.id).where(missing)
+                .where(~db.exists(db.select([entries.c.post_id])
+                                  .where(entries.c.user_id == users.c.id)
+                                  .where(entries.c.post_id == posts.c.id)))))
+            added = db.session.execute(follows.insert().from_select(
+                ['follower_id', 'followed_id', 'timestamp'],
+                db.select([users.c.id.label('follower_id'),
+                           users.c.id.label('followed_id'),
+                           db.literal(datetime.utcnow())]).where(missing))
+            ).rowcount
+            db.session.commit()
+            _invalidate_follows(None)
+            total += added
+            last = ids[-1]
+            if callback:
+                callback(last, added)
+        return total
+
+    @staticmethod
+    def recount():
+        """ 重新统计冗余计数, 修正偏差, 返回修正的行数 """
+        users = User.__table__
+        counts = {
+            'post_count': db.select([db.func.count(Post.id)]).where(
+                Post.author_id == users.c.id),
+            'follower_count': db.select(
+                [db.func.count(Follow.follower_id)]).where(
+                Follow.followed_id == users.c.id),
+            'followed_count': db.select(
+                [db.func.count(Follow.followed_id)]).where(
+                Follow.follower_id == users.c.id),
+        }
+        return sum(_fix_counter(users, column, subquery)
+                   for column, subquery in counts.items())
 
     def __init__(self, **kwargs):
         super(User, self).__init__(**kwargs)
@@ -278,8 +446,15 @@ class User(UserMixin, db.Model):
 
     def ping(self):
         """ 更新用户最后访问时间 """
-        self.last_seen = datetime.utcnow()
-        db.session.add(self)
+        now = datetime.utcnow()
+        # 距上次不到FLASKY_LAST_SEEN_INTERVAL秒, 不更新
+        if self.last_seen is not None and \
+                (now - self.last_seen).total_seconds() < \
+                current_app.config['FLASKY_LAST_SEEN_INTERVAL']:
+            return
+        # 只改内存中的值, 不标记为修改, 由缓冲区批量写入数据库
+        set_committed_value(self, 'last_seen', now)
+        last_seen.add(self.id, now)
 
     def gravatar(self, size=100, default='identicon', rating='g'):
         if request.is_secure:
@@ -304,17 +479,83 @@ class User(UserMixin, db.Model):
         if f:
             db.session.delete(f)
 
+    def _caches_follows(self):
+        """ 只缓存当前登录用户的关注集合, 查看其他用户用索引点查 """
+        return self.id is not None and has_request_context() and \
+            getattr(current_user, 'id', None) == self.id
+
+    def followed_ids(self):
+        """
+        关注的人的id, 升序array('i')
+        当前登录用户的在请求内(g)和进程内缓存, 版本见_follow_version
+        """
+        # 与原先的动态查询一样, 先写入session中待提交的关注
+        if self.id is None or any(isinstance(obj, Follow) for obj in chain(
+                db.session.new, db.session.deleted)):
+            db.session.flush()
+        if self.id is None:
+            return array('i')
+        follows = Follow.__table__
+        query = db.select([follows.c.followed_id]) \
+            .where(follows.c.follower_id == self.id) \
+            .order_by(follows.c.followed_id)
+        if not self._caches_follows():
+            return array('i', [row[0] for row in db.session.execute(query)])
+        memo = g.setdefault('_followed_ids', {})
+        # 查库前取版本号, 期间发生的变更会使本次缓存作废
+        version = _follow_version(self.id)
+        entry = memo.get(self.id) or _follow_cache.get(self.id)
+        # 其他进程的关注变化: 本请求已加载的关注数与缓存的个数不同;
+        # 提交后过期的不为此重新加载, 本进程的变化已由版本号发现
+        count = db.inspect(self).dict.get('followed_count')
+        if entry is None or entry[0] != version or \
+                count is not None and count != len(entry[1]):
+            entry = (version, array('i', [row[0] for row in
+                                          db.session.execute(query)]))
+            _follow_cache.set(self.id, entry,
+                              current_app.config['FLASKY_FOLLOW_CACHE_TIMEOUT'])
+        memo[self.id] = entry
+        return entry[1]
+
     def is_following(self, user):
-        """ 是否关注了某人 """
-        return self.followed.filter_by(
-            followed_id=user.id).first() is not None
+        """ 是否关注了某人, 当前用户在缓存的id数组中二分查找 """
+        if user.id is None:
+            return False
+        if not self._caches_follows():
+            return self.followed.filter_by(
+                followed_id=user.id).first() is not None
+        ids = self.followed_ids()
+        i = bisect_left(ids, user.id)
+        return i < len(ids) and ids[i] == user.id
 
     def is_followed_by(self, user):
         """ 是否被某人关注 """
-        return self.followers.filter_by(
-            follower_id=user.id).first() is not None
+        return user.is_following(self)
+
+    def following_among(self, ids):
+        """ ids中已关注的, 返回集合, 如一页文章的作者一次判断 """
+        ids = list(ids)
+        if not self._caches_follows():
+            return set(row[0] for row in db.session.query(
+                Follow.followed_id).filter(Follow.follower_id == self.id)
+                .filter(Follow.followed_id.in_(ids))) if ids else set()
+        followed = self.followed_ids()
+        result = set()
+        for id in ids:
+            i = bisect_left(followed, id)
+            if i < len(followed) and followed[i] == id:
+                result.add(id)
+        return result
 
     # @property 调用类似属性, 不加(), 与其他关系的句法保持一致
+    @property
+    def timeline(self):
+        """ 时间线: 被关注者的所有文章, 按时间倒序, 读取预先分发的条目 """
+        return Post.query.join(TimelineEntry,
+                               TimelineEntry.post_id == Post.id) \
+            .filter(TimelineEntry.user_id == self.id) \
+            .order_by(TimelineEntry.timestamp.desc())
+
     @property
     def followed_posts(self):
         """ 被关注者的所有文章 """
@@ -333,15 +574,13 @@ class User(UserMixin, db.Model):
             'post': url_for('api.get_user_posts', id=self.id, _external=True),
             'followed_posts': url_for('api.get_user_followed_posts',
                                       id=self.id, _external=True),
-            'post_count': self.posts.count()
+            'post_count': self.post_count
         }
         return json_user
 
     def generate_auth_token(self, expiration):
         """ 生成API认证令牌 """
-        s = Serializer(current_app.config['SECRET_KEY'], expires_in=expiration)
-        # 默认不转码为二进制数据, 但二进制在发送的邮件中会转成ascii码
-        return s.dumps({'id': self.id}).decode('ascii')
+        return _generate_auth_token(self.id, expiration)
 
     # 解码令牌后才知道用户是谁, 所以使用静态方法
     @staticmethod
@@ -354,11 +593,181 @@ class User(UserMixin, db.Model):
             return None
         return User.query.get(data['id'])
 
+    @staticmethod
+    def verify_auth_token_cached(token):
+        """
+        验证API认证令牌, 返回UserSnapshot
+        解码结果和用户快照缓存到令牌过期(最长FLASKY_TOKEN_CACHE_TIMEOUT秒),
+        命中时既不验签也不查库
+        """
+        snapshot = _token_cache.get(token)
+        if snapshot is not None and snapshot.is_current():
+            return snapshot
+        s = Serializer(current_app.config['SECRET_KEY'])
+        try:
+            data, header = s.loads(token, return_header=True)
+        except:
+            return None
+        # 查库前取版本号, 期间发生的变更会使本次缓存作废
+        version = _auth_version(data['id'])
+        user = User.query.options(db.joinedload(User.role)).get(data['id'])
+        if user is None:
+            return None
+        snapshot = UserSnapshot(user, version)
+        _token_cache.set(token, snapshot, min(
+            header.get('exp', 0) - time.time(),
+            current_app.config['FLASKY_TOKEN_CACHE_TIMEOUT']))
+        return snapshot
+
+    @staticmethod
+    def verify_credentials_cached(email, password):
+        """
+        验证API邮箱密码, 返回UserSnapshot
+        验证通过的凭据按HMAC(SECRET_KEY, 邮箱+密码)缓存
+        FLASKY_CREDENTIALS_CACHE_TIMEOUT秒, 命中时跳过查库和密码散列
+        """
+        key = hmac.new(current_app.config['SECRET_KEY'].encode('utf-8'),
+                       (email + '\0' + password).encode('utf-8'),
+                       hashlib.sha256).hexdigest()
+        snapshot = _credentials_cache.get(key)
+        if snapshot is not None and snapshot.is_current():
+            return snapshot
+        user = User.query.options(db.joinedload(User.role)) \
+            .filter_by(email=email).first()
+        if user is None:
+            return None
+        version = _auth_version(user.id)
+        # 密码错误不缓存, 每次都要计算散列
+        if not user.verify_password(password):
+            return None
+        snapshot = UserSnapshot(user, version)
+        _credentials_cache.set(
+            key, snapshot,
+            current_app.config['FLASKY_CREDENTIALS_CACHE_TIMEOUT'])
+        return snapshot
+
+    # noinspection PyUnusedLocal
+    @staticmethod
+    def on_updated(mapper, connection, target):
+        """ 角色/激活状态/邮箱/密码变化后, 缓存的认证结果作废 """
+        attrs = db.inspect(target).attrs
+        if any(attrs[name].history.has_changes()
+               for name in ('role_id', 'confirmed', 'email',
+                            'password_hash')):
+            _invalidate_auth_after_commit(target, target.id)
+
     @property
     def __repr__(self):
         return '<User %r>' % self.username
 
 
+db.event.listen(User, 'after_update', User.on_updated)
+db.event.listen(User, 'after_delete',
+                lambda mapper, connection, target:
+                _invalidate_auth_after_commit(target, target.id))
+# 角色权限变化, 全部作废
+db.event.listen(Role, 'after_update',
+                lambda mapper, connection, target:
+                _invalidate_auth_after_commit(target, None))
+
+
+# 认证缓存的版本号, 用户id -> 版本, None -> 全局版本
+# 作废时加一, 缓存项版本不一致即视为失效
+_auth_versions = {None: 0}
+_token_cache = TTLCache(maxsize=10000)
+_credentials_cache = TTLCache(maxsize=10000)
+
+
+# 当前用户的关注集合缓存, 用户id -> (版本, 升序id数组)
+# 本进程内的关注变化由Follow事件使版本加一, None为全局版本(批量写入时加一);
+# 其他进程的关注变化由users.followed_count与缓存个数比较发现, 见User.followed_ids
+_follow_versions = {None: 0}
+_follow_cache = TTLCache(maxsize=10000)
+
+
+def _follow_version(user_id):
+    return (_follow_versions[None], _follow_versions.get(user_id, 0))
+
+
+def _invalidate_follows(user_id):
+    _follow_versions[user_id] = _follow_versions.get(user_id, 0) + 1
+
+
+def _auth_version(user_id):
+    return (_auth_versions[None], _auth_versions.get(user_id, 0))
+
+
+def _invalidate_auth(user_id):
+    _auth_versions[user_id] = _auth_versions.get(user_id, 0) + 1
+
+
+def _invalidate_auth_after_commit(target, user_id):
+    """
+    flush时登记, 提交后才加版本号
+    提交前其他请求读到的仍是旧行, 若此时加版本号, 旧行会以新版本号缓存
+    """
+    db.object_session(target).info.setdefault(
+        'auth_invalidated', set()).add(user_id)
+
+
+def _on_auth_commit(session):
+    for user_id in session.info.pop('auth_invalidated', ()):
+        _invalidate_auth(user_id)
+
+
+def _on_auth_rollback(session):
+    session.info.pop('auth_invalidated', None)
+
+
+db.event.listen(SignallingSession, 'after_commit', _on_auth_commit)
+db.event.listen(SignallingSession, 'after_rollback', _on_auth_rollback)
+
+
+def _generate_auth_token(user_id, expiration):
+    s = Serializer(current_app.config['SECRET_KEY'], expires_in=expiration)
+    # 默认不转码为二进制数据, 但二进制在发送的邮件中会转成ascii码
+    return s.dumps({'id': user_id}).decode('ascii')
+
+
+class UserSnapshot(object):
+    """ API认证用户的轻量快照, 只含权限检查需要的字段 """
+    is_authenticated = True
+    is_active = True
+    is_anonymous = False
+
+    def __init__(self, user, version):
+        self.id = user.id
+        self.confirmed = user.confirmed
+        self.permissions = user.role.permissions \
+            if user.role is not None else None
+        self.version = version
+
+    def is_current(self):
+        return self.version == _auth_version(self.id)
+
+    def can(self, permissions):
+        return self.permissions is not None and \
+            (self.permissions & permissions) == permissions
+
+    def is_administrator(self):
+        return self.can(Permission.ADMINISTER)
+
+    def generate_auth_token(self, expiration):
+        return _generate_auth_token(self.id, expiration)
+
+    def __eq__(self, other):
+        if isinstance(other, (User, UserSnapshot)):
+            return self.id == other.id
+        return NotImplemented
+
+    def __ne__(self, other):
+        result = self.__eq__(other)
+        return result if result is NotImplemented else not result
+
+    def __hash__(self):
+        return hash(self.id)
+
+
 # 一致性考虑, 实现匿名用户的验证方法
 # noinspection PyUnusedLocal
 class AnonymousUser(AnonymousUserMixin):
@@ -376,7 +785,8 @@ login_manager.anonymous_user = AnonymousUser
 # 加载用户的回调函数
 @login_manager.user_loader
 def load_user(user_id):
-    return User.query.get(int(user_id))
+    # 每个请求都要检查权限, 角色一并取回
+    return User.query.options(db.joinedload(User.role)).get(int(user_id))
 
 
 class Post(db.Model):
@@ -387,6 +797,11 @@ class Post(db.Model):
     body_html = db.Column(db.Text)
     timestamp = db.Column(db.DateTime, index=True, default=datetime.utcnow)
     author_id = db.Column(db.Integer, db.ForeignKey('users.id'))
+    # 冗余评论计数, 由Comment的插入删除事件维护
+    comment_count = db.Column(db.Integer, default=0)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow,
+                           onupdate=datetime.utcnow)
+    __table_args__ = (db.Index('ix_posts_updated_at_id', 'updated_at', 'id'),)
     comments = db.relationship('Comment', backref='post', lazy='dynamic')
 
     @staticmethod
@@ -404,16 +819,63 @@ class Post(db.Model):
             db.session.add(p)
             db.session.commit()
 
+    @staticmethod
+    def recount():
+        """ 重新统计评论计数, 修正偏差, 返回修正的行数 """
+        posts = Post.__table__
+        return _fix_counter(posts, 'comment_count', db.select(
+            [db.func.count(Comment.id)]).where(Comment.post_id == posts.c.id))
+
+    # noinspection PyUnusedLocal
+    @staticmethod
+    def on_inserted(mapper, connection, target):
+        _increment(connection, User, target.author_id, 'post_count', 1)
+        TimelineEntry.fan_out(connection, target)
+        index_documents(connection, 'posts', [(target.id, target.body)])
+
+    # noinspection PyUnusedLocal
+    @staticmethod
+    def on_updated(mapper, connection, target):
+        """ 正文修改后更新搜索索引 """
+        if db.inspect(target).attrs.body.history.has_changes():
+            index_documents(connection, 'posts', [(target.id, target.body)])
+
+    # noinspection PyUnusedLocal
+    @staticmethod
+    def on_deleted(mapper, connection, target):
+        _increment(connection, User, target.author_id, 'post_count', -1)
+        entries = TimelineEntry.__table__
+        connection.execute(entries.delete().where(
+            entries.c.post_id == target.id))
+        remove_documents(connection, 'posts', [target.id])
+
+    @staticmethod
+    def insert_many(author_id, bodies):
+        """
+        同一作者批量发文章, 返回新文章id列表, 由调用者提交
+        不构造ORM对象, 不触发逐行事件, 计数/时间线/页面缓存在这里一次处理
+        """
+        now = datetime.utcnow()
+        mappings = [{'body': body, 'body_html': html, 'author_id': author_id,
+                     'timestamp': now, 'updated_at': now}
+                    for body, html in zip(bodies, renderer.render_many(
+                        bodies, 'post'))]
+        # 先更新计数, 使SQLite事务持有写锁再分配主键, 见_allocate_ids
+        users = User.__table__
+        db.session.execute(users.update().where(users.c.id == author_id)
+                           .values(post_count=users.c.post_count +
+                                   len(mappings)))
+        ids = _bulk_insert(Post, mappings)
+        TimelineEntry.fan_out_many(author_id, ids)
+        index_documents(db.session, 'posts', zip(ids, bodies))
+        mark_written(db.session, ['posts', 'users:%s' % author_id])
+        return ids
+
     # noinspection PyUnusedLocal
     @staticmethod
     def on_changed_body(target, value, oldvalue, initiator):
-        allowed_tags = ['a', 'abbr', 'acronym', 'b', 'blockquote', 'code',
-                        'em', 'i', 'li', 'ol', 'pre', 'strong', 'ul',
-                        'h1', 'h2', 'h3', 'p']
-        # linkify 将纯文本中的URL转换成适当的<a>
-        target.body_html = bleach.linkify(bleach.clean(
-            markdown(value, output_format='html'), tags=allowed_tags,
-            strip=True))
+        # 允许的标签见 rendering.PROFILES
+        target.body_html = renderer.render(value, 'post')
 
     def to_json(self):
         """ 文章的序列化字典, 为了转换成JSON"""
@@ -429,7 +891,7 @@ class Post(db.Model):
             'comments': url_for('api.get_post_comments', id=self.id,
                                 _external=True),
             # 评论数量并不是模型的属性, 不必一对一, 只是为了方便客户端使用
-            'comment_count': self.comments.count()
+            'comment_count': self.comment_count
         }
         return json_post
 
@@ -445,6 +907,9 @@ class Post(db.Model):
 # on_changed_body函数注册在body字段上, 是SQLAlchemy 'set' 事件的监听程序
 # 当类实例的body字段设了新值, 函数会自动调用 ?暂未体会到
 db.event.listen(Post.body, 'set', Post.on_changed_body)
+db.event.listen(Post, 'after_insert', Post.on_inserted)
+db.event.listen(Post, 'after_update', Post.on_updated)
+db.event.listen(Post, 'after_delete', Post.on_deleted)
 
 
 class Comment(db.Model):
@@ -455,20 +920,61 @@ class Comment(db.Model):
     body_html = db.Column(db.Text)
     timestamp = db.Column(db.DateTime, index=True, default=datetime.utcnow)
     disabled = db.Column(db.Boolean)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow,
+                           onupdate=datetime.utcnow)
+    __table_args__ = (db.Index('ix_comments_updated_at_id', 'updated_at',
+                               'id'),)
     author_id = db.Column(db.Integer, db.ForeignKey('users.id'))
     # 多的一侧定义外键
     post_id = db.Column(db.Integer, db.ForeignKey('posts.id'))
 
+    @staticmethod
+    def insert_many(post_id, author_id, bodies):
+        """ 同一作者对同一文章批量评论, 返回新评论id列表, 由调用者提交 """
+        now = datetime.utcnow()
+        mappings = [{'body': body, 'body_html': html, 'post_id': post_id,
+                     'author_id': author_id, 'timestamp': now,
+                     'updated_at': now}
+                    for body, html in zip(bodies, renderer.render_many(
+                        bodies, 'comment'))]
+        posts = Post.__table__
+        db.session.execute(posts.update().where(posts.c.id == post_id).values(
+            comment_count=posts.c.comment_count + len(mappings)))
+        ids = _bulk_insert(Comment, mappings)
+        index_documents(db.session, 'comments', zip(ids, bodies))
+        mark_written(db.session, ['posts:%s' % post_id,
+                                  'users:%s' % author_id])
+        return ids
+
     # noinspection PyUnusedLocal
     @staticmethod
     def on_changed_body(target, value, oldvalue, initiator):
         """ 评论修改触发body渲染body_html """
-        allowed_tags = ['a', 'abbr', 'acronym', 'b', 'code', 'em', 'i',
-                        'strong']
-        # linkify 将纯文本中的URL转换成适当的<a>
-        target.body_html = bleach.linkify(bleach.clean(
-            markdown(value, output_format='html'), tags=allowed_tags,
-            strip=True))
+        target.body_html = renderer.render(value, 'comment')
+
+    # noinspection PyUnusedLocal
+    @staticmethod
+    def on_inserted(mapper, connection, target):
+        _increment(connection, Post, target.post_id, 'comment_count', 1)
+        if not target.disabled:
+            index_documents(connection, 'comments',
+                            [(target.id, target.body)])
+
+    # noinspection PyUnusedLocal
+    @staticmethod
+    def on_updated(mapper, connection, target):
+        """ 正文修改或禁用/启用后更新搜索索引, 禁用的评论不可搜索 """
+        attrs = db.inspect(target).attrs
+        if attrs.body.history.has_changes() or \
+                attrs.disabled.history.has_changes():
+            index_documents(connection, 'comments', [
+                (target.id, None if target.disabled else target.body)])
+
+    # noinspection PyUnusedLocal
+    @staticmethod
+    def on_deleted(mapper, connection, target):
+        _increment(connection, Post, target.post_id, 'comment_count', -1)
+        remove_documents(connection, 'comments', [target.id])
 
     def to_json(self):
         """ API 评论 序列化字典, 转JSON用 """
@@ -492,3 +998,182 @@ class Comment(db.Model):
 
 
 db.event.listen(Comment.body, 'set', Comment.on_changed_body)
+db.event.listen(Comment, 'after_insert', Comment.on_inserted)
+db.event.listen(Comment, 'after_update', Comment.on_updated)
+db.event.listen(Comment, 'after_delete', Comment.on_deleted)
+
+# 搜索索引表不在metadata中, 随create_all/drop_all一起建立和删除
+db.event.listen(db.metadata, 'after_create', create_index)
+db.event.listen(db.metadata, 'before_drop', drop_index)
+
+
+class TimelineEntry(db.Model):
+    """ 首页时间线, 写入时分发, 每个关注者一行 """
+    __tablename__ = 'timeline_entries'
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'),
+                        primary_key=True)
+    post_id = db.Column(db.Integer, db.ForeignKey('posts.id'),
+                        primary_key=True)
+    # 冗余文章时间, 读取一页时间线只需扫描(user_id, timestamp)索引
+    timestamp = db.Column(db.DateTime)
+    __table_args__ = (db.Index('ix_timeline_entries_user_id_timestamp',
+                               'user_id', 'timestamp'),)
+
+    @staticmethod
+    def fan_out(connection, post):
+        """ 新文章分发到作者所有关注者的时间线 """
+        users = User.__table__
+        followers = connection.execute(
+            db.select([users.c.follower_count]).where(
+                users.c.id == post.author_id)).scalar() or 0
+        if followers > current_app.config['FLASKY_TIMELINE_FANOUT_THRESHOLD']:
+            # 关注者太多, 提交后由后台线程分批写入, 不阻塞当前请求
+            session = db.object_session(post)
+            session.info.setdefault('timeline_fan_out', []).append(post.id)
+            return
+        connection.execute(TimelineEntry._fan_out_insert([post.id]))
+
+    @staticmethod
+    def fan_out_many(author_id, post_ids):
+        """ 同一作者的多篇新文章一次分发, 由调用者提交 """
+        followers = db.session.query(User.follower_count).filter(
+            User.id == author_id).scalar() or 0
+        if followers > current_app.config['FLASKY_TIMELINE_FANOUT_THRESHOLD']:
+            db.session.info.setdefault('timeline_fan_out', []).extend(
+                post_ids)
+            return
+        db.session.execute(TimelineEntry._fan_out_insert(post_ids))
+
+    @staticmethod
+    def _fan_out_insert(post_ids, first=None, last=None):
+        """
+        INSERT ... SELECT, 可限定关注者id范围以分批
+        跳过已有的行: 分批分发期间新关注作者的用户已由backfill写入
+        """
+        follows = Follow.__table__
+        posts = Post.__table__
+        entries = TimelineEntry.__table__
+        exists = db.select([entries.c.post_id]) \
+            .where(entries.c.user_id == follows.c.follower_id) \
+            .where(entries.c.post_id == posts.c.id)
+        query = db.select([follows.c.follower_id, posts.c.id,
+                           posts.c.timestamp]) \
+            .where(follows.c.followed_id == posts.c.author_id) \
+            .where(posts.c.id.in_(post_ids)) \
+            .where(~db.exists(exists))
+        if first is not None:
+            query = query.where(follows.c.follower_id.between(first, last))
+        return TimelineEntry.__table__.insert().from_select(
+            ['user_id', 'post_id', 'timestamp'], query)
+
+    @staticmethod
+    def fan_out_batched(post_id):
+        """ 按关注者id分批分发, 每批单独提交 """
+        follows = Follow.__table__
+        batch = current_app.config['FLASKY_TIMELINE_FANOUT_BATCH']
+        author_id = db.session.query(Post.author_id).filter(
+            Post.id == post_id).scalar()
+        last = 0
+        while True:
+            ids = [row[0] for row in db.session.execute(
+                db.select([follows.c.follower_id])
+                .where(follows.c.followed_id == author_id)
+                .where(follows.c.follower_id > last)
+                .order_by(follows.c.follower_id).limit(batch))]
+            if not ids:
+                break
+            db.session.execute(
+                TimelineEntry._fan_out_insert([post_id], ids[0], ids[-1]))
+            db.session.commit()
+            last = ids[-1]
+
+    @staticmethod
+    def backfill(connection, follower_id, followed_id):
+        """ 关注后把被关注者的文章写入关注者的时间线 """
+        posts = Post.__table__
+        entries = TimelineEntry.__table__
+        exists = db.select([entries.c.post_id]) \
+            .where(entries.c.user_id == follower_id) \
+            .where(entries.c.post_id == posts.c.id)
+        query = db.select([db.literal(follower_id), posts.c.id,
+                           posts.c.timestamp]) \
+            .where(posts.c.author_id == followed_id) \
+            .where(~db.exists(exists))
+        connection.execute(entries.insert().from_select(
+            ['user_id', 'post_id', 'timestamp'], query))
+
+    @staticmethod
+    def prune(connection, follower_id, followed_id):
+        """ 取消关注后从时间线删除被关注者的文章 """
+        posts = Post.__table__
+        entries = TimelineEntry.__table__
+        connection.execute(entries.delete()
+                           .where(entries.c.user_id == follower_id)
+                           .where(entries.c.post_id.in_(
+                               db.select([posts.c.id]).where(
+                                   posts.c.author_id == followed_id))))
+
+    @staticmethod
+    def rebuild(batch=1000):
+        """
+        由Follow和Post重建全部时间线, 返回写入行数
+        按用户id分批, 每批在同一事务中删除并重新写入这些用户的时间线后提交,
+        其他请求始终读到完整的旧时间线或新时间线
+        """
+        users = User.__table__
+        follows = Follow.__table__
+        posts = Post.__table__
+        entries = TimelineEntry.__table__
+        total = 0
+        last = 0
+        while True:
+            ids = [row[0] for row in db.session.execute(
+                db.select([users.c.id]).where(users.c.id > last)
+                .order_by(users.c.id).limit(batch))]
+            if not ids:
+                break
+            # 范围内的id都要删除, 包括已删除用户留下的行
+            db.session.execute(entries.delete().where(
+                entries.c.user_id.between(last + 1, ids[-1])))
+            query = db.select([follows.c.follower_id, posts.c.id,
+                               posts.c.timestamp]) \
+                .where(follows.c.followed_id == posts.c.author_id) \
+                .where(follows.c.follower_id.between(ids[0], ids[-1]))
+            total += db.session.execute(entries.insert().from_select(
+                ['user_id', 'post_id', 'timestamp'], query)).rowcount
+            db.session.commit()
+            last = ids[-1]
+        db.session.execute(entries.delete().where(entries.c.user_id > last))
+        db.session.commit()
+        return total
+
+
+def fan_out_async(app, post_ids):
+    # 在不同的线程中执行, 因此需要手动激活app_context
+    with app.app_context():
+        for post_id in post_ids:
+            try:
+                TimelineEntry.fan_out_batched(post_id)
+            except Exception:
+                # 线程中的异常无人处理, 记录后继续分发其他文章
+                db.session.rollback()
+                app.logger.exception('timeline fan-out of post %s failed',
+                                     post_id)
+        db.session.remove()
+
+
+def on_session_commit(session):
+    """ 提交后启动后台分发 """
+    post_ids = session.info.pop('timeline_fan_out', None)
+    if post_ids:
+        app = current_app._get_current_object()
+        Thread(target=fan_out_async, args=[app, post_ids]).start()
+
+
+def on_session_rollback(session):
+    """ 回滚后丢弃未分发的文章 """
+    session.info.pop('timeline_fan_out', None)
+
+
+db.event.listen(SignallingSession, 'after_commit', on_session_commit)
+db.event.listen(SignallingSession, 'after_rollback', on_session_rollback)
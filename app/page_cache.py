@@ -0,0 +1,297 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# @Date     : 2026-10-18 19:20
+# @Author   : Bluethon (j5088794@gmail.com)
+# @Link     : http://github.com/bluethon
+
+"""
+匿名用户整页缓存
+
+首页, 用户页, 文章页的匿名GET请求按 协议+主机名+路径+查询字符串 缓存整个响应.
+渲染后session中的文章/评论/用户行作为页面标签(如 'posts:3'), 视图可另加集合标签;
+提交事务后按写入的行计算标签, 带这些标签的缓存全部失效.
+失效记录的是标签的失效时间, 缓存条目早于该时间即视为过期,
+所以文件后端可在多个gunicorn worker之间共享.
+未经ORM的写入(如最后访问时间)不触发失效, 由FLASKY_PAGE_CACHE_TIMEOUT兜底.
+失效时间只需保留一个缓存过期时间: 更早的条目此时已全部过期, 之后即可删除该标签.
+"""
+import hashlib
+import os
+import pickle
+import time
+from collections import OrderedDict
+from functools import wraps
+from threading import Lock
+
+from flask import current_app, has_app_context, request, session
+from flask_login import current_user
+from flask_sqlalchemy import SignallingSession
+from sqlalchemy import event
+
+from .cache import TTLCache
+
+
+# 写入一行时失效的标签, 按表名
+WRITE_TAGS = {
+    'posts': lambda post: ['posts:%s' % post.id, 'posts',
+                           'users:%s' % post.author_id],
+    # 评论数显示在作者的用户页
+    'comments': lambda comment: ['comments:%s' % comment.id,
+                                 'posts:%s' % comment.post_id,
+                                 'users:%s' % comment.author_id],
+    'users': lambda user: ['users:%s' % user.id],
+    # 关注数显示在用户页
+    'follows': lambda follow: ['users:%s' % follow.follower_id,
+                               'users:%s' % follow.followed_id],
+}
+# 渲染后session中这些表的行, 记为页面标签
+READ_TABLES = ('posts', 'comments', 'users')
+
+
+class MemoryBackend(object):
+    """ 进程内LRU """
+
+    def __init__(self, maxsize=1000, timeout=300):
+        self._entries = TTLCache(maxsize)
+        self.timeout = timeout
+        # 标签 -> 失效时间, 按失效时间先后排列
+        self._tags = OrderedDict()
+        self._lock = Lock()
+
+    def get(self, key):
+        return self._entries.get(key)
+
+    def set(self, key, entry, timeout):
+        self._entries.set(key, entry, timeout)
+
+    def invalidated_at(self, tags):
+        """ 标签中最近一次失效的时间 """
+        with self._lock:
+            return max([self._tags.get(tag, 0) for tag in tags] or [0])
+
+    def invalidate(self, tags, when):
+        with self._lock:
+            for tag in tags:
+                self._tags[tag] = when
+                self._tags.move_to_end(tag)
+            # 删除超过缓存时间的标签
+            while self._tags:
+                tag, at = next(iter(self._tags.items()))
+                if at > when - self.timeout:
+                    break
+                del self._tags[tag]
+
+    def clear(self):
+        self._entries.clear()
+        with self._lock:
+            self._tags.clear()
+
+
+class FileSystemBackend(object):
+    """ 文件缓存, 同一台机器上的多个进程共享 """
+
+    def __init__(self, directory, threshold=1000, timeout=300):
+        self.directory = directory
+        self.threshold = threshold
+        self.timeout = timeout
+        self._sets = 0
+        self._invalidations = 0
+        os.makedirs(os.path.join(directory, 'tags'), exist_ok=True)
+
+    def _path(self, *parts):
+        name = hashlib.sha1(parts[-1].encode('utf-8')).hexdigest()
+        return os.path.join(self.directory, *(parts[:-1] + (name,)))
+
+    @staticmethod
+    def _write(path, data):
+        # 先写临时文件再替换, 读者不会读到一半
+        tmp = '%s.%d.tmp' % (path, os.getpid())
+        with open(tmp, 'wb') as f:
+            f.write(data)
+        os.replace(tmp, path)
+
+    def get(self, key):
+        path = self._path(key)
+        try:
+            with open(path, 'rb') as f:
+                expires, entry = pickle.load(f)
+        except (OSError, EOFError, pickle.UnpicklingError):
+            return None
+        if expires <= time.time():
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            return None
+        return entry
+
+    def set(self, key, entry, timeout):
+        if timeout <= 0:
+            return
+        self._sets += 1
+        if self._sets % 100 == 0:
+            self._prune()
+        self._write(self._path(key),
+                    pickle.dumps((time.time() + timeout, entry)))
+
+    def _prune(self):
+        """ 条目超过threshold时删除最旧的一半 """
+        paths = [os.path.join(self.directory, name)
+                 for name in os.listdir(self.directory)
+                 if not name.endswith('.tmp') and name != 'tags']
+        if len(paths) <= self.threshold:
+            return
+        paths.sort(key=lambda path: os.path.getmtime(path))
+        for path in paths[:len(paths) // 2]:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+    def invalidated_at(self, tags):
+        latest = 0
+        for tag in tags:
+            try:
+                with open(self._path('tags', tag), 'rb') as f:
+                    latest = max(latest, float(f.read()))
+            except (OSError, ValueError):
+                pass
+        return latest
+
+    def invalidate(self, tags, when):
+        for tag in tags:
+            self._write(self._path('tags', tag), repr(when).encode('ascii'))
+        self._invalidations += 1
+        if self._invalidations % 100 == 0:
+            self._prune_tags(when - self.timeout)
+
+    def _prune_tags(self, before):
+        """ 删除早于before的标签文件 """
+        directory = os.path.join(self.directory, 'tags')
+        for name in os.listdir(directory):
+            path = os.path.join(directory, name)
+            try:
+                if os.path.getmtime(path) < before:
+                    os.remove(path)
+            except OSError:
+                pass
+
+    def clear(self):
+        for root, dirs, files in os.walk(self.directory):
+            for name in files:
+                os.remove(os.path.join(root, name))
+
+
+def _read_tags(session):
+    """ session中的行, 包括渲染前已加载的, 宁多勿少 """
+    tags = set()
+    for obj in session.identity_map.values():
+        tablename = getattr(obj, '__tablename__', None)
+        if tablename in READ_TABLES:
+            tags.add('%s:%s' % (tablename, obj.id))
+    return tags
+
+
+def _collect_tags(session, flush_context):
+    tags = session.info.setdefault('page_cache_tags', set())
+    for obj in list(session.new) + list(session.dirty) + \
+            list(session.deleted):
+        tablename = getattr(obj, '__tablename__', None)
+        if tablename in WRITE_TAGS:
+            tags.update(WRITE_TAGS[tablename](obj))
+
+
+def mark_written(session, tags):
+    """ 不经过flush的批量写入, 手动登记提交后要失效的标签 """
+    session.info.setdefault('page_cache_tags', set()).update(tags)
+
+
+def _invalidate(session):
+    tags = session.info.pop('page_cache_tags', None)
+    if tags and has_app_context():
+        backend = current_app.extensions.get('page_cache')
+        if backend is not None:
+            backend.invalidate(tags, time.time())
+
+
+def _discard(session):
+    session.info.pop('page_cache_tags', None)
+
+
+class PageCache(object):
+    """ 用法同其他扩展, create_app中init_app """
+
+    def __init__(self, app=None):
+        self._registered = False
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        backend = app.config['FLASKY_PAGE_CACHE_TYPE']
+        if backend == 'filesystem':
+            app.extensions['page_cache'] = FileSystemBackend(
+                app.config['FLASKY_PAGE_CACHE_DIR'],
+                app.config['FLASKY_PAGE_CACHE_SIZE'],
+                app.config['FLASKY_PAGE_CACHE_TIMEOUT'])
+        elif backend == 'memory':
+            app.extensions['page_cache'] = MemoryBackend(
+                app.config['FLASKY_PAGE_CACHE_SIZE'],
+                app.config['FLASKY_PAGE_CACHE_TIMEOUT'])
+        if not self._registered:
+            event.listen(SignallingSession, 'after_flush', _collect_tags)
+            event.listen(SignallingSession, 'after_commit', _invalidate)
+            event.listen(SignallingSession, 'after_rollback', _discard)
+            self._registered = True
+
+    @property
+    def backend(self):
+        return current_app.extensions.get('page_cache')
+
+    @staticmethod
+    def cacheable():
+        """ 匿名的GET请求, 且没有待显示的flash消息 """
+        return request.method == 'GET' and \
+            not current_user.is_authenticated and \
+            not session.get('_flashes')
+
+    def cached(self, *tags):
+        """ 视图修饰器, tags为页面额外依赖的集合标签, 如首页的'posts' """
+        def decorator(f):
+            @wraps(f)
+            def decorated_function(*args, **kwargs):
+                backend = self.backend
+                if backend is None or not self.cacheable():
+                    return f(*args, **kwargs)
+                # 头像地址随协议不同, 完整URL随主机名不同
+                key = '%s://%s%s' % (request.scheme, request.host,
+                                     request.full_path)
+                entry = backend.get(key)
+                if entry is not None and \
+                        backend.invalidated_at(entry['tags']) < \
+                        entry['created']:
+                    return current_app.response_class(
+                        entry['body'], status=entry['status'],
+                        mimetype=entry['mimetype'])
+                # 本模块在app/__init__中db创建前导入
+                from . import db
+
+                # 开始时间作为条目时间, 渲染期间的写入也会使其失效
+                created = time.time()
+                response = current_app.make_response(f(*args, **kwargs))
+                page_tags = _read_tags(db.session).union(tags)
+                if response.status_code == 200 and not session.modified \
+                        and 'Set-Cookie' not in response.headers:
+                    backend.set(key, {
+                        'created': created,
+                        'tags': sorted(page_tags),
+                        'status': response.status_code,
+                        'mimetype': response.mimetype,
+                        'body': response.get_data(),
+                    }, current_app.config['FLASKY_PAGE_CACHE_TIMEOUT'])
+                return response
+            return decorated_function
+        return decorator
+
+    def clear(self):
+        if self.backend is not None:
+            self.backend.clear()
@@ -0,0 +1,174 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# @Date     : 2026-10-18 13:20
+# @Author   : Bluethon (j5088794@gmail.com)
+# @Link     : http://github.com/bluethon
+
+"""
+游标(键集)分页
+
+OFFSET分页每页都要跳过前面所有行并执行一次COUNT(*), 越往后越慢
+游标分页记住上一页最后一行的(timestamp, id), 下一页从索引处直接开始
+"""
+import json
+import math
+from base64 import urlsafe_b64encode, urlsafe_b64decode
+from datetime import datetime
+
+from flask import current_app, request, url_for
+
+from . import db
+from .cache import TTLCache
+from .exceptions import ValidationError
+
+
+CURSOR_TIME_FORMAT = '%Y-%m-%dT%H:%M:%S.%f'
+
+
+def encode_cursor(direction, values):
+    """ 方向和排序键值编码为不透明的游标字符串 """
+    values = [v.strftime(CURSOR_TIME_FORMAT) if isinstance(v, datetime)
+              else v for v in values]
+    data = json.dumps([direction, values], separators=(',', ':'))
+    return urlsafe_b64encode(data.encode('utf-8')).decode('ascii').rstrip('=')
+
+
+def _cursor_value(column, value):
+    """ 按列类型还原游标中的值, 类型不符抛出TypeError/ValueError """
+    if isinstance(column.type, db.DateTime):
+        return datetime.strptime(value, CURSOR_TIME_FORMAT)
+    if isinstance(column.type, (db.Integer, db.Float)) and \
+            (isinstance(value, bool) or
+             not isinstance(value, (int, float))):
+        raise TypeError('not a number')
+    # JSON的Infinity/NaN或超出范围的1e400
+    if isinstance(value, float) and not math.isfinite(value):
+        raise ValueError('not a finite number')
+    if isinstance(column.type, db.Integer) and value != int(value):
+        raise ValueError('not an integer')
+    return value
+
+
+def decode_cursor(cursor, columns):
+    """ 解码游标, 格式或类型不对抛出ValueError """
+    try:
+        data = urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        direction, values = json.loads(data.decode('utf-8'))
+        if direction not in ('next', 'prev') or \
+                not isinstance(values, list) or len(values) != len(columns):
+            raise ValueError('invalid cursor')
+        return direction, [_cursor_value(c, v)
+                           for c, v in zip(columns, values)]
+    except (TypeError, ValueError, OverflowError, UnicodeError):
+        raise ValueError('invalid cursor')
+
+
+def _beyond(columns, values, ascending):
+    """ 排在游标之后的行, (a, b) > (va, vb) 即 a > va or (a = va and b > vb) """
+    column, value = columns[0], values[0]
+    after = column > value if ascending else column < value
+    if len(columns) == 1:
+        return after
+    return db.or_(after, db.and_(column == value,
+                                 _beyond(columns[1:], values[1:], ascending)))
+
+
+class CursorPagination(object):
+    """
+    键集分页结果, 属性与Flask-SQLAlchemy的Pagination对应
+    columns 排序键, 最后一列须唯一, 如 (Post.timestamp, Post.id)
+    key     从结果行取排序键值, 默认按列名取属性
+    """
+
+    def __init__(self, query, columns, cursor, per_page, ascending=False,
+                 key=None, error_out=False):
+        self.per_page = per_page
+        self.cursor = cursor
+        direction, values = 'next', None
+        if cursor:
+            try:
+                direction, values = decode_cursor(cursor, columns)
+            except ValueError:
+                if error_out:
+                    raise ValidationError('invalid cursor')
+        backwards = direction == 'prev'
+        # 向前翻页时反向排序, 取到后再倒转
+        forward = ascending != backwards
+        query = query.order_by(None).order_by(
+            *[c.asc() if forward else c.desc() for c in columns])
+        if values is not None:
+            query = query.filter(_beyond(columns, values, forward))
+        # 多取一行判断是否还有更多
+        items = query.limit(per_page + 1).all()
+        more = len(items) > per_page
+        items = items[:per_page]
+        if backwards:
+            items.reverse()
+            has_prev, has_next = more, True
+        else:
+            has_prev, has_next = values is not None, more
+        self.items = items
+        if key is None:
+            def key(item):
+                return tuple(getattr(item, c.key) for c in columns)
+        self.prev_cursor = encode_cursor('prev', key(items[0])) \
+            if has_prev and items else None
+        self.next_cursor = encode_cursor('next', key(items[-1])) \
+            if has_next and items else None
+
+    @property
+    def has_prev(self):
+        return self.prev_cursor is not None
+
+    @property
+    def has_next(self):
+        return self.next_cursor is not None
+
+
+def paginate(query, columns, per_page, ascending=False, key=None,
+             error_out=False):
+    """
+    请求带page参数时沿用OFFSET分页(返回Pagination), 否则使用游标分页
+    两种方式排序一致
+    """
+    page = request.args.get('page', type=int)
+    if page is not None:
+        return query.order_by(None).order_by(
+            *[c.asc() if ascending else c.desc() for c in columns]).paginate(
+            page, per_page=per_page, error_out=False)
+    return CursorPagination(query, columns, request.args.get('cursor'),
+                            per_page, ascending=ascending, key=key,
+                            error_out=error_out)
+
+
+def pagination_urls(pagination, endpoint, **kwargs):
+    """ API 上一页/下一页的完整URL """
+    prev = next = None
+    if isinstance(pagination, CursorPagination):
+        if pagination.has_prev:
+            prev = url_for(endpoint, cursor=pagination.prev_cursor,
+                           _external=True, **kwargs)
+        if pagination.has_next:
+            next = url_for(endpoint, cursor=pagination.next_cursor,
+                           _external=True, **kwargs)
+        return prev, next
+    if pagination.has_prev:
+        prev = url_for(endpoint, page=pagination.prev_num, _external=True,
+                       **kwargs)
+    if pagination.has_next:
+        next = url_for(endpoint, page=pagination.next_num, _external=True,
+                       **kwargs)
+    return prev, next
+
+
+_counts = TTLCache(maxsize=10000)
+
+
+def cached_count(key, query):
+    """ 总数缓存FLASKY_COUNT_CACHE_TIMEOUT秒, 避免每页一次COUNT(*) """
+    count = _counts.get(key)
+    if count is None:
+        count = query.order_by(None).count()
+        _counts.set(key, count,
+                    current_app.config['FLASKY_COUNT_CACHE_TIMEOUT'])
+    return count
@@ -0,0 +1,169 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# @Date     : 2026-10-18 18:10
+# @Author   : Bluethon (j5088794@gmail.com)
+# @Link     : http://github.com/bluethon
+
+"""
+SQL语句抽样统计
+
+代替SQLALCHEMY_RECORD_QUERIES(每条语句都保存语句, 参数和调用栈).
+挂在engine事件上, 每条语句只计时; 按FLASKY_DB_STATS_SAMPLE_RATE抽样,
+超过FLASKY_SLOW_DB_QUERY_TIME的总是记录并写日志.
+语句去掉字面量后作为指纹, 按指纹汇总次数和耗时, 只保留总耗时最多的若干条.
+抽中的语句按 1/抽样比例 计入次数和总耗时, 汇总是对全部语句的估计值;
+慢查询全部记录, 按1计入, 慢查询次数是准确值.
+各进程定期把汇总写到FLASKY_DB_STATS_DIR下, 由 manage.py dbstats 合并查看.
+"""
+import atexit
+import json
+import logging
+import os
+import random
+import re
+import time
+from threading import Lock
+
+from flask import current_app, has_app_context
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+
+logger = logging.getLogger(__name__)
+
+_normalizers = [
+    (re.compile(r"'(?:[^']|'')*'"), '?'),                 # 字符串
+    (re.compile(r'\b\d+(?:\.\d+)?\b'), '?'),              # 数字
+    (re.compile(r'%\(\w+\)s|:\w+|\$\d+|%s'), '?'),        # 命名/位置参数
+    (re.compile(r'\(\s*\?(?:\s*,\s*\?)*\s*\)'), '(?+)'),  # IN (?, ?, ...)
+    (re.compile(r'\s+'), ' '),
+]
+
+
+def fingerprint(statement):
+    """ 去掉字面量和参数, 同类语句归为一条 """
+    for pattern, repl in _normalizers:
+        statement = pattern.sub(repl, statement)
+    return statement.strip()
+
+
+class QueryStats(object):
+    """ 用法同其他扩展, create_app中init_app """
+
+    def __init__(self, app=None):
+        self.sample_rate = 0
+        self.slow_time = None
+        self.max_size = 1000
+        self.directory = None
+        self.flush_interval = 60
+        # 指纹 -> [次数, 总耗时, 最长耗时, 慢查询次数]
+        self.stats = {}
+        self._fingerprints = {}
+        self._last_flush = time.time()
+        self._lock = Lock()
+        self._registered = False
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.sample_rate = app.config['FLASKY_DB_STATS_SAMPLE_RATE']
+        self.slow_time = app.config['FLASKY_SLOW_DB_QUERY_TIME']
+        self.max_size = app.config['FLASKY_DB_STATS_SIZE']
+        self.directory = app.config['FLASKY_DB_STATS_DIR']
+        self.flush_interval = app.config['FLASKY_DB_STATS_FLUSH_INTERVAL']
+        if not self._registered:
+            event.listen(Engine, 'before_cursor_execute', self._before)
+            event.listen(Engine, 'after_cursor_execute', self._after)
+            atexit.register(self.flush)
+            self._registered = True
+
+    @staticmethod
+    def _before(conn, cursor, statement, parameters, context, executemany):
+        context._query_stats_start = time.perf_counter()
+
+    def _after(self, conn, cursor, statement, parameters, context,
+               executemany):
+        start = getattr(context, '_query_stats_start', None)
+        if start is None:
+            return
+        duration = time.perf_counter() - start
+        slow = duration >= self.slow_time
+        if not slow and (self.sample_rate <= 0 or
+                         random.random() >= self.sample_rate):
+            return
+        if slow:
+            # 有app上下文时写入app日志, 与原慢查询日志一致
+            log = current_app.logger if has_app_context() else logger
+            log.warning('Slow query: %s\nParameters: %s\nDuration: %fs\n'
+                        % (statement, parameters, duration))
+        self.record(statement, duration, slow,
+                    1.0 if slow else 1.0 / self.sample_rate)
+
+    def record(self, statement, duration, slow=False, weight=1.0):
+        """ weight 这条语句代表的语句数, 抽样时为抽样比例的倒数 """
+        key = self._fingerprints.get(statement)
+        if key is None:
+            key = fingerprint(statement)
+            if len(self._fingerprints) < 10 * self.max_size:
+                self._fingerprints[statement] = key
+        with self._lock:
+            row = self.stats.get(key)
+            if row is None:
+                if len(self.stats) >= self.max_size:
+                    self._evict()
+                row = self.stats[key] = [0, 0.0, 0.0, 0]
+            row[0] += weight
+            row[1] += duration * weight
+            row[2] = max(row[2], duration)
+            row[3] += slow
+            due = time.time() - self._last_flush >= self.flush_interval
+        if due and self.directory:
+            self.flush()
+
+    def _evict(self):
+        """ 淘汰总耗时最少的一半, 调用者持有锁 """
+        keep = sorted(self.stats.items(), key=lambda item: item[1][1],
+                      reverse=True)[:self.max_size // 2]
+        self.stats = dict(keep)
+
+    def top(self, n=20):
+        """ 按总耗时排序的前n条 [(指纹, 次数, 总耗时, 最长耗时, 慢查询次数)] """
+        with self._lock:
+            rows = [(key,) + tuple(row) for key, row in self.stats.items()]
+        return sorted(rows, key=lambda row: row[2], reverse=True)[:n]
+
+    def reset(self):
+        with self._lock:
+            self.stats.clear()
+
+    def flush(self):
+        """ 本进程的汇总写入 FLASKY_DB_STATS_DIR/<pid>.json """
+        with self._lock:
+            self._last_flush = time.time()
+            data = dict((key, list(row)) for key, row in self.stats.items())
+        if not self.directory or not data:
+            return
+        os.makedirs(self.directory, exist_ok=True)
+        path = os.path.join(self.directory, '%d.json' % os.getpid())
+        with open(path + '.tmp', 'w') as f:
+            json.dump({'sample_rate': self.sample_rate, 'stats': data}, f)
+        os.replace(path + '.tmp', path)
+
+    @staticmethod
+    def load(directory):
+        """ 合并各进程写入的汇总, 返回 {指纹: [次数, 总耗时, 最长耗时, 慢查询次数]} """
+        merged = {}
+        if not os.path.isdir(directory):
+            return merged
+        for name in os.listdir(directory):
+            if not name.endswith('.json'):
+                continue
+            with open(os.path.join(directory, name)) as f:
+                stats = json.load(f)['stats']
+            for key, row in stats.items():
+                total = merged.setdefault(key, [0, 0.0, 0.0, 0])
+                total[0] += row[0]
+                total[1] += row[1]
+                total[2] = max(total[2], row[2])
+                total[3] += row[3]
+        return merged
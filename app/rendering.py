@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# @Date     : 2026-10-18 14:40
+# @Author   : Bluethon (j5088794@gmail.com)
+# @Link     : http://github.com/bluethon
+
+"""
+Markdown渲染服务
+
+文章/评论body -> markdown -> bleach.clean -> bleach.linkify -> body_html
+过滤规则按profile只构建一次, 渲染结果按(profile, body)的哈希缓存, LRU淘汰
+"""
+import hashlib
+from collections import OrderedDict
+from threading import Lock, local
+
+import bleach
+from markdown import Markdown
+
+
+# 各profile允许的HTML标签
+PROFILES = {
+    'post': ['a', 'abbr', 'acronym', 'b', 'blockquote', 'code', 'em', 'i',
+             'li', 'ol', 'pre', 'strong', 'ul', 'h1', 'h2', 'h3', 'p'],
+    'comment': ['a', 'abbr', 'acronym', 'b', 'code', 'em', 'i', 'strong'],
+}
+
+
+class Renderer(object):
+    """ 渲染服务, 用法同其他扩展, create_app中init_app """
+
+    def __init__(self, app=None, maxsize=1024):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._cache = OrderedDict()
+        self._lock = Lock()
+        # Markdown实例不是线程安全的, 每个线程一个
+        self._local = local()
+        self._sanitizers = dict((name, self._build_sanitizer(tags))
+                                for name, tags in PROFILES.items())
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.maxsize = app.config['FLASKY_RENDER_CACHE_SIZE']
+
+    @staticmethod
+    def _build_sanitizer(tags):
+        """ 构建过滤函数, bleach 2.0以上复用Cleaner/Linker """
+        if hasattr(bleach, 'Cleaner'):
+            cleaner = bleach.Cleaner(tags=tags, strip=True)
+            linker = bleach.Linker()
+            return lambda html: linker.linkify(cleaner.clean(html))
+        # linkify 将纯文本中的URL转换成适当的<a>
+        return lambda html: bleach.linkify(bleach.clean(html, tags=tags,
+                                                        strip=True))
+
+    @staticmethod
+    def key(body, profile):
+        """ 内容寻址的缓存键, 标签列表变化后自然失效 """
+        data = '\0'.join([profile, ','.join(PROFILES[profile]), body])
+        return hashlib.sha1(data.encode('utf-8')).hexdigest()
+
+    def _render(self, body, profile):
+        md = getattr(self._local, 'markdown', None)
+        if md is None:
+            md = self._local.markdown = Markdown(output_format='html')
+        return self._sanitizers[profile](md.reset().convert(body))
+
+    def render(self, body, profile):
+        """ 渲染单个body, 命中缓存直接返回 """
+        return self.render_many([body], profile)[0]
+
+    def render_many(self, bodies, profile):
+        """ 批量渲染, 相同内容只渲染一次, 返回与bodies顺序一致的列表 """
+        keys = [self.key(body, profile) for body in bodies]
+        results = {}
+        with self._lock:
+            for key in keys:
+                if key in self._cache:
+                    self._cache.move_to_end(key)
+                    results[key] = self._cache[key]
+        missing = {}
+        for key, body in zip(keys, bodies):
+            if key not in results and key not in missing:
+                missing[key] = self._render(body, profile)
+        with self._lock:
+            self.hits += len(keys) - len(missing)
+            self.misses += len(missing)
+            for key, html in missing.items():
+                self._cache[key] = html
+                self._cache.move_to_end(key)
+            while len(self._cache) > self.maxsize:
+                self._cache.popitem(last=False)
+        results.update(missing)
+        return [results[key] for key in keys]
+
+    def clear(self):
+        with self._lock:
+            self._cache.clear()
+            self.hits = self.misses = 0
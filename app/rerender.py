@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# @Date     : 2026-10-18 15:10
+# @Author   : Bluethon (j5088794@gmail.com)
+# @Link     : http://github.com/bluethon
+
+"""
+批量重新渲染body_html
+
+修改允许的标签或升级Markdown后使用, 按主键分块读取(id, body),
+多进程渲染, 批量UPDATE写回, 不经过ORM, 内存占用与总行数无关
+写回时更新updated_at(片段缓存键和API的ETag依赖它), 并使整页缓存失效
+"""
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+
+from . import db
+from .page_cache import mark_written
+from .rendering import Renderer
+
+
+_renderer = None
+
+
+def render_chunk(profile, rows):
+    """ 渲染一块 [(id, body)], 返回 [(id, body_html)], 在子进程中执行 """
+    global _renderer
+    if _renderer is None:
+        _renderer = Renderer()
+    ids = [row[0] for row in rows]
+    bodies = [row[1] or '' for row in rows]
+    return list(zip(ids, _renderer.render_many(bodies, profile)))
+
+
+def _chunks(table, chunk_size, since=None, start_after=0):
+    """ 按主键顺序分块读取 """
+    last = start_after
+    while True:
+        query = db.select([table.c.id, table.c.body]) \
+            .where(table.c.id > last).order_by(table.c.id).limit(chunk_size)
+        if since is not None:
+            query = query.where(table.c.timestamp >= since)
+        rows = [tuple(row) for row in db.session.execute(query)]
+        if not rows:
+            return
+        yield rows
+        last = rows[-1][0]
+
+
+def rerender_table(model, profile, chunk_size=1000, workers=None,
+                   since=None, start_after=0, callback=None):
+    """
+    重新渲染model表的body_html, 返回处理的行数
+    workers     进程数, 0或1时在当前进程渲染
+    since       只处理timestamp不早于此时间的行
+    start_after 从此id之后开始, 用于中断后继续
+    callback    每块提交后调用 callback(last_id, done, total)
+    """
+    table = model.__table__
+    total_query = db.select([db.func.count(table.c.id)]).where(
+        table.c.id > start_after)
+    if since is not None:
+        total_query = total_query.where(table.c.timestamp >= since)
+    total = db.session.execute(total_query).scalar()
+    update = table.update().where(table.c.id == db.bindparam('_id')) \
+        .values(body_html=db.bindparam('_html'),
+                updated_at=db.bindparam('_now'))
+    done = 0
+
+    def finish(rows, results):
+        nonlocal done
+        now = datetime.utcnow()
+        db.session.execute(update, [{'_id': id, '_html': html, '_now': now}
+                                    for id, html in results])
+        mark_written(db.session, ['%s:%s' % (table.name, id)
+                                  for id, html in results])
+        db.session.commit()
+        done += len(rows)
+        if callback:
+            callback(rows[-1][0], done, total)
+
+    chunks = _chunks(table, chunk_size, since, start_after)
+    if workers is not None and workers <= 1:
+        for rows in chunks:
+            finish(rows, render_chunk(profile, rows))
+        return done
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        # 按提交顺序写回, 保证断点之前的行全部完成
+        # 最多同时在途 2倍进程数 个块, 限制内存
+        window = 2 * (workers or os.cpu_count() or 1)
+        pending = deque()
+        for rows in chunks:
+            pending.append((rows, executor.submit(render_chunk, profile,
+                                                  rows)))
+            if len(pending) >= window:
+                rows, future = pending.popleft()
+                finish(rows, future.result())
+        while pending:
+            rows, future = pending.popleft()
+            finish(rows, future.result())
+    return done
@@ -0,0 +1,260 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# @Date     : 2026-10-18 22:20
+# @Author   : Bluethon (j5088794@gmail.com)
+# @Link     : http://github.com/bluethon
+
+"""
+文章和评论的全文搜索
+
+每种内容一张索引表 search_posts / search_comments, 以文章/评论id为键:
+SQLite 使用FTS5虚拟表(rowid即id), 按bm25排序, SQLite未编译FTS5时不建索引, 搜索无结果;
+PostgreSQL 存tsvector并建GIN索引, 按ts_rank排序.
+索引由模型的插入/修改/删除事件在同一事务中更新(见models), 禁用的评论不进索引.
+不经过事件的批量写入直接调用index_documents, 全量重建用 manage.py reindex,
+重建时写入新表, 完成后替换, 搜索不会看到只建了一部分的索引.
+"""
+import re
+from datetime import datetime, timedelta
+from weakref import WeakKeyDictionary
+
+from flask import current_app, has_app_context
+
+from . import db
+from .pagination import paginate
+
+
+KINDS = ('posts', 'comments')
+# 只取词, 引号和运算符不传给数据库, 避免查询语法错误
+_word = re.compile(r'\w+', re.UNICODE)
+MAX_TERMS = 16
+REINDEX_MARGIN = timedelta(minutes=1)
+
+
+def terms(q):
+    return _word.findall(q or '')[:MAX_TERMS]
+
+
+class SQLiteBackend(object):
+    """ FTS5, 多个词之间为AND """
+    create = ["CREATE VIRTUAL TABLE IF NOT EXISTS %(table)s "
+              "USING fts5(body, tokenize='porter unicode61')"]
+    # 合并批量写入产生的索引段
+    optimize = ["INSERT INTO %(table)s(%(table)s) VALUES('optimize')"]
+    drop = 'DROP TABLE IF EXISTS %(table)s'
+    # 补写和替换期间阻止其他写入; SQLite第一条写语句即取得写锁
+    lock = []
+    # 重建的表替换正在使用的表, FTS5虚拟表支持改名
+    swap = ['DROP TABLE IF EXISTS search_%(kind)s',
+            'ALTER TABLE %(table)s RENAME TO search_%(kind)s']
+    insert = 'INSERT INTO %(table)s (rowid, body) VALUES (:id, :body)'
+    insert_from = 'INSERT INTO %(table)s (rowid, body) ' \
+                  'SELECT id, body FROM %(kind)s WHERE %(where)s'
+    delete = 'DELETE FROM %(table)s WHERE rowid = :id'
+    delete_where = 'DELETE FROM %(table)s WHERE rowid IN ' \
+                   '(SELECT id FROM %(kind)s WHERE %(where)s)'
+    delete_missing = 'DELETE FROM %(table)s WHERE rowid NOT IN ' \
+                     '(SELECT id FROM %(kind)s)'
+    hits = 'SELECT rowid AS doc_id, -bm25(%(table)s) AS score ' \
+           'FROM %(table)s WHERE %(table)s MATCH :q'
+
+    @staticmethod
+    def match(words):
+        return ' '.join('"%s"' % word for word in words)
+
+
+class PostgreSQLBackend(object):
+    """ tsvector + GIN, 分词配置为FLASKY_SEARCH_CONFIG """
+    create = ['CREATE TABLE IF NOT EXISTS %(table)s '
+              '(id INTEGER PRIMARY KEY, document TSVECTOR NOT NULL)']
+    # 批量写入后再建GIN索引, 比逐行维护快
+    optimize = ['CREATE INDEX IF NOT EXISTS ix_%(table)s_document '
+                'ON %(table)s USING GIN (document)']
+    drop = 'DROP TABLE IF EXISTS %(table)s'
+    lock = ['LOCK TABLE %(kind)s IN SHARE MODE']
+    # 索引已在新表上建好, 改名后与create_index建的同名
+    swap = ['DROP TABLE IF EXISTS search_%(kind)s',
+            'ALTER TABLE %(table)s RENAME TO search_%(kind)s',
+            'ALTER INDEX %(table)s_pkey RENAME TO search_%(kind)s_pkey',
+            'ALTER INDEX ix_%(table)s_document '
+            'RENAME TO ix_search_%(kind)s_document']
+    insert = 'INSERT INTO %(table)s (id, document) VALUES ' \
+             '(:id, to_tsvector(CAST(:config AS regconfig), :body))'
+    insert_from = 'INSERT INTO %(table)s (id, document) ' \
+                  'SELECT id, to_tsvector(CAST(:config AS regconfig), ' \
+                  "COALESCE(body, '')) FROM %(kind)s WHERE %(where)s"
+    delete = 'DELETE FROM %(table)s WHERE id = :id'
+    delete_where = 'DELETE FROM %(table)s WHERE id IN ' \
+                   '(SELECT id FROM %(kind)s WHERE %(where)s)'
+    delete_missing = 'DELETE FROM %(table)s WHERE NOT EXISTS ' \
+                     '(SELECT 1 FROM %(kind)s WHERE %(kind)s.id = %(table)s.id)'
+    hits = 'SELECT id AS doc_id, ts_rank(document, query) AS score ' \
+           'FROM %(table)s, ' \
+           'plainto_tsquery(CAST(:config AS regconfig), :q) AS query ' \
+           'WHERE document @@ query'
+
+    @staticmethod
+    def match(words):
+        return ' '.join(words)
+
+
+BACKENDS = {'sqlite': SQLiteBackend, 'postgresql': PostgreSQLBackend}
+
+
+# 引擎 -> SQLite是否编译了FTS5, 每个引擎只检查一次
+_fts5 = WeakKeyDictionary()
+
+
+def _has_fts5(connection):
+    """ 没有FTS5时建虚拟表会失败, 记录警告, 索引操作全部跳过 """
+    engine = getattr(connection, 'engine', connection)
+    if engine not in _fts5:
+        # 只读查询, 不影响调用者的事务
+        _fts5[engine] = bool(connection.execute(
+            "SELECT sqlite_compileoption_used('ENABLE_FTS5')").scalar())
+        if not _fts5[engine] and has_app_context():
+            current_app.logger.warning(
+                'SQLite was built without FTS5, full-text search is disabled')
+    return _fts5[engine]
+
+
+def _backend(connection):
+    """ 不支持的数据库返回None, 索引操作全部跳过 """
+    if not hasattr(connection, 'dialect'):
+        # Session
+        connection = connection.get_bind()
+    backend = BACKENDS.get(connection.dialect.name)
+    if backend is SQLiteBackend and not _has_fts5(connection):
+        return None
+    return backend
+
+
+def _names(kind, table=None, where=None):
+    """ 语句中的名称: kind内容表, table索引表(默认search_<kind>) """
+    return {'kind': kind, 'table': table or 'search_' + kind, 'where': where}
+
+
+def _params(backend, **params):
+    if backend is PostgreSQLBackend:
+        params['config'] = current_app.config['FLASKY_SEARCH_CONFIG']
+    return params
+
+
+# noinspection PyUnusedLocal
+def create_index(target, connection, **kwargs):
+    """ metadata的after_create事件, 与create_all一起建索引表 """
+    backend = _backend(connection)
+    if backend is None:
+        return
+    for kind in KINDS:
+        for statement in backend.create + backend.optimize:
+            connection.execute(statement % _names(kind))
+
+
+# noinspection PyUnusedLocal
+def drop_index(target, connection, **kwargs):
+    """ metadata的before_drop事件 """
+    backend = _backend(connection)
+    if backend is not None:
+        for kind in KINDS:
+            connection.execute(backend.drop % _names(kind))
+
+
+def remove_documents(connection, kind, ids):
+    backend = _backend(connection)
+    if backend is not None and ids:
+        connection.execute(db.text(backend.delete % _names(kind)),
+                           [{'id': id} for id in ids])
+
+
+def index_documents(connection, kind, rows):
+    """
+    写入或更新索引 rows为[(id, body)], body为None的只删除
+    connection 可以是Connection或Session, 随调用者的事务提交
+    """
+    backend = _backend(connection)
+    if backend is None:
+        return
+    rows = list(rows)
+    remove_documents(connection, kind, [id for id, body in rows])
+    params = [_params(backend, id=id, body=body) for id, body in rows
+              if body is not None]
+    if params:
+        connection.execute(db.text(backend.insert % _names(kind)), params)
+
+
+def reindex(kind, batch=10000, callback=None):
+    """
+    重建一种内容的索引, 返回写入行数
+    写入新表search_<kind>_new, 按id范围分批 INSERT ... SELECT, 每批提交,
+    搜索期间仍使用旧表; 最后在一个事务中补上重建期间修改/新增/删除的行, 再替换旧表
+    callback(last_id, done) 每批提交后调用
+    """
+    backend = _backend(db.session)
+    if backend is None:
+        return 0
+    table = db.metadata.tables[kind]
+    new = 'search_%s_new' % kind
+    where = 'id BETWEEN :first AND :last'
+    # 重建期间修改过的行(updated_at), 以及开始后新增的行;
+    # 开始时未提交的事务, 其updated_at早于开始时间, 留出余量
+    changed = '(updated_at >= :since OR id > :last)'
+    params = _params(backend, since=datetime.utcnow() - REINDEX_MARGIN)
+    searchable = ''
+    if kind == 'comments':
+        # 禁用的评论不可搜索
+        searchable = ' AND (disabled IS NULL OR disabled = :false)'
+        params['false'] = False
+    # 清理上次中断留下的表
+    db.session.execute(backend.drop % _names(kind, new))
+    for statement in backend.create:
+        db.session.execute(statement % _names(kind, new))
+    low, high = db.session.execute(
+        db.select([db.func.min(table.c.id), db.func.max(table.c.id)])).first()
+    high = -1 if high is None else high
+    done = 0
+    for first in range(low or 0, high + 1, batch):
+        params.update(first=first, last=first + batch - 1)
+        done += db.session.execute(db.text(backend.insert_from % _names(
+            kind, new, where + searchable)), params).rowcount
+        db.session.commit()
+        if callback:
+            callback(min(first + batch - 1, high), done)
+    params['last'] = high
+    for statement in backend.lock:
+        db.session.execute(statement % _names(kind, new))
+    db.session.execute(db.text(backend.delete_where % _names(
+        kind, new, changed)), params)
+    db.session.execute(db.text(backend.insert_from % _names(
+        kind, new, changed + searchable)), params)
+    db.session.execute(backend.delete_missing % _names(kind, new))
+    done = db.session.execute('SELECT COUNT(*) FROM %s' % new).scalar()
+    for statement in backend.optimize + backend.swap:
+        db.session.execute(statement % _names(kind, new))
+    db.session.commit()
+    return done
+
+
+def paginate_hits(kind, q, per_page, error_out=False):
+    """
+    按相关度排序分页, items为(doc_id, score)行; 没有可搜索的词时返回None
+    相关度相同的按id排序, 游标为(score, doc_id)
+    """
+    backend = _backend(db.session)
+    words = terms(q)
+    if backend is None or not words:
+        return None
+    hits = db.text(backend.hits % _names(kind)).bindparams(
+        **_params(backend, q=backend.match(words))) \
+        .columns(doc_id=db.Integer, score=db.Float).alias('hits')
+    return paginate(db.session.query(hits.c.doc_id, hits.c.score),
+                    [hits.c.score, hits.c.doc_id], per_page,
+                    error_out=error_out)
+
+
+def ordered(query, model, ids):
+    """ 按ids的顺序取回对象, 索引中已不存在的行跳过 """
+    if not ids:
+        return []
+    rows = dict((row.id, row) for row in query.filter(model.id.in_(ids)))
+    return [rows[id] for id in ids if id in rows]
@@ -0,0 +1,316 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# @Date     : 2026-10-18 21:30
+# @Author   : Bluethon (j5088794@gmail.com)
+# @Link     : http://github.com/bluethon
+
+"""
+批量生成压测数据
+
+User/Post.generate_fake逐行提交, 不适合百万级数据. 这里:
+1. 固定随机种子, 相同参数生成相同数据集
+2. 主键由这里分配, 用executemany大批量插入, 不经过ORM对象和逐行事件
+3. 关注的人数和被关注的概率均服从幂律分布, 少数用户有大量关注者, 作者发文数同理
+4. body_html按批多进程预先渲染(同rerender), 不占用进程内的渲染缓存
+5. 冗余计数在生成时累计, 最后批量写回; 重建时间线和搜索索引, 输出各表行数和大小
+"""
+import hashlib
+import os
+import random
+import time
+from array import array
+from bisect import bisect_left
+from concurrent.futures import ProcessPoolExecutor
+from itertools import chain
+from datetime import datetime, timedelta
+
+from werkzeug.security import generate_password_hash
+
+from . import db
+from .models import Role, User, Follow, Post, Comment, TimelineEntry
+from .rerender import render_chunk
+from .search import KINDS, reindex
+
+
+WORDS = ('lorem ipsum dolor sit amet consectetur adipiscing elit sed do '
+         'eiusmod tempor incididunt ut labore et dolore magna aliqua enim '
+         'ad minim veniam quis nostrud exercitation ullamco laboris nisi '
+         'aliquip ex ea commodo consequat duis aute irure in reprehenderit '
+         'voluptate velit esse cillum fugiat nulla pariatur excepteur sint '
+         'occaecat cupidatat non proident sunt culpa qui officia deserunt '
+         'mollit anim id est laborum').split()
+CITIES = ('Beijing', 'Shanghai', 'London', 'Paris', 'Berlin', 'Tokyo',
+          'New York', 'San Francisco', 'Sydney', 'Toronto')
+# 所有生成用户的密码, 只计算一次散列
+PASSWORD = 'password'
+
+
+class Seeder(object):
+    """
+    users/posts/comments 各生成多少行, follows 平均每人关注多少人
+    days  数据时间跨度, 截止于end
+    workers 渲染进程数, 0或1时在当前进程渲染
+    callback(table, done, total) 每批提交后调用, 关注数事先未知, total为None
+    """
+
+    def __init__(self, users=1000, follows=20, posts=10000, comments=30000,
+                 seed=42, batch=10000, days=365, end=datetime(2026, 1, 1),
+                 workers=None, callback=None):
+        self.counts = {'users': users, 'posts': posts, 'comments': comments}
+        self.follows = follows
+        self.batch = batch
+        self.start = end - timedelta(days=days)
+        self.span = days * 86400
+        self.workers = workers
+        self.callback = callback
+        self.random = random.Random(seed)
+        self._executor = None
+
+    def _sentence(self):
+        # Random.choices需要Python 3.6, runtime.txt为3.5
+        words = [self.random.choice(WORDS)
+                 for i in range(self.random.randint(4, 14))]
+        return ' '.join(words).capitalize() + '.'
+
+    def _text(self, low, high):
+        return ' '.join(self._sentence()
+                        for i in range(self.random.randint(low, high)))
+
+    def _time(self, after=0):
+        """ 时间跨度内的随机时刻, 以起点后的秒数表示 """
+        return self.random.uniform(after, self.span)
+
+    def _zipf_weights(self, count, exponent=1.0):
+        """ 幂律累积权重, 排名随机打乱, 热门用户不集中在小id """
+        ranks = list(range(1, count + 1))
+        self.random.shuffle(ranks)
+        total, cumulative = 0.0, []
+        for rank in ranks:
+            total += 1.0 / rank ** exponent
+            cumulative.append(total)
+        return cumulative
+
+    def _pick(self, ids, weights):
+        """ 按累积权重随机取一个 """
+        return ids[bisect_left(weights, self.random.uniform(0, weights[-1]))]
+
+    @staticmethod
+    def _next_id(model):
+        return (db.session.query(db.func.max(model.id)).scalar() or 0) + 1
+
+    def _insert(self, table, rows, done, total):
+        """ executemany插入一批并提交 """
+        if rows:
+            db.session.execute(table.insert(), rows)
+            db.session.commit()
+        if self.callback:
+            self.callback(table.name, done, total)
+
+    def _batches(self, name, rows, total=None):
+        """ rows为行字典的迭代器, 按batch分批插入, 不整表放在内存中 """
+        table = {'users': User, 'follows': Follow, 'posts': Post,
+                 'comments': Comment}[name].__table__
+        chunk, done = [], 0
+        for row in rows:
+            chunk.append(row)
+            if len(chunk) >= self.batch:
+                done += len(chunk)
+                self._insert(table, self.render(name, chunk), done, total)
+                chunk = []
+        done += len(chunk)
+        self._insert(table, self.render(name, chunk), done, total)
+
+    def render(self, name, rows):
+        """ 整批渲染body_html, 有进程池时平均分给各进程 """
+        if name not in ('posts', 'comments') or not rows:
+            return rows
+        profile = 'post' if name == 'posts' else 'comment'
+        pairs = [(i, row['body']) for i, row in enumerate(rows)]
+        if self._executor is None:
+            results = render_chunk(profile, pairs)
+        else:
+            size = len(pairs) // self._processes + 1
+            chunks = [pairs[i:i + size] for i in range(0, len(pairs), size)]
+            results = chain.from_iterable(self._executor.map(
+                render_chunk, [profile] * len(chunks), chunks))
+        for i, html in results:
+            rows[i]['body_html'] = html
+        return rows
+
+    def seed_users(self):
+        count = self.counts['users']
+        first = self._next_id(User)
+        role_id = Role.query.filter_by(default=True).first().id
+        password_hash = generate_password_hash(PASSWORD)
+        self.user_ids = range(first, first + count)
+        # 冗余计数, 按 id - first 索引
+        self.post_counts = array('i', bytes(4 * count))
+        self.follower_counts = array('i', bytes(4 * count))
+        self.followed_counts = array('i', bytes(4 * count))
+
+        def make_row(i):
+            id = first + i
+            email = 'user%d@example.com' % id
+            member_since = self.start + timedelta(seconds=self._time())
+            return {'id': id, 'email': email, 'username': 'user%d' % id,
+                    'role_id': role_id, 'password_hash': password_hash,
+                    'confirmed': True, 'name': 'User %d' % id,
+                    'location': self.random.choice(CITIES),
+                    'about_me': self._sentence(),
+                    'member_since': member_since,
+                    'last_seen': member_since, 'updated_at': member_since,
+                    'avatar_hash': hashlib.md5(
+                        email.encode('utf-8')).hexdigest(),
+                    'post_count': 0, 'follower_count': 0,
+                    'followed_count': 0}
+        self._batches('users', (make_row(i) for i in range(count)), count)
+
+    def seed_follows(self):
+        """ 每人自关注, 另按幂律关注若干人 """
+        ids = self.user_ids
+        weights = self._zipf_weights(len(ids))
+        # Pareto(1.5)的均值是3倍下限
+        low = max(self.follows / 3.0, 0.1)
+        now = self.start + timedelta(seconds=self.span)
+
+        def make_rows():
+            for follower in ids:
+                targets = {follower}
+                want = min(len(ids) - 1,
+                           int(self.random.paretovariate(1.5) * low))
+                while len(targets) < want + 1:
+                    targets.update(self._pick(ids, weights)
+                                   for i in range(want + 1 - len(targets)))
+                self.followed_counts[follower - ids.start] = len(targets)
+                for followed in sorted(targets):
+                    self.follower_counts[followed - ids.start] += 1
+                    yield {'follower_id': follower, 'followed_id': followed,
+                           'timestamp': now}
+        self._batches('follows', make_rows())
+
+    def seed_posts(self):
+        count = self.counts['posts']
+        first = self._next_id(Post)
+        ids = self.user_ids
+        weights = self._zipf_weights(len(ids), exponent=0.8)
+        # 评论时间要晚于文章, 记下每篇文章的时间
+        self.post_ids = range(first, first + count)
+        self.post_times = array('d')
+        self.comment_counts = array('i', bytes(4 * count))
+
+        def make_row(i):
+            seconds = self._time()
+            self.post_times.append(seconds)
+            timestamp = self.start + timedelta(seconds=seconds)
+            author_id = self._pick(ids, weights)
+            self.post_counts[author_id - ids.start] += 1
+            return {'id': first + i, 'body': self._text(1, 5),
+                    'timestamp': timestamp, 'updated_at': timestamp,
+                    'author_id': author_id, 'comment_count': 0}
+        self._batches('posts', (make_row(i) for i in range(count)), count)
+
+    def seed_comments(self):
+        count = self.counts['comments']
+        first = self._next_id(Comment)
+        users, posts = self.user_ids, self.post_ids
+
+        def make_row(i):
+            index = self.random.randrange(len(posts))
+            self.comment_counts[index] += 1
+            timestamp = self.start + timedelta(
+                seconds=self._time(self.post_times[index]))
+            return {'id': first + i, 'body': self._sentence(),
+                    'timestamp': timestamp, 'updated_at': timestamp,
+                    'disabled': False, 'post_id': posts[index],
+                    'author_id': self.random.choice(users)}
+        self._batches('comments', (make_row(i) for i in range(count)),
+                      count)
+
+    def _write_counts(self, table, ids, counts):
+        """ 非零计数批量写回, updated_at保持生成时的值 """
+        update = table.update().where(table.c.id == db.bindparam('_id')) \
+            .values(dict((column, db.bindparam(column)) for column in counts),
+                    updated_at=table.c.updated_at)
+        rows = []
+        for i, id in enumerate(ids):
+            row = dict((column, values[i])
+                       for column, values in counts.items())
+            if any(row.values()):
+                row['_id'] = id
+                rows.append(row)
+            if len(rows) >= self.batch:
+                db.session.execute(update, rows)
+                rows = []
+        if rows:
+            db.session.execute(update, rows)
+        db.session.commit()
+
+    def seed_counters(self):
+        self._write_counts(User.__table__, self.user_ids, {
+            'post_count': self.post_counts,
+            'follower_count': self.follower_counts,
+            'followed_count': self.followed_counts})
+        if self.counts['posts']:
+            self._write_counts(Post.__table__, self.post_ids,
+                               {'comment_count': self.comment_counts})
+
+    def run(self, timeline=True):
+        """ 依次生成, 返回 [(阶段, 秒数)] """
+        timings = []
+        Role.insert_roles()
+        steps = [('users', self.seed_users), ('follows', self.seed_follows),
+                 ('posts', self.seed_posts)]
+        if self.counts['comments'] and self.counts['posts']:
+            steps.append(('comments', self.seed_comments))
+        steps.append(('counters', self.seed_counters))
+        if timeline:
+            steps.append(('timeline',
+                          lambda: TimelineEntry.rebuild(self.batch)))
+        steps.append(('search', lambda: [reindex(kind, self.batch)
+                                         for kind in KINDS]))
+        self._processes = self.workers or os.cpu_count() or 1
+        if self.workers is None or self.workers > 1:
+            self._executor = ProcessPoolExecutor(max_workers=self._processes)
+        try:
+            for name, step in steps:
+                start = time.time()
+                step()
+                timings.append((name, time.time() - start))
+        finally:
+            if self._executor is not None:
+                self._executor.shutdown()
+                self._executor = None
+        _fix_sequences()
+        return timings
+
+
+def _fix_sequences():
+    """ 主键由这里分配, PostgreSQL的序列需要跟上 """
+    if db.engine.dialect.name != 'postgresql':
+        return
+    for table in ('users', 'posts', 'comments'):
+        db.session.execute(
+            "SELECT setval(pg_get_serial_sequence('%s', 'id'), "
+            "(SELECT COALESCE(max(id), 1) FROM %s))" % (table, table))
+    db.session.commit()
+
+
+def size_report():
+    """ 各表行数和占用字节数 [(表名, 行数, 字节数或None)], 末行为合计 """
+    tables = ['users', 'follows', 'posts', 'comments', 'timeline_entries']
+    dialect = db.engine.dialect.name
+    report = []
+    for name in tables:
+        rows = db.session.execute('SELECT count(*) FROM %s' % name).scalar()
+        size = None
+        if dialect == 'postgresql':
+            size = db.session.execute(
+                "SELECT pg_total_relation_size('%s')" % name).scalar()
+        report.append((name, rows, size))
+    total = None
+    if dialect == 'sqlite' and db.engine.url.database:
+        total = os.path.getsize(db.engine.url.database)
+    elif dialect == 'postgresql':
+        total = sum(size for name, rows, size in report)
+    report.append(('total', sum(row[1] for row in report), total))
+    return report
@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# @Date     : 2026-10-18 17:15
+# @Author   : Bluethon (j5088794@gmail.com)
+# @Link     : http://github.com/bluethon
+
+"""
+请求结束时按需提交
+
+代替SQLALCHEMY_COMMIT_ON_TEARDOWN, 后者每个请求结束都执行COMMIT,
+纯读取的请求也多一次往返和WAL刷盘.
+这里记录session是否有写入, 有才提交, 否则直接回滚释放连接.
+视图中显式的db.session.commit()照常使用, 提交后写入标记清零.
+"""
+from threading import Lock
+
+from flask import current_app
+from flask_sqlalchemy import SignallingSession
+from sqlalchemy import event
+
+
+def _mark_writes(session, *args):
+    session.info['has_writes'] = True
+
+
+def _clear_writes(session, *args):
+    session.info.pop('has_writes', None)
+
+
+class TeardownCommit(object):
+    """ 用法同其他扩展, 须在db.init_app之后init_app """
+
+    def __init__(self, app=None):
+        # 统计: 提交次数, 省掉的提交次数
+        self.commits = 0
+        self.skipped = 0
+        self._lock = Lock()
+        self._registered = False
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        if not self._registered:
+            # flush和批量update/delete都算写入, 提交或回滚后清零
+            # db.session.execute()直接执行的写语句不在此列, 需自行提交
+            for name in ('after_flush', 'after_bulk_update',
+                         'after_bulk_delete'):
+                event.listen(SignallingSession, name, _mark_writes)
+            for name in ('after_commit', 'after_rollback'):
+                event.listen(SignallingSession, name, _clear_writes)
+            self._registered = True
+        # teardown倒序执行, 在Flask-SQLAlchemy移除session之前运行
+        app.teardown_appcontext(self.shutdown_session)
+
+    def has_writes(self, session):
+        """ 有未flush的修改, 或已flush未提交的写入 """
+        if session.info.get('has_writes') or session.new or session.deleted:
+            return True
+        return any(session.is_modified(obj) for obj in session.dirty)
+
+    def shutdown_session(self, response_or_exc):
+        # 本模块在app/__init__中db创建前导入
+        from . import db
+
+        if not current_app.config['FLASKY_COMMIT_ON_TEARDOWN'] or \
+                response_or_exc is not None:
+            return response_or_exc
+        session = db.session
+        if self.has_writes(session):
+            session.commit()
+            with self._lock:
+                self.commits += 1
+        else:
+            # 只读, 回滚即可, 连接随后归还连接池
+            session.rollback()
+            with self._lock:
+                self.skipped += 1
+        return response_or_exc
@@ -0,0 +1,13 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# @Date     : 2026-10-18 16:20
+# @Author   : Bluethon (j5088794@gmail.com)
+# @Link     : http://github.com/bluethon
+
+"""
+性能基准脚本, 在项目根目录运行
+$ python -m benchmarks.api_auth
+$ python -m benchmarks.serializers
+$ python -m benchmarks.hot_paths
+端点压测(load)通过 manage.py bench 运行
+"""
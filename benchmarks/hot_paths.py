@@ -0,0 +1,189 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# @Date     : 2026-10-19 01:10
+# @Author   : Bluethon (j5088794@gmail.com)
+# @Link     : http://github.com/bluethon
+
+"""
+模型热点函数的微基准, 优化这些函数前后各跑一次, 用--compare给出加速比
+每项预热后计时rounds轮, 每轮调用number次(未指定时自动选择, 使每轮不少于--min-time秒),
+报告每次调用的 最小/中位/平均 微秒数; 计时期间关闭gc, 同timeit
+内存由tracemalloc另行测量: 单次调用的峰值字节数, 以及number次调用后仍保留的块数/字节数
+$ python -m benchmarks.hot_paths --output hot_paths.json
+$ python -m benchmarks.hot_paths --filter to_json --compare hot_paths.json
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import sys
+import timeit
+import tracemalloc
+from collections import OrderedDict
+from datetime import datetime
+from itertools import cycle
+
+# 必须在导入config前设置, 使用内存数据库
+os.environ.setdefault('TEST_DATABASE_URL', 'sqlite://')
+
+from werkzeug.security import generate_password_hash
+
+from app import create_app, db
+from app.models import Comment, Permission, Post, Role, User
+
+
+BODY = ('Lorem *ipsum* dolor sit amet, **consectetur** adipiscing elit. '
+        'See http://example.com/%d for details.\n\n'
+        '- sed do eiusmod\n- tempor incididunt\n\n'
+        '> ut labore et dolore magna aliqua\n\n'
+        '`code` and a [link](http://example.com/).')
+
+
+def cases():
+    """ 名称 -> 无参函数, 须在app上下文和请求上下文中调用 """
+    u = User(email='john@example.com', username='john', password='cat',
+             confirmed=True)
+    db.session.add(u)
+    db.session.commit()
+    post = Post(body=BODY % 0, author=u)
+    db.session.add(post)
+    db.session.commit()
+    comment = Comment(body='Nice *post*', post=post, author=u)
+    db.session.add(comment)
+    db.session.commit()
+    token = u.generate_auth_token(3600)
+    # 不同正文多于渲染缓存条数, 每次都是未命中
+    size = 2 * db.get_app().config['FLASKY_RENDER_CACHE_SIZE']
+    post_bodies = cycle([BODY % i for i in range(size)])
+    comment_bodies = cycle(['Comment *%d* on http://example.com/' % i
+                            for i in range(size)])
+    return OrderedDict([
+        ('post.on_changed_body', lambda: Post.on_changed_body(
+            post, next(post_bodies), None, None)),
+        ('post.on_changed_body[cached]', lambda: Post.on_changed_body(
+            post, BODY % 0, None, None)),
+        ('comment.on_changed_body', lambda: Comment.on_changed_body(
+            comment, next(comment_bodies), None, None)),
+        ('post.to_json', post.to_json),
+        ('comment.to_json', comment.to_json),
+        ('user.to_json', u.to_json),
+        ('user.gravatar', u.gravatar),
+        ('user.can', lambda: u.can(Permission.WRITE_ARTICLES)),
+        ('user.generate_auth_token', lambda: u.generate_auth_token(3600)),
+        ('User.verify_auth_token', lambda: User.verify_auth_token(token)),
+        ('generate_password_hash', lambda: generate_password_hash('cat')),
+    ])
+
+
+def measure(func, rounds=20, number=None, min_time=0.01, warmup=1):
+    """ 返回每次调用的计时(微秒)和tracemalloc统计 """
+    for i in range(warmup):
+        func()
+    timer = timeit.Timer(func)
+    if number is None:
+        number = 1
+        while timer.timeit(number) < min_time:
+            number *= 2
+    times = [t / number * 1e6 for t in timer.repeat(rounds, number)]
+
+    # 每次重新开始跟踪, 峰值只含这一次调用
+    tracemalloc.start()
+    try:
+        func()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    tracemalloc.start()
+    try:
+        before = tracemalloc.take_snapshot()
+        for i in range(number):
+            func()
+        after = tracemalloc.take_snapshot()
+    finally:
+        tracemalloc.stop()
+    retained = after.compare_to(before, 'filename')
+    return OrderedDict([
+        ('number', number),
+        ('rounds', rounds),
+        ('min', round(min(times), 3)),
+        ('median', round(statistics.median(times), 3)),
+        ('mean', round(statistics.mean(times), 3)),
+        ('peak_bytes', peak),
+        ('retained_blocks', round(sum(stat.count_diff for stat in retained)
+                                  / number, 2)),
+        ('retained_bytes', round(sum(stat.size_diff for stat in retained)
+                                 / number, 1)),
+    ])
+
+
+def run(pattern=None, rounds=20, number=None, min_time=0.01, callback=None):
+    """ 在内存数据库上测量名称含pattern的各项, 返回可序列化为JSON的结果 """
+    app = create_app('testing')
+    # 允许url_for生成完整URL
+    app.config['SERVER_NAME'] = 'localhost'
+    # 不记录每条语句, 与生产配置一致
+    app.config['SQLALCHEMY_RECORD_QUERIES'] = False
+    results = OrderedDict()
+    with app.app_context():
+        db.create_all()
+        Role.insert_roles()
+        with app.test_request_context():
+            for name, func in cases().items():
+                if pattern and pattern not in name:
+                    continue
+                results[name] = measure(func, rounds, number, min_time)
+                if callback:
+                    callback(name, results[name])
+        db.session.remove()
+        db.drop_all()
+    meta = OrderedDict([
+        ('created', datetime.utcnow().isoformat() + 'Z'),
+        ('python', sys.version.split()[0]),
+        ('platform', platform.platform()),
+        ('rounds', rounds),
+    ])
+    return OrderedDict([('meta', meta), ('results', results)])
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawTextHelpFormatter)
+    parser.add_argument('--rounds', type=int, default=20)
+    parser.add_argument('--number', type=int, default=None,
+                        help='calls per round, chosen automatically if unset')
+    parser.add_argument('--min-time', type=float, default=0.01,
+                        help='minimum seconds per round for --number')
+    parser.add_argument('--filter', default=None,
+                        help='only names containing this string')
+    parser.add_argument('--output', default=None, help='results JSON file')
+    parser.add_argument('--compare', default=None,
+                        help='earlier results JSON file to compare with')
+    args = parser.parse_args()
+
+    baseline = {}
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)['results']
+    print('%-30s %10s %10s %10s %10s %8s' % (
+        'name', 'min(us)', 'median(us)', 'peak(B)', 'retained', 'speedup'))
+
+    def progress(name, result):
+        before = baseline.get(name)
+        # 中位数之比, 大于1为变快
+        speedup = '%7.2fx' % (before['median'] / result['median']) \
+            if before and result['median'] else ''
+        print('%-30s %10.2f %10.2f %10d %10.2f %8s' % (
+            name, result['min'], result['median'], result['peak_bytes'],
+            result['retained_blocks'], speedup))
+
+    results = run(args.filter, args.rounds, args.number, args.min_time,
+                  progress)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+        print('results written to %s' % args.output)
+
+
+if __name__ == '__main__':
+    main()
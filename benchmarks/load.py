@@ -0,0 +1,363 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# @Date     : 2026-10-19 00:10
+# @Author   : Bluethon (j5088794@gmail.com)
+# @Link     : http://github.com/bluethon
+
+"""
+端点压测, 由 manage.py bench 调用
+1. 用app.seed在独立的数据库(benchmark配置)生成指定规模的数据, 可复用已有的
+2. 多个线程并发请求各端点:
+   inprocess 直接调用WSGI app, 不含网络和服务器开销
+   gunicorn  启动 gunicorn manage:app (同Procfile), 经本机HTTP请求
+3. 每个端点的吞吐量和p50/p95/p99延迟(毫秒)输出为JSON, 可与保存的基线比较
+HTML页面匿名访问, API使用令牌认证, token端点测邮箱密码认证
+"""
+import http.client
+import math
+import os
+import random
+import socket
+import subprocess
+import sys
+import threading
+import time
+from base64 import b64encode
+from collections import OrderedDict
+from datetime import datetime
+
+from app import create_app, db
+from app.models import User, Post
+from app.seed import PASSWORD, Seeder
+
+
+basedir = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+PERCENTILES = (50, 95, 99)
+# 与基线相比, 延迟差值小于此毫秒数视为噪声
+MIN_DELTA = 0.5
+
+
+def _basic(username, password):
+    return {'Authorization': 'Basic ' + b64encode(
+        (username + ':' + password).encode('utf-8')).decode('utf-8'),
+        'Accept': 'application/json'}
+
+
+class Fixture(object):
+    """ 随机抽取的请求目标: 用户(id, 用户名, 令牌)和文章id """
+
+    def __init__(self, sample=1000, seed=42):
+        rnd = random.Random(seed)
+        self.users = []
+        self.posts = []
+        low, high = db.session.query(db.func.min(User.id),
+                                     db.func.max(User.id)).first()
+        if low is not None:
+            ids = rnd.sample(range(low, high + 1),
+                             min(sample, high - low + 1))
+            for user in User.query.filter(User.id.in_(ids)) \
+                    .order_by(User.id):
+                self.users.append((user.id, user.username, user.email,
+                                   user.generate_auth_token(3600)))
+        low, high = db.session.query(db.func.min(Post.id),
+                                     db.func.max(Post.id)).first()
+        if low is not None:
+            ids = rnd.sample(range(low, high + 1),
+                             min(sample, high - low + 1))
+            self.posts = [id for id, in db.session.query(Post.id)
+                          .filter(Post.id.in_(ids)).order_by(Post.id)]
+        db.session.remove()
+        if not self.users or not self.posts:
+            raise RuntimeError('benchmark database has no users or posts')
+
+    def user(self, rnd):
+        return rnd.choice(self.users)
+
+    def token(self, rnd):
+        return _basic(self.user(rnd)[3], '')
+
+
+# 端点名 -> 由(fixture, random)生成(路径, 首部)
+ENDPOINTS = OrderedDict([
+    ('index', lambda f, rnd: ('/', {})),
+    ('user', lambda f, rnd: ('/user/%s' % f.user(rnd)[1], {})),
+    ('post', lambda f, rnd: ('/post/%d' % rnd.choice(f.posts), {})),
+    ('followers', lambda f, rnd: ('/followers/%s' % f.user(rnd)[1], {})),
+    ('api_posts', lambda f, rnd: ('/api/v1.0/posts/', f.token(rnd))),
+    ('api_comments', lambda f, rnd: ('/api/v1.0/comments/', f.token(rnd))),
+    ('api_user_posts', lambda f, rnd: (
+        '/api/v1.0/users/%d/posts/' % f.user(rnd)[0], f.token(rnd))),
+    ('api_timeline', lambda f, rnd: (
+        '/api/v1.0/users/%d/timeline/' % f.user(rnd)[0], f.token(rnd))),
+    # 生成的用户密码相同, 见app.seed
+    ('token', lambda f, rnd: ('/api/v1.0/token',
+                              _basic(f.user(rnd)[2], PASSWORD))),
+])
+
+
+def make_app(database=None):
+    """ benchmark配置的app, database为空时用BENCH_DATABASE_URL或默认文件 """
+    app = create_app('benchmark')
+    if database:
+        # 引擎在第一次使用时才创建
+        app.config['SQLALCHEMY_DATABASE_URI'] = database
+    return app
+
+
+def seed_database(app, **kwargs):
+    """ 清空后生成数据, kwargs同Seeder, 返回 [(阶段, 秒数)] """
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+        timings = Seeder(**kwargs).run()
+        db.session.remove()
+    return timings
+
+
+class WSGIClient(object):
+    """ 进程内直接调用app """
+
+    def __init__(self, app):
+        self._client = app.test_client(use_cookies=False)
+
+    def get(self, path, headers):
+        response = self._client.get(path, headers=headers)
+        response.get_data()
+        response.close()
+        return response.status_code
+
+    def close(self):
+        pass
+
+
+class HTTPClient(object):
+    """ 本机HTTP, 服务器允许时复用连接 """
+
+    def __init__(self, host, port):
+        self.host = host
+        self.port = port
+        self._connection = None
+
+    def get(self, path, headers):
+        if self._connection is None:
+            self._connection = http.client.HTTPConnection(
+                self.host, self.port, timeout=30)
+        try:
+            self._connection.request('GET', path, headers=headers)
+            response = self._connection.getresponse()
+            response.read()
+        except (OSError, http.client.HTTPException):
+            self.close()
+            raise
+        if response.will_close:
+            self.close()
+        return response.status
+
+    def close(self):
+        if self._connection is not None:
+            self._connection.close()
+            self._connection = None
+
+
+def percentile(values, p):
+    """ values已升序, 最近秩法 """
+    if not values:
+        return None
+    rank = max(int(math.ceil(p / 100.0 * len(values))), 1)
+    return values[rank - 1]
+
+
+def measure(make_client, fixture, make_request, requests, concurrency,
+            warmup=0, seed=42):
+    """
+    concurrency个线程共发出requests个请求, 各线程先预热warmup个
+    返回吞吐量(每秒请求数), 错误数和延迟分位数(毫秒)
+    """
+    latencies = []
+    errors = [0]
+    remaining = [requests]
+    lock = threading.Lock()
+    ready = threading.Barrier(concurrency + 1)
+
+    def worker(index):
+        rnd = random.Random(seed * 1000 + index)
+        client = make_client()
+        own, failed = [], 0
+        try:
+            try:
+                for i in range(warmup):
+                    client.get(*make_request(fixture, rnd))
+            except BaseException:
+                # 不让其他线程和计时一直等待
+                ready.abort()
+                raise
+            ready.wait()
+            while True:
+                with lock:
+                    if remaining[0] <= 0:
+                        break
+                    remaining[0] -= 1
+                path, headers = make_request(fixture, rnd)
+                start = time.perf_counter()
+                try:
+                    status = client.get(path, headers)
+                except (OSError, http.client.HTTPException):
+                    status = None
+                own.append(time.perf_counter() - start)
+                if status is None or status >= 400:
+                    failed += 1
+        finally:
+            client.close()
+        with lock:
+            latencies.extend(own)
+            errors[0] += failed
+
+    threads = [threading.Thread(target=worker, args=[i], daemon=True)
+               for i in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    # 全部预热完成后开始计时
+    try:
+        ready.wait()
+    except threading.BrokenBarrierError:
+        raise RuntimeError('warmup failed, see the traceback above')
+    start = time.perf_counter()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+    latencies.sort()
+    result = OrderedDict([
+        ('requests', len(latencies)),
+        ('errors', errors[0]),
+        ('seconds', round(elapsed, 3)),
+        ('throughput', round(len(latencies) / elapsed, 1)
+         if elapsed > 0 else None),
+        ('mean', round(sum(latencies) / len(latencies) * 1000, 3)
+         if latencies else None),
+    ])
+    for p in PERCENTILES:
+        value = percentile(latencies, p)
+        result['p%d' % p] = round(value * 1000, 3) \
+            if value is not None else None
+    return result
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+class GunicornServer(object):
+    """ with语句中运行 gunicorn manage:app, 使用benchmark配置和给定数据库 """
+
+    def __init__(self, database, workers=2, threads=1, timeout=30):
+        self.database = database
+        self.workers = workers
+        self.threads = threads
+        self.timeout = timeout
+        self.host = '127.0.0.1'
+        self.port = free_port()
+        self._process = None
+
+    def __enter__(self):
+        env = dict(os.environ, FLASK_CONFIG='benchmark',
+                   BENCH_DATABASE_URL=self.database)
+        self._process = subprocess.Popen(
+            [sys.executable, '-m', 'gunicorn', '--workers', str(self.workers),
+             '--threads', str(self.threads), '--log-level', 'warning',
+             '--bind', '%s:%d' % (self.host, self.port), 'manage:app'],
+            cwd=basedir, env=env)
+        deadline = time.time() + self.timeout
+        while True:
+            if self._process.poll() is not None:
+                raise RuntimeError('gunicorn exited with status %d'
+                                   % self._process.returncode)
+            try:
+                socket.create_connection((self.host, self.port), 1).close()
+                return self
+            except OSError:
+                if time.time() > deadline:
+                    self.__exit__()
+                    raise RuntimeError('gunicorn did not start in %ds'
+                                       % self.timeout)
+                time.sleep(0.2)
+
+    def __exit__(self, *exc_info):
+        self._process.terminate()
+        try:
+            self._process.wait(10)
+        except subprocess.TimeoutExpired:
+            self._process.kill()
+            self._process.wait()
+
+    def client(self):
+        return HTTPClient(self.host, self.port)
+
+
+def run(app, server='inprocess', endpoints=None, requests=1000,
+        concurrency=4, warmup=20, workers=2, seed=42, callback=None):
+    """
+    压测各端点, 返回可序列化为JSON的结果
+    server 'inprocess' 或 'gunicorn'; workers为gunicorn进程数
+    callback(端点名, 结果) 每个端点完成后调用
+    """
+    names = list(endpoints or ENDPOINTS)
+    database = app.config['SQLALCHEMY_DATABASE_URI']
+    with app.app_context():
+        fixture = Fixture(seed=seed)
+        dialect = db.engine.dialect.name
+        rows = dict((model.__tablename__, model.query.count())
+                    for model in (User, Post))
+        db.session.remove()
+    results = OrderedDict()
+
+    def measure_all(make_client):
+        for name in names:
+            results[name] = measure(make_client, fixture, ENDPOINTS[name],
+                                    requests, concurrency, warmup, seed)
+            if callback:
+                callback(name, results[name])
+
+    if server == 'gunicorn':
+        with GunicornServer(database, workers) as gunicorn:
+            measure_all(gunicorn.client)
+    else:
+        measure_all(lambda: WSGIClient(app))
+    meta = OrderedDict([
+        ('created', datetime.utcnow().isoformat() + 'Z'),
+        ('server', server),
+        ('workers', workers if server == 'gunicorn' else 1),
+        ('concurrency', concurrency),
+        ('requests', requests),
+        ('database', dialect),
+        ('rows', rows),
+        ('python', sys.version.split()[0]),
+    ])
+    return OrderedDict([('meta', meta), ('endpoints', results)])
+
+
+def compare(results, baseline, tolerance=0.1):
+    """
+    与基线比较, 返回退步项 [(端点, 指标, 基线值, 当前值)]
+    延迟变大或吞吐量变小超过tolerance比例, 或出现新的错误, 视为退步
+    """
+    regressions = []
+    for name, now in results['endpoints'].items():
+        before = baseline.get('endpoints', {}).get(name)
+        if before is None:
+            continue
+        for key in ['p%d' % p for p in PERCENTILES]:
+            if now[key] is None or before[key] is None:
+                continue
+            if now[key] > before[key] * (1 + tolerance) and \
+                    now[key] - before[key] >= MIN_DELTA:
+                regressions.append((name, key, before[key], now[key]))
+        if now['throughput'] is not None and before['throughput'] and \
+                now['throughput'] < before['throughput'] * (1 - tolerance):
+            regressions.append((name, 'throughput', before['throughput'],
+                                now['throughput']))
+        if now['errors'] > before['errors']:
+            regressions.append((name, 'errors', before['errors'],
+                                now['errors']))
+    return regressions
@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# @Date     : 2026-10-18 20:30
+# @Author   : Bluethon (j5088794@gmail.com)
+# @Link     : http://github.com/bluethon
+
+"""
+API 序列化基准, 每页 --per-page 篇文章
+to_json     查询ORM对象, 逐个to_json后jsonify (原路径)
+serializers 只查询所需列, URL模板填id后jsonify
+$ python -m benchmarks.serializers --per-page 100 --repeat 200
+"""
+import argparse
+import os
+import time
+
+# 必须在导入config前设置, 使用内存数据库
+os.environ.setdefault('TEST_DATABASE_URL', 'sqlite://')
+
+from flask import jsonify
+
+from app import create_app, db
+from app.api_1_0.serializers import POST_COLUMNS, posts_json
+from app.models import User, Post
+
+
+def to_json_page(per_page):
+    posts = Post.query.order_by(Post.timestamp.desc()).limit(per_page).all()
+    return jsonify({'posts': [post.to_json() for post in posts]})
+
+
+def serializers_page(per_page):
+    rows = Post.query.with_entities(*POST_COLUMNS) \
+        .order_by(Post.timestamp.desc()).limit(per_page).all()
+    return jsonify({'posts': posts_json(rows)})
+
+
+def measure(func, per_page, repeat):
+    """ 预热后重复执行, 返回每页毫秒数 """
+    for i in range(10):
+        func(per_page)
+    start = time.perf_counter()
+    for i in range(repeat):
+        func(per_page)
+        # 每页都是新的请求, 不复用identity map
+        db.session.expunge_all()
+    return (time.perf_counter() - start) / repeat * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--per-page', type=int, default=100)
+    parser.add_argument('--repeat', type=int, default=200)
+    args = parser.parse_args()
+
+    app = create_app('testing')
+    app.config['SERVER_NAME'] = 'localhost'
+    with app.app_context():
+        db.create_all()
+        u = User(email='john@example.com', username='john', password='cat')
+        db.session.add_all([Post(body='post %d' % i, author=u)
+                            for i in range(args.per_page)])
+        db.session.commit()
+        with app.test_request_context():
+            assert to_json_page(args.per_page).get_data() == \
+                serializers_page(args.per_page).get_data()
+            before = measure(to_json_page, args.per_page, args.repeat)
+            after = measure(serializers_page, args.per_page, args.repeat)
+        print('%-12s %12s' % ('path', 'ms/page'))
+        print('%-12s %12.2f' % ('to_json', before))
+        print('%-12s %12.2f %7.1fx' % ('serializers', after, before / after))
+        db.drop_all()
+
+
+if __name__ == '__main__':
+    main()
@@ -17,11 +17,14 @@ class Config:
         'SECRET_KEY', default=None) or 'hard to guess string'
     # SSL开关
     SSL_DISABLE = False
-    # True, 每次请求结束, 自动提交数据库中变动
-    SQLALCHEMY_COMMIT_ON_TEARDOWN = True
+    # 每次请求结束, 自动提交数据库中变动
+    # 由app/transactions.py接管, 只读请求不提交, 见FLASKY_COMMIT_ON_TEARDOWN
+    SQLALCHEMY_COMMIT_ON_TEARDOWN = False
+    FLASKY_COMMIT_ON_TEARDOWN = True
     # 记录查询统计数字功能
-    # 默认get_debug_queries仅调试可用, 为记录数据库缓慢语句, 打开
-    SQLALCHEMY_RECORD_QUERIES = True
+    # 默认get_debug_queries仅调试可用, 每条语句都保存参数和调用栈, 开销大
+    # 缓慢语句由app/query_stats.py抽样统计并写日志, 这里关闭
+    SQLALCHEMY_RECORD_QUERIES = False
 
     MAIL_SERVER = 'smtp.163.com'
     MAIL_PORT = 465
@@ -40,7 +43,57 @@ class Config:
     FLASKY_POSTS_PER_PAGE = 10
     FLASKY_FOLLOWERS_PER_PAGE = 50
     FLASKY_COMMENTS_PER_PAGE = 10
+    # PostgreSQL全文搜索的分词配置, 已有索引按建立时的配置分词(迁移中为'english'),
+    # 修改后须运行 manage.py reindex 重建
+    FLASKY_SEARCH_CONFIG = 'english'
     FLASKY_SLOW_DB_QUERY_TIME = 0.5
+    # 请求指标: 抽样比例(耗时总是记录), /metrics的Bearer令牌, 未设置时仅管理员可看
+    FLASKY_METRICS_SAMPLE_RATE = 0.1
+    FLASKY_METRICS_TOKEN = os.environ.get('FLASKY_METRICS_TOKEN')
+    # SQL语句抽样比例(慢查询总是记录), 保留的指纹条数,
+    # 各进程汇总写入的目录(None不写)和间隔秒数, 用 manage.py dbstats 查看
+    FLASKY_DB_STATS_SAMPLE_RATE = 0.01
+    FLASKY_DB_STATS_SIZE = 1000
+    FLASKY_DB_STATS_DIR = os.environ.get('FLASKY_DB_STATS_DIR') or \
+        os.path.join(basedir, 'tmp/dbstats')
+    FLASKY_DB_STATS_FLUSH_INTERVAL = 60
+    # 匿名整页缓存: 'memory'进程内, 'filesystem'多进程共享, None关闭
+    FLASKY_PAGE_CACHE_TYPE = os.environ.get('FLASKY_PAGE_CACHE_TYPE',
+                                            'memory') or None
+    FLASKY_PAGE_CACHE_DIR = os.environ.get('FLASKY_PAGE_CACHE_DIR') or \
+        os.path.join(basedir, 'tmp/pages')
+    FLASKY_PAGE_CACHE_SIZE = 1000
+    FLASKY_PAGE_CACHE_TIMEOUT = 300
+    # 文章/评论列表项的HTML片段缓存, 键含版本, 过期时间只用于回收旧版本
+    FLASKY_FRAGMENT_CACHE_SIZE = 5000
+    FLASKY_FRAGMENT_CACHE_TIMEOUT = 3600
+    # API批量创建每次最多条数, 限制单个请求的耗时
+    FLASKY_API_MAX_BATCH = 100
+    # 关注者超过此数的作者, 新文章提交后由后台线程分批写入时间线
+    FLASKY_TIMELINE_FANOUT_THRESHOLD = 1000
+    FLASKY_TIMELINE_FANOUT_BATCH = 1000
+    # 当前登录用户关注的人的id集合缓存秒数, 本进程内的关注变化立即生效
+    FLASKY_FOLLOW_CACHE_TIMEOUT = 300
+    # 关注关系图快照文件, 各进程共享; 快照超过此秒数由后台线程重建, 0不自动重建
+    FLASKY_GRAPH_PATH = os.environ.get('FLASKY_GRAPH_PATH') or \
+        os.path.join(basedir, 'tmp/follow-graph.bin')
+    FLASKY_GRAPH_REFRESH_INTERVAL = 3600
+    FLASKY_SUGGESTIONS_LIMIT = 10
+    # 推荐时至多计数的关注的人数, 以及每人至多计数的他关注的人数, 超过时均匀抽取
+    FLASKY_SUGGESTIONS_MAX_FOLLOWING = 200
+    FLASKY_SUGGESTIONS_MAX_NEIGHBORS = 200
+    # 游标分页时API返回的count为缓存值, 缓存秒数
+    FLASKY_COUNT_CACHE_TIMEOUT = 60
+    # markdown渲染结果缓存条数
+    FLASKY_RENDER_CACHE_SIZE = 1024
+    # API令牌认证结果缓存秒数, 多进程部署时也是权限变更生效的最长延迟
+    FLASKY_TOKEN_CACHE_TIMEOUT = 300
+    # API邮箱密码认证结果缓存秒数, 改密码后旧密码在其他进程最多还能用这么久
+    FLASKY_CREDENTIALS_CACHE_TIMEOUT = 60
+    # 最后访问时间: 最小更新间隔秒数, 缓冲区满多少条或多少秒写入一次
+    FLASKY_LAST_SEEN_INTERVAL = 60
+    FLASKY_LAST_SEEN_BUFFER_SIZE = 100
+    FLASKY_LAST_SEEN_FLUSH_INTERVAL = 10
 
     # 如果设置成True，Flask-SQLAlchemy 将会追踪对象的修改并且发送信号。这需要额外的内存
     # 2.1中默认None, 未来默认False
@@ -65,6 +118,15 @@ class TestingConfig(Config):
         'sqlite:///' + os.path.join(basedir, 'data-test.sqlite'))
     # 关闭CSRF保护功能, 方便测试
     WTF_CSRF_ENABLED = False
+    # 测试间重建数据库, 不缓存总数, 最后访问时间立即写入
+    FLASKY_COUNT_CACHE_TIMEOUT = 0
+    FLASKY_LAST_SEEN_BUFFER_SIZE = 1
+    FLASKY_METRICS_SAMPLE_RATE = 1.0
+    # 测试中统计页面查询数用get_debug_queries
+    SQLALCHEMY_RECORD_QUERIES = True
+    FLASKY_DB_STATS_DIR = None
+    # 测试中手动生成快照
+    FLASKY_GRAPH_REFRESH_INTERVAL = 0
 
 
 class ProductionConfig(Config):
@@ -98,6 +160,13 @@ class ProductionConfig(Config):
         app.logger.addHandler(mail_handler)
 
 
+class BenchmarkConfig(ProductionConfig):
+    # manage.py bench 使用, 生产配置加独立的数据库; 压测走本机HTTP, 不跳转https
+    SQLALCHEMY_DATABASE_URI = os.environ.get('BENCH_DATABASE_URL') or (
+        'sqlite:///' + os.path.join(basedir, 'data-bench.sqlite'))
+    SSL_DISABLE = True
+
+
 class HerokuConfig(ProductionConfig):
     SSL_DISABLE = bool(os.environ.get('SSL_DISABLE'))
 
@@ -130,6 +199,7 @@ config = {
     'development': DevelopmentConfig,
     'testing': TestingConfig,
     'production': ProductionConfig,
+    'benchmark': BenchmarkConfig,
     'heroku': HerokuConfig,
 
     'default': DevelopmentConfig
@@ -55,7 +55,7 @@ def make_shell_context():
 
 
 # 修饰器 自定义命令, 函数名即为命令名
-@app.cli.command
+@app.cli.command()
 @click.option('--coverage/--no-coverage', default=False, help='coverage')
 # test() 添加布尔值参数 即可 为test命令添加布尔值选项
 def test(coverage=False):
@@ -72,7 +72,10 @@ def test(coverage=False):
     
     # 原单元测试
     import unittest
-    tests = unittest.TestLoader().discover('tests')
+    # 顶层目录为项目目录, tests作为包导入, 测试模块可相对导入tests/__init__.py
+    basedir = os.path.abspath(os.path.dirname(__file__))
+    tests = unittest.TestLoader().discover(os.path.join(basedir, 'tests'),
+                                           top_level_dir=basedir)
     unittest.TextTestRunner(verbosity=2).run(tests)
     
     # 覆盖测试后续
@@ -81,14 +84,13 @@ def test(coverage=False):
         COV.save()
         print('Coverage Summary:')
         COV.report()
-        basedir = os.path.abspath(os.path.dirname(__file__))
         covdir = os.path.join(basedir, 'tmp/coverage')
         COV.html_report(directory=covdir)
         print('HTML version: file://%s/index.html' % covdir)
         COV.erase()
 
 
-@app.cli.command
+@app.cli.command()
 @click.option('--length', default=25, help='Profile stack length')
 @click.option('--profile_dir', default=None, help='Profile directory')
 def profile(length=25, profile_dir=None):
@@ -102,19 +104,313 @@ def profile(length=25, profile_dir=None):
     app.run()
 
 
-@app.cli.command
+@app.cli.command()
+def recount():
+    """ 重新统计文章/评论/关注的冗余计数 """
+    fixed = Post.recount() + User.recount()
+    db.session.commit()
+    print('%d counter(s) fixed.' % fixed)
+
+
+@app.cli.command('rebuild-timeline')
+@click.option('--batch', default=1000, help='Users per batch')
+def rebuild_timeline(batch=1000):
+    """ 由关注关系和文章重建时间线 """
+    from app.models import TimelineEntry
+    print('%d timeline entries written.' % TimelineEntry.rebuild(batch))
+
+
+@app.cli.command()
+@click.option('--top', default=20, help='Number of statements to show')
+@click.option('--reset/--no-reset', default=False,
+              help='Delete the collected statistics')
+def dbstats(top=20, reset=False):
+    """ 查看各进程抽样统计的SQL语句, 按总耗时排序, 次数和总耗时为估计值 """
+    import shutil
+    from app.query_stats import QueryStats
+
+    directory = app.config['FLASKY_DB_STATS_DIR']
+    if reset:
+        shutil.rmtree(directory, ignore_errors=True)
+        print('Statistics in %s deleted.' % directory)
+        return
+    rows = sorted(QueryStats.load(directory).items(),
+                  key=lambda item: item[1][1], reverse=True)[:top]
+    print('%8s %10s %10s %10s %6s  %s' % ('calls', 'total(s)', 'mean(ms)',
+                                          'max(ms)', 'slow', 'statement'))
+    for statement, (calls, total, longest, slow) in rows:
+        print('%8.0f %10.3f %10.2f %10.2f %6d  %s' % (
+            calls, total, total / calls * 1000, longest * 1000, slow,
+            statement[:200]))
+
+
+@app.cli.command()
+@click.argument('kind', type=click.Choice(['posts', 'comments', 'users']))
+@click.option('--since', default=None,
+              help='Only rows updated since YYYY-MM-DD[THH:MM:SS]')
+@click.option('--after-id', default=0, help='Resume after this id')
+@click.option('--output', default='-', type=click.File('w'),
+              help='Output file, defaults to stdout')
+@click.option('--base-url', default='http://localhost/',
+              help='Base of the resource URLs in the output')
+def export(kind, since=None, after_id=0, output=None,
+           base_url='http://localhost/'):
+    """ 导出文章/评论/用户为NDJSON """
+    import sys
+    from app.api_1_0.export import export_lines, parse_since
+    from app.exceptions import ValidationError
+
+    try:
+        since = parse_since(since)
+    except ValidationError as e:
+        raise click.BadParameter(str(e), param_hint='--since')
+    count = 0
+    with app.test_request_context(base_url=base_url):
+        for line in export_lines(kind, since, after_id):
+            output.write(line)
+            count += 1
+    # 进度写到stderr, 不混入导出内容
+    print('%d %s exported.' % (count, kind), file=sys.stderr)
+
+
+@app.cli.command('build-graph')
+@click.option('--path', default=None,
+              help='Snapshot file, defaults to FLASKY_GRAPH_PATH')
+@click.option('--batch', default=10000, help='Rows per batch')
+def build_graph(path=None, batch=10000):
+    """ 导出关注关系图快照, 供推荐关注使用 """
+    import time
+    from app.graph import build
+
+    start = time.time()
+    nodes, edges = build(path or app.config['FLASKY_GRAPH_PATH'], batch)
+    print('%d users, %d follows in %.2fs' % (nodes - 1, edges,
+                                             time.time() - start))
+
+
+@app.cli.command()
+@click.option('--kind', default=None, type=click.Choice(['posts', 'comments']),
+              help='Only rebuild this index')
+@click.option('--batch', default=10000, help='Rows per batch')
+def reindex(kind=None, batch=10000):
+    """ 重建全文搜索索引, 修改FLASKY_SEARCH_CONFIG后需要运行 """
+    import time
+    from app.search import KINDS, reindex as reindex_kind
+
+    for name in [kind] if kind else KINDS:
+        start = time.time()
+
+        def progress(last_id, done):
+            print('%s: %d rows, up to id %d' % (name, done, last_id))
+
+        done = reindex_kind(name, batch=batch, callback=progress)
+        print('%s: %d rows indexed in %.2fs' % (name, done,
+                                                time.time() - start))
+
+
+@app.cli.command()
+@click.option('--users', default=1000, help='Users to create')
+@click.option('--follows', default=20, help='Average follows per user')
+@click.option('--posts', default=10000, help='Posts to create')
+@click.option('--comments', default=30000, help='Comments to create')
+@click.option('--seed', default=42, help='Random seed')
+@click.option('--batch', default=10000, help='Rows per insert batch')
+@click.option('--workers', default=None, type=int,
+              help='Rendering processes, defaults to CPU count')
+@click.option('--days', default=365, help='Time span of the data')
+@click.option('--end', default='2026-01-01',
+              help='Latest timestamp, YYYY-MM-DD')
+@click.option('--timeline/--no-timeline', default=True,
+              help='Rebuild timelines afterwards')
+def seed(users=1000, follows=20, posts=10000, comments=30000, seed=42,
+         batch=10000, workers=None, days=365, end='2026-01-01',
+         timeline=True):
+    """ 批量生成压测数据, 相同参数生成相同的数据集 """
+    import time
+    from datetime import datetime
+    from app.seed import Seeder, size_report
+
+    start = time.time()
+
+    def progress(table, done, total):
+        elapsed = time.time() - start
+        print('%s: %d%s rows, %.0fs' % (
+            table, done, '/%d' % total if total is not None else '', elapsed))
+
+    seeder = Seeder(users=users, follows=follows, posts=posts,
+                    comments=comments, seed=seed, batch=batch,
+                    workers=workers, days=days,
+                    end=datetime.strptime(end, '%Y-%m-%d'), callback=progress)
+    for step, seconds in seeder.run(timeline=timeline):
+        print('%-10s %8.2fs' % (step, seconds))
+    for table, rows, size in size_report():
+        print('%-17s %10d rows %12s' % (
+            table, rows, '%.1f MB' % (size / 1048576.0)
+            if size is not None else '-'))
+
+
+@app.cli.command()
+@click.option('--database', default=None,
+              help='Database URL, defaults to BENCH_DATABASE_URL or '
+                   'data-bench.sqlite')
+@click.option('--reseed/--no-reseed', default=False,
+              help='Regenerate the data even if the database has users')
+@click.option('--users', default=1000, help='Users to create')
+@click.option('--follows', default=20, help='Average follows per user')
+@click.option('--posts', default=10000, help='Posts to create')
+@click.option('--comments', default=30000, help='Comments to create')
+@click.option('--server', default='inprocess',
+              type=click.Choice(['inprocess', 'gunicorn']),
+              help='Call the WSGI app directly or through gunicorn')
+@click.option('--workers', default=2, help='Gunicorn worker processes')
+@click.option('--concurrency', default=4, help='Client threads')
+@click.option('--requests', default=500, help='Requests per endpoint')
+@click.option('--warmup', default=20, help='Warmup requests per thread')
+@click.option('--endpoint', multiple=True, help='Only these endpoints')
+@click.option('--output', default='bench.json', help='Results JSON file')
+@click.option('--baseline', default='bench-baseline.json',
+              help='Compare with this results file if it exists')
+@click.option('--save-baseline/--no-save-baseline', default=False,
+              help='Save the results as the new baseline')
+@click.option('--tolerance', default=0.1,
+              help='Allowed relative change before reporting a regression')
+def bench(database=None, reseed=False, users=1000, follows=20, posts=10000,
+          comments=30000, server='inprocess', workers=2, concurrency=4,
+          requests=500, warmup=20, endpoint=(), output='bench.json',
+          baseline='bench-baseline.json', save_baseline=False,
+          tolerance=0.1):
+    """ 压测各端点, 输出吞吐量和延迟分位数, 与基线比较 """
+    import json
+    import sys
+    from sqlalchemy.exc import DBAPIError
+    from benchmarks.load import ENDPOINTS, make_app, seed_database, run, \
+        compare
+
+    unknown = set(endpoint) - set(ENDPOINTS)
+    if unknown:
+        raise click.BadParameter('unknown endpoint(s): %s, choose from %s' % (
+            ', '.join(sorted(unknown)), ', '.join(ENDPOINTS)))
+    bench_app = make_app(database)
+    with bench_app.app_context():
+        try:
+            seeded = User.query.count() > 0
+        except DBAPIError:
+            # 表还不存在
+            seeded = False
+        db.session.remove()
+    if reseed or not seeded:
+        print('seeding %s' % bench_app.config['SQLALCHEMY_DATABASE_URI'])
+        for step, seconds in seed_database(
+                bench_app, users=users, follows=follows, posts=posts,
+                comments=comments):
+            print('%-10s %8.2fs' % (step, seconds))
+
+    print('%-16s %9s %9s %9s %9s %7s' % ('endpoint', 'req/s', 'p50(ms)',
+                                        'p95(ms)', 'p99(ms)', 'errors'))
+
+    def progress(name, result):
+        print('%-16s %9.1f %9.2f %9.2f %9.2f %7d' % (
+            name, result['throughput'], result['p50'], result['p95'],
+            result['p99'], result['errors']))
+
+    results = run(bench_app, server=server, endpoints=endpoint,
+                  requests=requests, concurrency=concurrency, warmup=warmup,
+                  workers=workers, callback=progress)
+    with open(output, 'w') as f:
+        json.dump(results, f, indent=2)
+    print('results written to %s' % output)
+    regressions = []
+    if os.path.exists(baseline):
+        with open(baseline) as f:
+            saved = json.load(f)
+        for key in ('server', 'workers', 'concurrency', 'database', 'rows'):
+            if saved['meta'].get(key) != results['meta'][key]:
+                print('warning: baseline %s was %s, now %s' % (
+                    key, saved['meta'].get(key), results['meta'][key]))
+        regressions = compare(results, saved, tolerance)
+        for name, metric, before, now in regressions:
+            print('REGRESSION %s %s: %s -> %s' % (name, metric, before, now))
+        if not regressions:
+            print('no regressions against %s' % baseline)
+    if save_baseline:
+        with open(baseline, 'w') as f:
+            json.dump(results, f, indent=2)
+        print('baseline saved to %s' % baseline)
+    if regressions:
+        sys.exit(1)
+
+
+@app.cli.command()
+@click.option('--chunk', default=1000, help='Rows per chunk')
+@click.option('--workers', default=None, type=int,
+              help='Worker processes, defaults to CPU count')
+@click.option('--since', default=None, help='Only rows since YYYY-MM-DD')
+@click.option('--resume/--no-resume', default=False,
+              help='Continue from the last processed id')
+@click.option('--state-file', default='rerender.json',
+              help='Where the last processed ids are saved')
+def rerender(chunk=1000, workers=None, since=None, resume=False,
+             state_file='rerender.json'):
+    """ 重新渲染文章和评论的body_html """
+    import json
+    import time
+    from datetime import datetime
+    from app.rerender import rerender_table
+
+    if since is not None:
+        since = datetime.strptime(since, '%Y-%m-%d')
+    state = {}
+    if resume and os.path.exists(state_file):
+        with open(state_file) as f:
+            state = json.load(f)
+    for model, profile in ((Post, 'post'), (Comment, 'comment')):
+        name = model.__tablename__
+        start = time.time()
+
+        def progress(last_id, done, total):
+            # 每块完成后记录断点
+            state[name] = last_id
+            with open(state_file, 'w') as f:
+                json.dump(state, f)
+            elapsed = time.time() - start
+            print('%s: %d/%d rows, last id %d, %.0f rows/s'
+                  % (name, done, total, last_id, done / max(elapsed, 1e-6)))
+
+        done = rerender_table(model, profile, chunk_size=chunk,
+                              workers=workers, since=since,
+                              start_after=state.get(name, 0),
+                              callback=progress)
+        print('%s: %d rows re-rendered in %.1fs'
+              % (name, done, time.time() - start))
+    if os.path.exists(state_file):
+        os.remove(state_file)
+
+
+@app.cli.command()
 def deploy():
     """ 部署命令 """
     # 自动执行命令
+    import time
     from flask_migrate import upgrade
     from app.models import Role, User
-    
+
+    def step(name, f, *args, **kwargs):
+        start = time.time()
+        result = f(*args, **kwargs)
+        print('%s: %.2fs' % (name, time.time() - start))
+        return result
+
     # 迁移数据库到最新版本
-    upgrade()
-    
-    Role.insert_roles()
-    
-    User.add_self_follows()
+    step('upgrade', upgrade)
+
+    step('insert_roles', Role.insert_roles)
+
+    def progress(last_id, added):
+        print('self follows: up to user %d, %d added' % (last_id, added))
+
+    added = step('add_self_follows', User.add_self_follows,
+                 callback=progress)
+    print('%d self follows added' % added)
 
 
 if __name__ == '__main__':
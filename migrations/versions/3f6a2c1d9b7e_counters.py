@@ -0,0 +1,45 @@
+"""denormalized counters
+
+Revision ID: 3f6a2c1d9b7e
+Revises: 508c2e23ece2
+Create Date: 2026-10-18 10:12:31.402117
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = '3f6a2c1d9b7e'
+down_revision = '508c2e23ece2'
+
+from alembic import op
+import sqlalchemy as sa
+
+
+def upgrade():
+    op.add_column('users', sa.Column('post_count', sa.Integer(),
+                                     server_default='0', nullable=True))
+    op.add_column('users', sa.Column('follower_count', sa.Integer(),
+                                     server_default='0', nullable=True))
+    op.add_column('users', sa.Column('followed_count', sa.Integer(),
+                                     server_default='0', nullable=True))
+    op.add_column('posts', sa.Column('comment_count', sa.Integer(),
+                                     server_default='0', nullable=True))
+    # 回填已有数据
+    op.execute('UPDATE users SET '
+               'post_count = (SELECT count(posts.id) FROM posts '
+               'WHERE posts.author_id = users.id), '
+               'follower_count = (SELECT count(*) FROM follows '
+               'WHERE follows.followed_id = users.id), '
+               'followed_count = (SELECT count(*) FROM follows '
+               'WHERE follows.follower_id = users.id)')
+    op.execute('UPDATE posts SET '
+               'comment_count = (SELECT count(comments.id) FROM comments '
+               'WHERE comments.post_id = posts.id)')
+
+
+def downgrade():
+    with op.batch_alter_table('posts') as batch_op:
+        batch_op.drop_column('comment_count')
+    with op.batch_alter_table('users') as batch_op:
+        batch_op.drop_column('followed_count')
+        batch_op.drop_column('follower_count')
+        batch_op.drop_column('post_count')
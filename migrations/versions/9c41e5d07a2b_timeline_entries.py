@@ -0,0 +1,39 @@
+"""timeline entries
+
+Revision ID: 9c41e5d07a2b
+Revises: 3f6a2c1d9b7e
+Create Date: 2026-10-18 11:03:52.771940
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = '9c41e5d07a2b'
+down_revision = '3f6a2c1d9b7e'
+
+from alembic import op
+import sqlalchemy as sa
+
+
+def upgrade():
+    op.create_table('timeline_entries',
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('post_id', sa.Integer(), nullable=False),
+    sa.Column('timestamp', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['post_id'], ['posts.id'], ),
+    sa.ForeignKeyConstraint(['user_id'], ['users.id'], ),
+    sa.PrimaryKeyConstraint('user_id', 'post_id')
+    )
+    op.create_index('ix_timeline_entries_user_id_timestamp',
+                    'timeline_entries', ['user_id', 'timestamp'],
+                    unique=False)
+    # 由已有的关注关系回填, 大表请改用 flask rebuild-timeline 分批执行
+    op.execute('INSERT INTO timeline_entries (user_id, post_id, timestamp) '
+               'SELECT follows.follower_id, posts.id, posts.timestamp '
+               'FROM follows JOIN posts '
+               'ON posts.author_id = follows.followed_id')
+
+
+def downgrade():
+    op.drop_index('ix_timeline_entries_user_id_timestamp',
+                  table_name='timeline_entries')
+    op.drop_table('timeline_entries')
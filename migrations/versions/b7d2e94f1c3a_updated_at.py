@@ -0,0 +1,45 @@
+"""updated_at columns
+
+Revision ID: b7d2e94f1c3a
+Revises: 9c41e5d07a2b
+Create Date: 2026-10-18 18:45:12.530264
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = 'b7d2e94f1c3a'
+down_revision = '9c41e5d07a2b'
+
+from alembic import op
+import sqlalchemy as sa
+
+
+def upgrade():
+    op.add_column('users', sa.Column('updated_at', sa.DateTime(),
+                                     nullable=True))
+    op.add_column('posts', sa.Column('updated_at', sa.DateTime(),
+                                     nullable=True))
+    op.add_column('comments', sa.Column('updated_at', sa.DateTime(),
+                                        nullable=True))
+    # 回填已有数据, 取已知的最近时间
+    op.execute('UPDATE users SET updated_at = '
+               'COALESCE(last_seen, member_since)')
+    op.execute('UPDATE posts SET updated_at = timestamp')
+    op.execute('UPDATE comments SET updated_at = timestamp')
+    # 增量导出 WHERE updated_at >= ? ORDER BY id
+    op.create_index('ix_users_updated_at_id', 'users', ['updated_at', 'id'])
+    op.create_index('ix_posts_updated_at_id', 'posts', ['updated_at', 'id'])
+    op.create_index('ix_comments_updated_at_id', 'comments',
+                    ['updated_at', 'id'])
+
+
+def downgrade():
+    op.drop_index('ix_comments_updated_at_id', table_name='comments')
+    op.drop_index('ix_posts_updated_at_id', table_name='posts')
+    op.drop_index('ix_users_updated_at_id', table_name='users')
+    with op.batch_alter_table('comments') as batch_op:
+        batch_op.drop_column('updated_at')
+    with op.batch_alter_table('posts') as batch_op:
+        batch_op.drop_column('updated_at')
+    with op.batch_alter_table('users') as batch_op:
+        batch_op.drop_column('updated_at')
@@ -0,0 +1,30 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# @Date     : 2026-10-18 14:05
+# @Author   : Bluethon (j5088794@gmail.com)
+# @Link     : http://github.com/bluethon
+
+from flask_sqlalchemy import get_debug_queries
+
+
+class QueryCountMixin(object):
+    """ 断言页面查询数有上限, 不随行数增长 """
+
+    def count_queries(self, func):
+        """ 执行func, 返回期间执行的SQL语句数 """
+        before = len(get_debug_queries())
+        func()
+        return len(get_debug_queries()) - before
+
+    def assertBoundedQueries(self, add_rows, render, sizes=(2, 10)):
+        """
+        add_rows(n) 补足到n行数据, render() 渲染页面
+        各行数下查询数必须相同, 返回该查询数
+        """
+        counts = []
+        for n in sizes:
+            add_rows(n)
+            counts.append(self.count_queries(render))
+        self.assertEqual(len(set(counts)), 1,
+                         'query count grows with rows: %r' % counts)
+        return counts[0]
@@ -8,14 +8,19 @@
 import unittest
 import json
 import re
-from base64 import b64encode
+from base64 import b64encode, urlsafe_b64encode
+from datetime import datetime
 from flask import url_for
+from flask_sqlalchemy import get_debug_queries
 
 from app import create_app, db
-from app.models import User, Role, Post, Comment
+from app.models import User, Role, Post, Comment, Permission, \
+    _auth_version
+from app.pagination import encode_cursor
+from . import QueryCountMixin
 
 
-class APITestCase(unittest.TestCase):
+class APITestCase(QueryCountMixin, unittest.TestCase):
     def setUp(self):
         self.app = create_app('testing')
         self.app_context = self.app.app_context()
@@ -284,3 +289,456 @@ class APITestCase(unittest.TestCase):
         json_response = json.loads(response.data.decode('utf-8'))
         self.assertIsNotNone(json_response.get('comments'))
         self.assertTrue(json_response.get('count', 0) == 2)
+
+    def test_cursor_pagination(self):
+        """ API 测试游标分页 """
+        r = Role.query.filter_by(name='User').first()
+        u = User(email='john@example.com', password='cat', confirmed=True,
+                 role=r)
+        db.session.add(u)
+        db.session.commit()
+        # 时间相同的文章按id排序
+        timestamp = datetime.utcnow()
+        posts = [Post(body='post %d' % i, author=u, timestamp=timestamp)
+                 for i in range(25)]
+        db.session.add_all(posts)
+        db.session.commit()
+        expected = [url_for('api.get_post', id=p.id, _external=True)
+                    for p in reversed(posts)]
+        headers = self.get_api_headers('john@example.com', 'cat')
+
+        # 下一页走到底
+        urls = []
+        url = url_for('api.get_posts')
+        pages = []
+        while url:
+            response = self.client.get(url, headers=headers)
+            self.assertTrue(response.status_code == 200)
+            json_response = json.loads(response.data.decode('utf-8'))
+            self.assertTrue(json_response['count'] == 25)
+            urls += [p['url'] for p in json_response['posts']]
+            pages.append(json_response)
+            url = json_response['next']
+        self.assertEqual(urls, expected)
+        self.assertIsNone(pages[0]['prev'])
+
+        # 从最后一页往回翻
+        response = self.client.get(pages[-1]['prev'], headers=headers)
+        json_response = json.loads(response.data.decode('utf-8'))
+        self.assertEqual(json_response['posts'], pages[-2]['posts'])
+
+        # 页数分页仍然可用
+        response = self.client.get(url_for('api.get_posts', page=3),
+                                   headers=headers)
+        json_response = json.loads(response.data.decode('utf-8'))
+        self.assertEqual(json_response['posts'], pages[2]['posts'])
+        self.assertTrue('page=2' in json_response['prev'])
+
+        # 游标无效, 包括格式正确但类型不对的
+        for cursor in ['bad', encode_cursor('next', [1, 2]),
+                       urlsafe_b64encode(b'["next",5]').decode('ascii'),
+                       urlsafe_b64encode(
+                           b'["next",["2016-01-01T00:00:00.000000",'
+                           b'Infinity]]').decode('ascii'),
+                       urlsafe_b64encode(
+                           b'["next",["2016-01-01T00:00:00.000000",'
+                           b'1e400]]').decode('ascii'),
+                       encode_cursor('next', ['2016-01-01T00:00:00.000000',
+                                              'x'])]:
+            response = self.client.get(
+                url_for('api.get_posts', cursor=cursor), headers=headers)
+            self.assertTrue(response.status_code == 400)
+
+    def test_collection_query_count(self):
+        """ API 集合查询数不随条数增长 """
+        r = Role.query.filter_by(name='User').first()
+        u = User(email='john@example.com', password='cat', confirmed=True,
+                 role=r)
+        post = Post(body='post', author=u)
+        db.session.add_all([u, post])
+        db.session.commit()
+        headers = self.get_api_headers('john@example.com', 'cat')
+
+        def add_rows(n):
+            for i in range(Comment.query.count(), n):
+                author = User(email='u%d@example.com' % i, password='cat')
+                p = Post(body='post %d' % i, author=author)
+                db.session.add_all([p, Comment(body='c', author=author,
+                                               post=post)])
+            db.session.commit()
+
+        for endpoint in ('api.get_posts', 'api.get_comments'):
+            self.assertBoundedQueries(
+                add_rows,
+                lambda: self.client.get(url_for(endpoint), headers=headers),
+                sizes=(2, 8))
+
+    def test_token_cache(self):
+        """ API 测试令牌认证缓存及失效 """
+        r = Role.query.filter_by(name='User').first()
+        u = User(email='john@example.com', password='cat', confirmed=True,
+                 role=r)
+        db.session.add(u)
+        db.session.commit()
+        token = u.generate_auth_token(3600)
+
+        snapshot = User.verify_auth_token_cached(token)
+        self.assertTrue(snapshot == u)
+        self.assertTrue(snapshot.can(Permission.WRITE_ARTICLES))
+        # 命中缓存不查库
+        self.assertEqual(self.count_queries(
+            lambda: User.verify_auth_token_cached(token)), 0)
+        self.assertIsNone(User.verify_auth_token_cached('bad-token'))
+
+        # 令牌认证可以发文章
+        response = self.client.post(
+            url_for('api.new_post'), headers=self.get_api_headers(token, ''),
+            data=json.dumps({'body': 'body'}))
+        self.assertTrue(response.status_code == 201)
+
+        # 角色变化后重新加载; 提交后才作废, 提交前其他请求读到的仍是旧行
+        version = _auth_version(u.id)
+        u.role = Role.query.filter_by(name='Moderator').first()
+        db.session.flush()
+        self.assertEqual(_auth_version(u.id), version)
+        db.session.commit()
+        self.assertNotEqual(_auth_version(u.id), version)
+        self.assertTrue(User.verify_auth_token_cached(token).can(
+            Permission.MODERATE_COMMENTS))
+
+        # 重新写入角色权限也作废缓存
+        version = _auth_version(u.id)
+        Role.insert_roles()
+        self.assertNotEqual(_auth_version(u.id), version)
+
+        # 取消激活后拒绝
+        u.confirmed = False
+        db.session.commit()
+        response = self.client.get(url_for('api.get_posts'),
+                                   headers=self.get_api_headers(token, ''))
+        self.assertTrue(response.status_code == 403)
+
+    def test_credentials_cache(self):
+        """ API 测试邮箱密码认证缓存及令牌首部 """
+        r = Role.query.filter_by(name='User').first()
+        u = User(email='john@example.com', password='cat', confirmed=True,
+                 role=r)
+        db.session.add(u)
+        db.session.commit()
+
+        self.assertTrue(User.verify_credentials_cached(
+            'john@example.com', 'cat') == u)
+        self.assertEqual(self.count_queries(
+            lambda: User.verify_credentials_cached('john@example.com',
+                                                   'cat')), 0)
+        self.assertIsNone(User.verify_credentials_cached(
+            'john@example.com', 'dog'))
+
+        # 改密码后旧密码立即失效
+        u.password = 'dog'
+        db.session.commit()
+        self.assertIsNone(User.verify_credentials_cached(
+            'john@example.com', 'cat'))
+        self.assertTrue(User.verify_credentials_cached(
+            'john@example.com', 'dog') == u)
+
+        # 改邮箱后旧邮箱立即失效
+        u.email = 'john@example.org'
+        db.session.commit()
+        self.assertIsNone(User.verify_credentials_cached(
+            'john@example.com', 'dog'))
+        u.email = 'john@example.com'
+        db.session.commit()
+
+        # 请求时附带令牌
+        headers = self.get_api_headers('john@example.com', 'dog')
+        response = self.client.get(url_for('api.get_posts'), headers=headers)
+        self.assertIsNone(response.headers.get('X-Auth-Token'))
+        headers['X-Request-Token'] = '1'
+        response = self.client.get(url_for('api.get_posts'), headers=headers)
+        token = response.headers.get('X-Auth-Token')
+        self.assertIsNotNone(token)
+        response = self.client.get(url_for('api.get_posts'),
+                                   headers=self.get_api_headers(token, ''))
+        self.assertTrue(response.status_code == 200)
+
+    def test_conditional_get(self):
+        """ API 测试ETag/Last-Modified条件请求 """
+        r = Role.query.filter_by(name='User').first()
+        u = User(email='john@example.com', password='cat', confirmed=True,
+                 role=r)
+        post = Post(body='body', author=u)
+        db.session.add_all([u, post])
+        db.session.commit()
+        headers = self.get_api_headers('john@example.com', 'cat')
+        urls = (url_for('api.get_post', id=post.id), url_for('api.get_posts'))
+
+        etags = {}
+        for url in urls:
+            response = self.client.get(url, headers=headers)
+            self.assertTrue(response.status_code == 200)
+            etags[url] = response.headers['ETag']
+            response = self.client.get(url, headers=dict(
+                headers, **{'If-None-Match': etags[url]}))
+            self.assertTrue(response.status_code == 304)
+            self.assertTrue(response.data == b'')
+
+        # 单个资源支持If-Modified-Since
+        url = url_for('api.get_post', id=post.id)
+        modified = self.client.get(url, headers=headers).headers[
+            'Last-Modified']
+        response = self.client.get(url, headers=dict(
+            headers, **{'If-Modified-Since': modified}))
+        self.assertTrue(response.status_code == 304)
+
+        # 新评论改变文章的评论数, ETag随之变化
+        db.session.add(Comment(body='comment', author=u, post=post))
+        db.session.commit()
+        for url in urls:
+            response = self.client.get(url, headers=dict(
+                headers, **{'If-None-Match': etags[url]}))
+            self.assertTrue(response.status_code == 200)
+
+    def test_serializers(self):
+        """ API 快速序列化与to_json输出一致 """
+        from app.api_1_0.serializers import POST_COLUMNS, COMMENT_COLUMNS, \
+            USER_COLUMNS, posts_json, comments_json, users_json
+
+        u = User(email='john@example.com', username='john', password='cat')
+        post = Post(body='*body*', author=u)
+        comment = Comment(body='comment', author=u, post=post)
+        db.session.add_all([u, post, comment])
+        db.session.commit()
+        with self.app.test_request_context():
+            for model, columns, serialize in (
+                    (Post, POST_COLUMNS, posts_json),
+                    (Comment, COMMENT_COLUMNS, comments_json),
+                    (User, USER_COLUMNS, users_json)):
+                expected = json.loads(json.dumps(
+                    model.query.first().to_json(),
+                    cls=self.app.json_encoder))
+                rows = model.query.with_entities(*columns).all()
+                self.assertEqual(serialize(rows), [expected])
+
+        # 模板按主机名缓存, 条数有上限
+        from app.api_1_0.serializers import URL_TEMPLATES_SIZE, url_templates
+        for i in range(URL_TEMPLATES_SIZE + 10):
+            with self.app.test_request_context(
+                    base_url='http://host%d.example.com' % i):
+                self.assertTrue('%d' in url_templates()['api.get_post'])
+        self.assertEqual(len(self.app.extensions['api_url_templates']),
+                         URL_TEMPLATES_SIZE)
+
+    def test_batch_create(self):
+        """ API 测试批量创建文章和评论 """
+        r = Role.query.filter_by(name='User').first()
+        u = User(email='john@example.com', password='cat', confirmed=True,
+                 role=r)
+        follower = User(email='susan@example.com', password='dog',
+                        confirmed=True, role=r)
+        db.session.add_all([u, follower])
+        db.session.commit()
+        follower.follow(u)
+        db.session.commit()
+        headers = self.get_api_headers('john@example.com', 'cat')
+
+        response = self.client.post(
+            url_for('api.new_posts_batch'), headers=headers,
+            data=json.dumps([{'body': '*one*'}, {'body': ''},
+                             {'body': 'two'}]))
+        self.assertTrue(response.status_code == 207)
+        results = json.loads(response.data.decode('utf-8'))['results']
+        self.assertEqual([result['status'] for result in results],
+                         [201, 400, 201])
+        response = self.client.get(results[0]['location'], headers=headers)
+        self.assertTrue(b'<em>one</em>' in response.data)
+        db.session.expire_all()
+        self.assertTrue(u.post_count == 2)
+        self.assertTrue(follower.timeline.count() == 2)
+
+        post = Post.query.filter_by(body='two').first()
+        before = len(get_debug_queries())
+        response = self.client.post(
+            url_for('api.new_post_comments_batch', id=post.id),
+            headers=headers,
+            data=json.dumps([{'body': 'c%d' % i} for i in range(3)]))
+        self.assertTrue(response.status_code == 201)
+        # 预先分配主键, 一条executemany插入全部评论
+        self.assertEqual(len([
+            query for query in get_debug_queries()[before:]
+            if query.statement.startswith('INSERT INTO comments')]), 1)
+        db.session.expire_all()
+        self.assertTrue(post.comment_count == 3)
+        self.assertEqual(sorted(comment.body for comment in post.comments),
+                         ['c0', 'c1', 'c2'])
+
+        # 正文不是字符串的项单独报错
+        response = self.client.post(
+            url_for('api.new_posts_batch'), headers=headers,
+            data=json.dumps([{'body': 5}, {'body': []}, {'body': 'three'}]))
+        self.assertTrue(response.status_code == 207)
+        results = json.loads(response.data.decode('utf-8'))['results']
+        self.assertEqual([result['status'] for result in results],
+                         [400, 400, 201])
+
+        # 超过批量上限
+        self.app.config['FLASKY_API_MAX_BATCH'] = 2
+        response = self.client.post(
+            url_for('api.new_posts_batch'), headers=headers,
+            data=json.dumps([{'body': 'x'}] * 3))
+        self.assertTrue(response.status_code == 400)
+
+    def test_export(self):
+        """ API 测试NDJSON流式导出 """
+        r = Role.query.filter_by(name='Administrator').first()
+        u = User(email='john@example.com', password='cat', confirmed=True,
+                 role=r)
+        db.session.add_all([Post(body='post %d' % i, author=u)
+                            for i in range(5)])
+        db.session.commit()
+        headers = self.get_api_headers('john@example.com', 'cat')
+
+        response = self.client.get(url_for('api.export', kind='posts'),
+                                   headers=headers)
+        self.assertTrue(response.status_code == 200)
+        self.assertTrue(response.mimetype == 'application/x-ndjson')
+        lines = [json.loads(line) for line in
+                 response.data.decode('utf-8').splitlines()]
+        self.assertEqual([line['body'] for line in lines],
+                         ['post %d' % i for i in range(5)])
+
+        # 中断后继续
+        response = self.client.get(
+            url_for('api.export', kind='posts', after_id=lines[2]['id']),
+            headers=headers)
+        self.assertEqual(len(response.data.decode('utf-8').splitlines()), 2)
+        response = self.client.get(
+            url_for('api.export', kind='users', since='2999-01-01'),
+            headers=headers)
+        self.assertTrue(response.data == b'')
+        response = self.client.get(
+            url_for('api.export', kind='users', since='yesterday'),
+            headers=headers)
+        self.assertTrue(response.status_code == 400)
+
+    def test_search_without_fts5(self):
+        """ API SQLite没有FTS5时跳过索引, 写入正常 """
+        from app import search
+
+        if db.engine.dialect.name != 'sqlite':
+            return
+        search._fts5[db.engine] = False
+        try:
+            u = User(email='john@example.com', password='cat', confirmed=True,
+                     role=Role.query.filter_by(name='User').first())
+            db.session.add(Post(body='apple pie', author=u))
+            db.session.commit()
+            self.assertEqual(search.reindex('posts'), 0)
+            response = self.client.get(
+                url_for('api.get_search', q='apple'),
+                headers=self.get_api_headers('john@example.com', 'cat'))
+            self.assertTrue(response.status_code == 400)
+        finally:
+            search._fts5.pop(db.engine)
+
+    def test_search(self):
+        """ API 测试全文搜索: 排序, 游标分页, 索引随增删改同步 """
+        from app.search import paginate_hits, reindex
+
+        r = Role.query.filter_by(name='User').first()
+        u = User(email='john@example.com', password='cat', confirmed=True,
+                 role=r)
+        posts = [Post(body='apple ' * (i + 1) + 'pie', author=u)
+                 for i in range(12)]
+        other = Post(body='banana bread', author=u)
+        db.session.add_all(posts + [other])
+        db.session.commit()
+        headers = self.get_api_headers('john@example.com', 'cat')
+
+        # 词出现次数越多越靠前, 第二页接着第一页
+        response = self.client.get(url_for('api.get_search', q='Apple'),
+                                   headers=headers)
+        self.assertTrue(response.status_code == 200)
+        json_response = json.loads(response.data.decode('utf-8'))
+        bodies = [item['body'] for item in json_response['posts']]
+        self.assertEqual(bodies, [p.body for p in posts[::-1][:10]])
+        scores = [item['score'] for item in json_response['posts']]
+        self.assertEqual(scores, sorted(scores, reverse=True))
+        self.assertIsNone(json_response['prev'])
+        response = self.client.get(json_response['next'], headers=headers)
+        json_response = json.loads(response.data.decode('utf-8'))
+        self.assertEqual([item['body'] for item in json_response['posts']],
+                         [posts[1].body, posts[0].body])
+        self.assertIsNone(json_response['next'])
+
+        # 修改和删除后索引同步
+        other.body = 'apple crumble'
+        db.session.delete(posts[0])
+        db.session.commit()
+        response = self.client.get(
+            url_for('api.get_search', q='crumble apple'), headers=headers)
+        json_response = json.loads(response.data.decode('utf-8'))
+        self.assertEqual([item['body'] for item in json_response['posts']],
+                         ['apple crumble'])
+        response = self.client.get(url_for('api.get_search', q='banana'),
+                                   headers=headers)
+        self.assertEqual(json.loads(response.data.decode('utf-8'))['posts'],
+                         [])
+
+        # 禁用的评论不可搜索, 重建索引结果相同
+        c1 = Comment(body='cherry tart', post=other, author=u)
+        c2 = Comment(body='cherry jam', post=other, author=u)
+        db.session.add_all([c1, c2])
+        db.session.commit()
+        c2.disabled = True
+        db.session.commit()
+        for i in range(2):
+            response = self.client.get(
+                url_for('api.get_search', q='cherry', kind='comments'),
+                headers=headers)
+            json_response = json.loads(response.data.decode('utf-8'))
+            self.assertEqual([item['body']
+                              for item in json_response['comments']],
+                             ['cherry tart'])
+            reindex('comments', batch=1)
+        Comment.insert_many(other.id, u.id, ['cherry pie'])
+        db.session.commit()
+        response = self.client.get(
+            url_for('api.get_search', q='pie', kind='comments'),
+            headers=headers)
+        self.assertEqual(len(json.loads(
+            response.data.decode('utf-8'))['comments']), 1)
+
+        # 重建期间搜索仍用旧表, 重建中的修改/新增/删除在替换前补上
+        def search(q):
+            with self.app.test_request_context():
+                return sorted(row.doc_id for row in
+                              paginate_hits('posts', q, 100).items)
+
+        expected = search('apple')
+        changes = []
+
+        def progress(last_id, done):
+            self.assertEqual(search('apple'), expected)
+            if not changes:
+                posts[1].body = 'cherry'
+                db.session.delete(posts[2])
+                changes.append(Post(body='apple strudel', author=u))
+                db.session.add(changes[0])
+                db.session.commit()
+                expected.remove(posts[1].id)
+                expected.remove(posts[2].id)
+                expected.append(changes[0].id)
+
+        self.assertEqual(reindex('posts', batch=5, callback=progress),
+                         len(expected) + 1)
+        self.assertEqual(search('apple'), expected)
+        self.assertEqual(search('cherry'), [posts[1].id])
+
+        response = self.client.get(url_for('api.get_search', q='"*'),
+                                   headers=headers)
+        self.assertTrue(response.status_code == 400)
+        response = self.client.get(
+            url_for('api.get_search', q='apple', kind='users'),
+            headers=headers)
+        self.assertTrue(response.status_code == 400)
@@ -0,0 +1,74 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# @Date     : 2026-10-19 00:40
+# @Author   : Bluethon (j5088794@gmail.com)
+# @Link     : http://github.com/bluethon
+
+import copy
+import os
+import shutil
+import tempfile
+import unittest
+
+from app import query_stats
+from benchmarks.load import compare, make_app, percentile, run, \
+    seed_database
+
+
+class BenchTestCase(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.app = make_app('sqlite:///' + os.path.join(self.directory,
+                                                        'bench.sqlite'))
+        # 生产配置会把SQL统计写到项目的tmp目录
+        query_stats.directory = None
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_percentile(self):
+        values = list(range(1, 101))
+        self.assertEqual([percentile(values, p) for p in (50, 95, 99, 100)],
+                         [50, 95, 99, 100])
+        self.assertEqual(percentile([7], 99), 7)
+        self.assertIsNone(percentile([], 50))
+
+    def test_run_and_compare(self):
+        seed_database(self.app, users=5, follows=2, posts=30, comments=30,
+                      batch=16, workers=1)
+        results = run(self.app, endpoints=['index', 'post', 'api_timeline',
+                                           'token'],
+                      requests=12, concurrency=2, warmup=1)
+        self.assertEqual(results['meta']['rows'], {'users': 5, 'posts': 30})
+        for name, result in results['endpoints'].items():
+            self.assertEqual((result['requests'], result['errors']), (12, 0),
+                             name)
+            self.assertTrue(0 < result['p50'] <= result['p95'] <=
+                            result['p99'])
+        self.assertEqual(compare(results, results), [])
+
+        # 基线快一倍, 延迟和吞吐量都算退步
+        baseline = copy.deepcopy(results)
+        post = baseline['endpoints']['post']
+        for key in ('p50', 'p95', 'p99'):
+            post[key] = (post[key] - 1) / 2
+        post['throughput'] *= 2
+        self.assertEqual([(name, metric) for name, metric, before, now
+                          in compare(results, baseline)],
+                         [('post', 'p50'), ('post', 'p95'), ('post', 'p99'),
+                          ('post', 'throughput')])
+
+    def test_hot_paths(self):
+        from benchmarks.hot_paths import measure, run as run_hot_paths
+
+        calls = []
+        result = measure(lambda: calls.append(object()), rounds=3, number=5)
+        # 预热1次, 计时3轮各5次, 内存峰值1次, 保留块5次
+        self.assertEqual(len(calls), 1 + 15 + 1 + 5)
+        self.assertTrue(0 < result['min'] <= result['median'])
+        # 每次保留一个新对象
+        self.assertTrue(result['retained_blocks'] >= 1)
+
+        results = run_hot_paths('to_json', rounds=2, number=3)
+        self.assertEqual(list(results['results']),
+                         ['post.to_json', 'comment.to_json', 'user.to_json'])
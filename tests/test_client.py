@@ -6,15 +6,19 @@
 
 
 import re
+import shutil
+import tempfile
 import unittest
+from datetime import datetime
 
 from flask import url_for
 
-from app import create_app, db
-from app.models import User, Role
+from app import create_app, db, teardown_commit, fragment_cache
+from app.models import User, Role, Post, Comment
+from . import QueryCountMixin
 
 
-class FlaskClientTestCase(unittest.TestCase):
+class FlaskClientTestCase(QueryCountMixin, unittest.TestCase):
     def setUp(self):
         self.app = create_app('testing')
         self.app_context = self.app.app_context()
@@ -66,3 +70,222 @@ class FlaskClientTestCase(unittest.TestCase):
         # 注销登陆
         response = self.client.get(url_for('auth.logout'), follow_redirects=True)
         self.assertTrue(b'You have been logged out' in response.data)
+
+    def test_index_query_count(self):
+        """ 首页查询数不随文章数增长 """
+        def add_posts(n):
+            for i in range(Post.query.count(), n):
+                # 每篇文章不同作者
+                u = User(email='u%d@example.com' % i, username='u%d' % i,
+                         password='cat')
+                p = Post(body='post %d' % i, author=u)
+                db.session.add_all([p, Comment(body='c', author=u, post=p)])
+            db.session.commit()
+
+        def render():
+            response = self.client.get(url_for('main1.index'))
+            self.assertTrue(b'1 Comments' in response.data)
+
+        self.assertBoundedQueries(add_posts, render)
+
+    def test_post_query_count(self):
+        """ 文章页查询数不随评论数增长 """
+        u = User(email='john@example.com', username='john', password='cat')
+        post = Post(body='post', author=u)
+        db.session.add(post)
+        db.session.commit()
+        post_id = post.id
+
+        def add_comments(n):
+            for i in range(Comment.query.count(), n):
+                author = User(email='u%d@example.com' % i,
+                              username='u%d' % i, password='cat')
+                db.session.add(Comment(body='comment %d' % i, author=author,
+                                       post_id=post_id))
+            db.session.commit()
+
+        self.assertBoundedQueries(
+            add_comments,
+            lambda: self.client.get(url_for('main1.post', id=post_id)))
+
+    def test_cursor_pagination(self):
+        """ 首页游标分页链接 """
+        u = User(email='john@example.com', username='john', password='cat')
+        db.session.add_all([Post(body='post %d' % i, author=u)
+                            for i in range(15)])
+        db.session.commit()
+        response = self.client.get(url_for('main1.index'))
+        self.assertTrue(b'post 14' in response.data)
+        self.assertFalse(b'post 4<' in response.data)
+        next_url = re.search(b'href="\\s*(/\\?cursor=[^"\\s]+)',
+                             response.data).group(1)
+        response = self.client.get(next_url.decode('utf-8'))
+        self.assertTrue(b'post 4<' in response.data)
+        self.assertFalse(b'post 14' in response.data)
+        for endpoint in ('main1.user', 'main1.followers', 'main1.followed_by'):
+            response = self.client.get(url_for(endpoint, username='john'))
+            self.assertTrue(response.status_code == 200)
+
+    def test_teardown_commit(self):
+        """ 只读请求结束时不提交 """
+        commits, skipped = teardown_commit.commits, teardown_commit.skipped
+        db.session.add(User(email='john@example.com', username='john',
+                            password='cat'))
+        db.session.flush()
+        teardown_commit.shutdown_session(None)
+        self.assertTrue(teardown_commit.commits == commits + 1)
+        User.query.filter_by(username='john').first()
+        teardown_commit.shutdown_session(None)
+        self.assertTrue(teardown_commit.skipped == skipped + 1)
+        # 已提交的数据不受回滚影响
+        db.session.remove()
+        self.assertIsNotNone(User.query.filter_by(username='john').first())
+
+    def test_metrics(self):
+        """ 请求指标需令牌, 按端点输出直方图 """
+        self.app.config['FLASKY_METRICS_TOKEN'] = 'secret'
+        self.client.get(url_for('main1.index'))
+        response = self.client.get(url_for('main1.metrics'))
+        self.assertTrue(response.status_code == 403)
+        response = self.client.get(url_for('main1.metrics'), headers={
+            'Authorization': 'Bearer secret'})
+        self.assertTrue(response.status_code == 200)
+        data = response.get_data(as_text=True)
+        self.assertTrue('flasky_request_latency_seconds_bucket{'
+                        'endpoint="main1.index",le="+Inf"}' in data)
+        match = re.search(r'flasky_request_queries_count'
+                          r'\{endpoint="main1.index"\} (\d+)', data)
+        self.assertTrue(int(match.group(1)) >= 1)
+        # 每个测试都create_app, 计数器不重复输出
+        self.assertEqual(
+            data.count('# HELP flasky_teardown_commits_total '), 1)
+
+    def test_page_cache(self):
+        """ 匿名整页缓存, 写入后失效 """
+        u = User(email='john@example.com', username='john', password='cat',
+                 confirmed=True)
+        post = Post(body='post', author=u)
+        db.session.add(post)
+        db.session.commit()
+        url = url_for('main1.post', id=post.id)
+        self.client.get(url)
+        # 命中缓存不查库
+        self.assertEqual(self.count_queries(lambda: self.client.get(url)), 0)
+        # https页面单独缓存, 头像地址不同
+        response = self.client.get(url_for('main1.post', id=post.id,
+                                           _external=True, _scheme='https'))
+        self.assertTrue(b'https://secure.gravatar.com' in response.data)
+
+        db.session.add(Comment(body='new comment', author=u, post=post))
+        db.session.commit()
+        response = self.client.get(url)
+        self.assertTrue(b'new comment' in response.data)
+
+        # 用户页显示评论数, 评论别人的文章后也失效
+        other = Post(body='other', author=User(
+            email='susan@example.com', username='susan', password='dog'))
+        db.session.add(other)
+        db.session.commit()
+        other_id, user_id = other.id, u.id
+        # 测试与请求共用session, 清空后页面标签只含页面读取的行
+        db.session.expunge_all()
+        user_url = url_for('main1.user', username='john')
+        response = self.client.get(user_url)
+        self.assertTrue(b'1 comments' in response.data)
+        db.session.add(Comment(body='another', author_id=user_id,
+                               post_id=other_id))
+        db.session.commit()
+        response = self.client.get(user_url)
+        self.assertTrue(b'2 comments' in response.data)
+
+        # 登录用户不使用缓存
+        self.client.post(url_for('auth.login'), data={
+            'email': 'john@example.com', 'password': 'cat'})
+        self.assertTrue(self.count_queries(lambda: self.client.get(url)) > 0)
+
+    def test_page_cache_filesystem(self):
+        """ 文件后端由标签失效时间判断过期 """
+        from app.page_cache import FileSystemBackend
+        directory = tempfile.mkdtemp()
+        try:
+            backend = FileSystemBackend(directory)
+            backend.set('/', {'created': 1.0, 'tags': ['posts']}, 60)
+            self.assertEqual(backend.get('/')['created'], 1.0)
+            self.assertEqual(backend.invalidated_at(['posts']), 0)
+            backend.invalidate(['posts'], 2.0)
+            self.assertEqual(backend.invalidated_at(['posts', 'x']), 2.0)
+        finally:
+            shutil.rmtree(directory)
+
+    def test_page_cache_tags_expire(self):
+        """ 标签失效时间只保留一个缓存过期时间 """
+        from app.page_cache import MemoryBackend
+        backend = MemoryBackend(timeout=80)
+        backend.invalidate(['posts:1', 'posts'], 1.0)
+        backend.invalidate(['posts'], 30.0)
+        self.assertEqual(backend.invalidated_at(['posts:1']), 1.0)
+        backend.invalidate(['posts:2'], 100.0)
+        self.assertEqual(backend.invalidated_at(['posts:1']), 0)
+        self.assertEqual(backend.invalidated_at(['posts']), 30.0)
+        self.assertEqual(len(backend._tags), 2)
+
+    def test_fragment_cache(self):
+        """ 片段缓存复用, 编辑按钮按当前用户填入 """
+        u = User(email='john@example.com', username='john', password='cat',
+                 confirmed=True)
+        db.session.add(Post(body='post', author=u))
+        db.session.commit()
+        fragment_cache.clear()
+        response = self.client.get(url_for('main1.user', username='john'))
+        self.assertFalse(b'label-primary">Edit' in response.data)
+        self.assertTrue(fragment_cache.misses == 1)
+
+        self.client.post(url_for('auth.login'), data={
+            'email': 'john@example.com', 'password': 'cat'})
+        response = self.client.get(url_for('main1.user', username='john'))
+        self.assertTrue(b'label-primary">Edit' in response.data)
+        self.assertTrue(fragment_cache.hits == 1)
+
+        # 作者资料变化后重新渲染
+        u.username = 'johnny'
+        db.session.commit()
+        response = self.client.get(url_for('main1.user', username='johnny'))
+        self.assertTrue(b'/user/johnny' in response.data)
+        self.assertTrue(fragment_cache.misses == 2)
+
+        # 不显示的字段(如最后访问时间)变化不影响
+        users = User.__table__
+        db.session.execute(users.update().values(
+            last_seen=datetime.utcnow(), updated_at=datetime.utcnow()))
+        db.session.commit()
+        self.client.get(url_for('main1.user', username='johnny'))
+        self.assertTrue(fragment_cache.misses == 2)
+        # https页面的头像地址不同, 单独缓存
+        response = self.client.get(url_for(
+            'main1.user', username='johnny', _external=True, _scheme='https'))
+        self.assertTrue(b'https://secure.gravatar.com' in response.data)
+        self.assertTrue(fragment_cache.misses == 3)
+
+    def test_search(self):
+        """ 搜索页, 文章和评论分页签显示 """
+        u = User(email='john@example.com', username='john', password='cat',
+                 confirmed=True)
+        p = Post(body='searchable *post*', author=u)
+        db.session.add_all([p, Post(body='other', author=u),
+                            Comment(body='searchable comment', post=p,
+                                    author=u)])
+        db.session.commit()
+        response = self.client.get(url_for('main1.search', q='searchable'))
+        self.assertTrue(response.status_code == 200)
+        data = response.get_data(as_text=True)
+        self.assertTrue('<em>post</em>' in data)
+        self.assertFalse('other' in data)
+        response = self.client.get(url_for('main1.search', q='searchable',
+                                           kind='comments'))
+        self.assertTrue('searchable comment' in response.get_data(
+            as_text=True))
+        response = self.client.get(url_for('main1.search', q='missing'))
+        self.assertTrue('No results' in response.get_data(as_text=True))
+        response = self.client.get(url_for('main1.search', q='x',
+                                           kind='users'))
+        self.assertTrue(response.status_code == 404)
@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# @Date     : 2026-10-18 23:40
+# @Author   : Bluethon (j5088794@gmail.com)
+# @Link     : http://github.com/bluethon
+
+import json
+import os
+import shutil
+import tempfile
+import time
+import unittest
+from base64 import b64encode
+
+from flask import url_for
+
+from app import create_app, db, follow_graph
+from app.graph import Snapshot, build
+from app.models import User, Role
+
+
+class FollowGraphTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('testing')
+        self.directory = tempfile.mkdtemp()
+        self.app.config['FLASKY_GRAPH_PATH'] = os.path.join(
+            self.directory, 'graph.bin')
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        Role.insert_roles()
+        self.client = self.app.test_client()
+        # 0 -> 1, 2; 1 -> 3, 4; 2 -> 3; 3 -> 0
+        self.users = [User(email='u%d@example.com' % i, password='cat',
+                           confirmed=True) for i in range(5)]
+        db.session.add_all(self.users)
+        db.session.commit()
+        for follower, followed in ((0, 1), (0, 2), (1, 3), (1, 4), (2, 3),
+                                   (3, 0)):
+            self.users[follower].follow(self.users[followed])
+        db.session.commit()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+        shutil.rmtree(self.directory)
+
+    def test_build(self):
+        path = self.app.config['FLASKY_GRAPH_PATH']
+        ids = [u.id for u in self.users]
+        nodes, edges = build(path, batch=2)
+        self.assertEqual((nodes, edges), (max(ids) + 1, 6))
+        snapshot = Snapshot(path)
+        self.assertEqual(list(snapshot.following(ids[0])), [ids[1], ids[2]])
+        self.assertEqual(list(snapshot.following(ids[4])), [])
+        self.assertEqual(list(snapshot.following(10000)), [])
+        # 3经1和2两条路径, 4经1一条, 0自己不推荐
+        self.assertEqual(snapshot.suggestions(ids[0]),
+                         [(ids[3], 2), (ids[4], 1)])
+        self.assertEqual(snapshot.suggestions(ids[0], exclude=[ids[3]]),
+                         [(ids[4], 1)])
+        # 超过上限时均匀抽取: 只取1, 或1只取3
+        self.assertEqual(snapshot.suggestions(ids[0], max_following=1),
+                         [(ids[3], 1), (ids[4], 1)])
+        self.assertEqual(snapshot.suggestions(ids[0], max_neighbors=1),
+                         [(ids[3], 2)])
+
+    def test_suggestions_api(self):
+        headers = {
+            'Authorization': 'Basic ' + b64encode(
+                b'u0@example.com:cat').decode('utf-8'),
+            'Accept': 'application/json',
+        }
+        u0, u3 = self.users[0], self.users[3]
+        url = url_for('api.get_user_suggestions', id=u0.id)
+        response = self.client.get(url, headers=headers)
+        data = json.loads(response.data.decode('utf-8'))
+        self.assertEqual(data, {'users': [], 'snapshot': None})
+
+        build(self.app.config['FLASKY_GRAPH_PATH'])
+        response = self.client.get(url, headers=headers)
+        data = json.loads(response.data.decode('utf-8'))
+        self.assertEqual([(u['username'], u['mutual_follows'])
+                          for u in data['users']],
+                         [(u3.username, 2), (self.users[4].username, 1)])
+
+        # 快照之后的关注按实时关注集合排除, 重建后各进程换用新快照
+        u0.follow(u3)
+        db.session.commit()
+        response = self.client.get(url + '?limit=5', headers=headers)
+        data = json.loads(response.data.decode('utf-8'))
+        self.assertEqual(len(data['users']), 1)
+        before = follow_graph.snapshot()
+        build(self.app.config['FLASKY_GRAPH_PATH'])
+        self.assertIsNot(follow_graph.snapshot(), before)
+
+    def test_refresh_async(self):
+        path = self.app.config['FLASKY_GRAPH_PATH']
+        self.app.config['FLASKY_GRAPH_REFRESH_INTERVAL'] = 3600
+        follow_graph._attempted = 0
+        rebuilds = follow_graph.rebuilds
+        # 没有快照时不阻塞请求, 后台生成
+        with self.app.test_request_context():
+            self.assertIsNone(follow_graph.snapshot())
+        for i in range(100):
+            if follow_graph.rebuilds > rebuilds:
+                break
+            time.sleep(0.05)
+        self.assertEqual(follow_graph.rebuilds, rebuilds + 1)
+        self.assertEqual(follow_graph.snapshot().edges, 6)
+        self.assertTrue(os.path.exists(path))
@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# @Date     : 2026-10-18 18:30
+# @Author   : Bluethon (j5088794@gmail.com)
+# @Link     : http://github.com/bluethon
+
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+from unittest import mock
+
+from app import create_app, db, query_stats
+from app.models import User
+from app.query_stats import QueryStats, fingerprint
+
+
+class QueryStatsTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('testing')
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+        query_stats.sample_rate = \
+            self.app.config['FLASKY_DB_STATS_SAMPLE_RATE']
+        query_stats.slow_time = self.app.config['FLASKY_SLOW_DB_QUERY_TIME']
+        query_stats.reset()
+
+    def test_fingerprint(self):
+        """ 测试去掉字面量和参数 """
+        self.assertEqual(
+            fingerprint("SELECT * FROM users WHERE id IN (1, 2,  3)\n"
+                        "AND name = 'o''brien' LIMIT ? OFFSET :offset"),
+            'SELECT * FROM users WHERE id IN (?+) AND name = ? '
+            'LIMIT ? OFFSET ?')
+
+    def test_record(self):
+        """ 测试抽中的语句按抽样比例放大计入 """
+        query_stats.reset()
+        query_stats.sample_rate = 1.0
+        for i in range(3):
+            User.query.filter_by(id=i).first()
+        top = query_stats.top(1)
+        self.assertTrue('FROM users' in top[0][0])
+        self.assertTrue(top[0][1] == 3)
+
+        query_stats.reset()
+        query_stats.sample_rate = 0.25
+        # app.query_stats是扩展实例, 经模块对象替换random
+        module = sys.modules['app.query_stats']
+        with mock.patch.object(module.random, 'random', return_value=0):
+            for i in range(3):
+                User.query.filter_by(id=i).first()
+        self.assertEqual(query_stats.top(1)[0][1], 12)
+
+    def test_slow_always_recorded(self):
+        """ 测试不抽样时慢查询仍经游标事件记录, 按1计入 """
+        query_stats.reset()
+        query_stats.sample_rate = 0
+        User.query.first()
+        self.assertEqual(query_stats.top(), [])
+        query_stats.slow_time = 0
+        User.query.first()
+        top = query_stats.top()
+        self.assertTrue('FROM users' in top[0][0])
+        self.assertEqual((top[0][1], top[0][4]), (1, 1))
+
+    def test_flush_and_load(self):
+        """ 测试各进程汇总写入文件后合并 """
+        stats = QueryStats()
+        stats.directory = tempfile.mkdtemp()
+        stats.record('SELECT 1', 0.5)
+        stats.record('SELECT 2', 0.25)
+        stats.flush()
+        merged = QueryStats.load(stats.directory)
+        self.assertEqual(merged['SELECT ?'][0], 2)
+        self.assertTrue(os.listdir(stats.directory))
+        shutil.rmtree(stats.directory)
@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# @Date     : 2026-10-18 14:58
+# @Author   : Bluethon (j5088794@gmail.com)
+# @Link     : http://github.com/bluethon
+
+
+import unittest
+from datetime import datetime
+
+from app import create_app, db, page_cache
+from app.models import User, Role, Post
+from app.rendering import Renderer
+from app.rerender import rerender_table
+
+
+class RendererTestCase(unittest.TestCase):
+    def setUp(self):
+        self.renderer = Renderer(maxsize=2)
+
+    def test_render(self):
+        """ 测试渲染及过滤 """
+        html = self.renderer.render('# title\n\n*a* http://example.com',
+                                    'post')
+        self.assertTrue('<h1>title</h1>' in html)
+        self.assertTrue('<a href="http://example.com"' in html)
+        # 评论不允许标题标签
+        html = self.renderer.render('# title', 'comment')
+        self.assertEqual(html, 'title')
+
+    def test_cache(self):
+        """ 测试按内容缓存 """
+        first = self.renderer.render('body', 'post')
+        self.assertEqual(self.renderer.render('body', 'post'), first)
+        self.assertEqual((self.renderer.hits, self.renderer.misses), (1, 1))
+        # profile不同不共用缓存
+        self.renderer.render('body', 'comment')
+        self.assertEqual(self.renderer.misses, 2)
+
+    def test_lru(self):
+        """ 测试超过容量淘汰最久未用 """
+        self.renderer.render('a', 'post')
+        self.renderer.render('b', 'post')
+        self.renderer.render('a', 'post')
+        self.renderer.render('c', 'post')
+        self.renderer.render('a', 'post')
+        self.assertEqual(self.renderer.misses, 3)
+        self.renderer.render('b', 'post')
+        self.assertEqual(self.renderer.misses, 4)
+
+    def test_render_many(self):
+        """ 测试批量渲染, 重复内容只渲染一次 """
+        results = self.renderer.render_many(['a', '*b*', 'a'], 'post')
+        self.assertEqual(results, ['<p>a</p>', '<p><em>b</em></p>',
+                                   '<p>a</p>'])
+        self.assertEqual(self.renderer.misses, 2)
+
+
+class RerenderTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('testing')
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        Role.insert_roles()
+        u = User(email='john@example.com', password='cat')
+        self.posts = [Post(body='*post %d*' % i, author=u,
+                           timestamp=datetime(2016, 1, i + 1))
+                      for i in range(5)]
+        db.session.add_all(self.posts)
+        db.session.commit()
+        self.ids = [p.id for p in self.posts]
+        db.session.execute(Post.__table__.update().values(body_html=None))
+        db.session.commit()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def body_html(self):
+        return [row[0] for row in db.session.execute(
+            db.select([Post.__table__.c.body_html])
+            .order_by(Post.__table__.c.id))]
+
+    def test_rerender(self):
+        """ 测试分块重新渲染及进度回调 """
+        progress = []
+        before = datetime.utcnow()
+        done = rerender_table(Post, 'post', chunk_size=2, workers=1,
+                              callback=lambda *args: progress.append(args))
+        self.assertEqual(done, 5)
+        # 片段/ETag依赖的修改时间更新, 整页缓存失效
+        self.assertTrue(all(p.updated_at >= before for p in Post.query))
+        self.assertTrue(page_cache.backend.invalidated_at(
+            ['posts:%d' % self.ids[4]]) > 0)
+        self.assertEqual(self.body_html(), ['<p><em>post %d</em></p>' % i
+                                            for i in range(5)])
+        self.assertEqual(progress, [(self.ids[1], 2, 5), (self.ids[3], 4, 5),
+                                    (self.ids[4], 5, 5)])
+
+    def test_rerender_resume_and_since(self):
+        """ 测试断点继续及时间过滤 """
+        done = rerender_table(Post, 'post', chunk_size=2, workers=1,
+                              since=datetime(2016, 1, 2),
+                              start_after=self.ids[2])
+        self.assertEqual(done, 2)
+        self.assertEqual(self.body_html()[:3], [None, None, None])
+
+    def test_rerender_processes(self):
+        """ 测试多进程渲染 """
+        done = rerender_table(Post, 'post', chunk_size=2, workers=2)
+        self.assertEqual(done, 5)
+        self.assertTrue(None not in self.body_html())
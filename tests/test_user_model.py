@@ -9,11 +9,15 @@ import unittest
 import time
 from datetime import datetime
 
-from app import create_app, db
-from app.models import User, AnonymousUser, Role, Permission, Follow
+from flask_login import login_user
 
+from app import create_app, db, last_seen
+from app.models import User, AnonymousUser, Role, Permission, Follow, \
+    Post, Comment, TimelineEntry
+from . import QueryCountMixin
 
-class UserModelTestCase(unittest.TestCase):
+
+class UserModelTestCase(QueryCountMixin, unittest.TestCase):
     def setUp(self):
         # 使用测试配置创建程序
         self.app = create_app('testing')
@@ -162,9 +166,41 @@ class UserModelTestCase(unittest.TestCase):
         db.session.commit()
         time.sleep(2)
         last_seen_before = u.last_seen
+        self.app.config['FLASKY_LAST_SEEN_INTERVAL'] = 1
         u.ping()
         self.assertTrue(u.last_seen > last_seen_before)
 
+    def test_ping_buffered(self):
+        """ 测试最后访问时间跳过及合并写入 """
+        u1 = User(email='john@example.com', password='cat')
+        u2 = User(email='susan@example.org', password='dog')
+        db.session.add_all([u1, u2])
+        db.session.commit()
+        # 刚创建, 间隔内不更新
+        before = u1.last_seen
+        u1.ping()
+        self.assertEqual(u1.last_seen, before)
+
+        self.app.config['FLASKY_LAST_SEEN_INTERVAL'] = 0
+        self.app.config['FLASKY_LAST_SEEN_BUFFER_SIZE'] = 2
+        flushes = last_seen.flushes
+        u1.ping()
+        u1.ping()
+        # 只改内存, 没有待提交的修改
+        self.assertFalse(db.session.is_modified(u1))
+        self.assertEqual(last_seen.flushes, flushes)
+        # 攒够条数, 由后台线程写入
+        u2.ping()
+        for i in range(100):
+            if last_seen.flushes > flushes:
+                break
+            time.sleep(0.02)
+        self.assertEqual(last_seen.flushes, flushes + 1)
+        expected = u1.last_seen
+        db.session.expire_all()
+        self.assertEqual(u1.last_seen, expected)
+        self.assertTrue(u2.last_seen > before)
+
     def test_gravatar(self):
         """ 测试头像 """
         u = User(email='john@example.com', password='cat')
@@ -223,6 +259,49 @@ class UserModelTestCase(unittest.TestCase):
         db.session.commit()
         self.assertTrue(Follow.query.count() - 1 == 0)
 
+    def test_follow_cache(self):
+        """ 测试当前用户的关注集合缓存: 重复判断不查库, 关注变化后立即生效 """
+        users = [User(email='u%d@example.com' % i, password='cat')
+                 for i in range(6)]
+        db.session.add_all(users)
+        db.session.commit()
+        u = users[0]
+        for other in users[1:4]:
+            u.follow(other)
+        db.session.commit()
+        ids = [other.id for other in users]
+        with self.app.test_request_context():
+            login_user(u)
+            self.assertEqual(list(u.followed_ids()), sorted(ids[:4]))
+            self.assertEqual(self.count_queries(
+                lambda: [u.is_following(other) for other in users]), 0)
+            self.assertEqual(u.following_among(ids + [1000]), set(ids[:4]))
+            self.assertTrue(users[1].is_followed_by(u))
+            # 其他用户不缓存, 每次用索引点查
+            self.assertEqual(self.count_queries(
+                lambda: [users[1].is_following(u) for i in range(2)]), 2)
+            self.assertEqual(users[1].following_among(ids), {ids[1]})
+            # 未提交的关注也能判断, 与原先的查询一致
+            u.follow(users[4])
+            self.assertTrue(u.is_following(users[4]))
+            u.unfollow(users[1])
+            db.session.commit()
+            self.assertFalse(u.is_following(users[1]))
+        # 其他进程的变化: 本进程版本不变, 下个请求加载的关注数与缓存不同
+        follows = Follow.__table__
+        db.session.execute(follows.insert().values(
+            follower_id=u.id, followed_id=users[5].id))
+        db.session.execute(User.__table__.update().where(
+            User.id == u.id).values(followed_count=User.followed_count + 1))
+        db.session.commit()
+        with self.app.test_request_context():
+            # 每个请求由load_user重新加载当前用户
+            db.session.refresh(u)
+            login_user(u)
+            self.assertTrue(u.is_following(users[5]))
+        # 请求外不缓存
+        self.assertTrue(u.is_following(users[5]))
+
     def test_to_json(self):
         u = User(email='john@example.com', password='cat')
         db.session.add(u)
@@ -232,3 +311,149 @@ class UserModelTestCase(unittest.TestCase):
                          'post', 'followed_posts', 'post_count']
         self.assertEqual(sorted(json_user.keys()), sorted(expected_keys))
         self.assertTrue('api/v1.0/users/' in json_user['url'])
+
+    def test_counters(self):
+        """ 测试冗余计数随插入删除更新 """
+        u1 = User(email='john@example.com', password='cat')
+        u2 = User(email='susan@example.org', password='dog')
+        db.session.add_all([u1, u2])
+        db.session.commit()
+        # 自关注也计入
+        self.assertEqual(u1.follower_count, 1)
+        self.assertEqual(u1.followed_count, 1)
+        self.assertEqual(u1.post_count, 0)
+        u1.follow(u2)
+        p = Post(body='body', author=u1)
+        db.session.add(p)
+        db.session.commit()
+        c = Comment(body='comment', author=u2, post=p)
+        db.session.add(c)
+        db.session.commit()
+        self.assertEqual(u1.post_count, 1)
+        self.assertEqual(u1.followed_count, 2)
+        self.assertEqual(u2.follower_count, 2)
+        self.assertEqual(p.comment_count, 1)
+        db.session.delete(c)
+        u1.unfollow(u2)
+        db.session.commit()
+        self.assertEqual(p.comment_count, 0)
+        self.assertEqual(u1.followed_count, 1)
+        self.assertEqual(u2.follower_count, 1)
+
+    def test_recount(self):
+        """ 测试修正有偏差的计数 """
+        u = User(email='john@example.com', password='cat')
+        p = Post(body='body', author=u)
+        db.session.add_all([u, p])
+        db.session.commit()
+        u.post_count = 5
+        p.comment_count = None
+        db.session.commit()
+        self.assertEqual(Post.recount() + User.recount(), 2)
+        db.session.commit()
+        self.assertEqual(u.post_count, 1)
+        self.assertEqual(p.comment_count, 0)
+        self.assertEqual(User.recount(), 0)
+
+    def test_timeline(self):
+        """ 测试时间线随文章和关注关系分发 """
+        u1 = User(email='john@example.com', password='cat')
+        u2 = User(email='susan@example.org', password='dog')
+        db.session.add_all([u1, u2])
+        db.session.commit()
+        p1 = Post(body='first', author=u2)
+        db.session.add(p1)
+        db.session.commit()
+        self.assertEqual(u2.timeline.all(), [p1])
+        self.assertEqual(u1.timeline.count(), 0)
+        # 关注后回填被关注者已有文章
+        u1.follow(u2)
+        db.session.commit()
+        p2 = Post(body='second', author=u2)
+        db.session.add(p2)
+        db.session.commit()
+        self.assertEqual(u1.timeline.all(), [p2, p1])
+        self.assertEqual(u1.timeline.all(), u1.followed_posts.order_by(
+            Post.timestamp.desc()).all())
+        # 取消关注后移除
+        u1.unfollow(u2)
+        db.session.commit()
+        self.assertEqual(u1.timeline.count(), 0)
+        self.assertEqual(u2.timeline.count(), 2)
+        # 重建结果与增量维护一致
+        self.assertEqual(TimelineEntry.rebuild(batch=1), 2)
+        self.assertEqual(u2.timeline.all(), [p2, p1])
+
+    def test_timeline_batched_fan_out(self):
+        """ 测试分批分发 """
+        users = [User(email='u%d@example.com' % i, password='cat')
+                 for i in range(5)]
+        db.session.add_all(users)
+        db.session.commit()
+        for u in users[1:]:
+            u.follow(users[0])
+        db.session.commit()
+        self.app.config['FLASKY_TIMELINE_FANOUT_BATCH'] = 2
+        self.app.config['FLASKY_TIMELINE_FANOUT_THRESHOLD'] = 100
+        p = Post(body='body', author=users[0])
+        db.session.add(p)
+        db.session.commit()
+        # 分发前已由backfill写入的行跳过, 不会主键冲突
+        entries = TimelineEntry.__table__
+        db.session.execute(entries.delete().where(
+            entries.c.user_id != users[2].id))
+        TimelineEntry.fan_out_batched(p.id)
+        for u in users:
+            self.assertEqual(u.timeline.all(), [p])
+
+    def test_add_self_follows(self):
+        """ 测试批量补全自关注: 计数和时间线同步, 重复执行无变化 """
+        users = [User(email='u%d@example.com' % i, password='cat')
+                 for i in range(5)]
+        db.session.add_all(users)
+        db.session.commit()
+        p = Post(body='body', author=users[0])
+        db.session.add(p)
+        db.session.commit()
+        for u in users[:3]:
+            db.session.delete(Follow.query.get((u.id, u.id)))
+        db.session.commit()
+        self.assertFalse(users[0].is_following(users[0]))
+        self.assertEqual(User.add_self_follows(batch=2), 3)
+        self.assertEqual(User.add_self_follows(batch=2), 0)
+        for u in users:
+            self.assertTrue(u.is_following(u))
+            self.assertEqual((u.follower_count, u.followed_count), (1, 1))
+        self.assertEqual(users[0].timeline.all(), [p])
+        self.assertEqual(User.recount(), 0)
+        Role.insert_roles()
+        self.assertEqual(Role.query.count(), 3)
+
+    def test_seed(self):
+        """ 测试批量生成数据: 计数一致, 相同种子结果相同 """
+        from app.seed import Seeder
+
+        def dataset():
+            return [(p.author_id, p.body, p.timestamp)
+                    for p in Post.query.order_by(Post.id)]
+        Seeder(users=20, follows=3, posts=50, comments=80, batch=16,
+               workers=1).run()
+        first = dataset()
+        self.assertEqual(len(first), 50)
+        self.assertEqual(Comment.query.count(), 80)
+        self.assertEqual(User.recount() + Post.recount(), 0)
+        u = User.query.first()
+        self.assertTrue(u.verify_password('password'))
+        self.assertTrue(u.is_following(u))
+        self.assertTrue(all(c.timestamp >= c.post.timestamp and c.body_html
+                            for c in Comment.query))
+        self.assertEqual(
+            TimelineEntry.query.count(),
+            db.session.query(Post.id).join(
+                Follow, Follow.followed_id == Post.author_id).count())
+        db.session.remove()
+        db.drop_all()
+        db.create_all()
+        Seeder(users=20, follows=3, posts=50, comments=80, batch=16,
+               workers=1).run()
+        self.assertEqual(dataset(), first)